@@ -0,0 +1,131 @@
+import heapq
+import os
+import time
+
+import cv2
+import numpy as np
+
+# Size of the gray thumbnail used to measure how much a face changed
+THUMBNAIL_SIZE = 16
+
+
+class AnalysisScheduler:
+    # Spends a fixed number of emotion/age analyses per second on the tracked faces that need
+    # them most. A token bucket refills at budget_per_second; each frame the faces are ranked
+    # in a priority queue and analyzed while tokens last. Faces never analyzed come first, then
+    # faces past max_staleness, then the rest by how long ago they were analyzed, how large they
+    # are and how much their appearance changed since. Faces that barely changed are not
+    # analyzed again until they reach max_staleness, since DeepFace runs on the frame thread.
+    # Results are kept per track.
+    def __init__(self, budget_per_second=None, max_staleness=None, size_weight=1.0, change_weight=1.0,
+                 min_change=0.1):
+        # A budget of 0 turns analysis off
+        if budget_per_second is None:
+            budget_per_second = float(os.environ.get("FACE_ANALYSIS_BUDGET", 1.0))
+        self.budget_per_second = budget_per_second
+        self.max_staleness = max_staleness or float(os.environ.get("FACE_ANALYSIS_MAX_STALENESS", 3.0))
+        self.size_weight = size_weight
+        self.change_weight = change_weight
+        self.min_change = min_change
+        self.capacity = max(1.0, self.budget_per_second) if self.budget_per_second > 0 else 0.0
+        self.tokens = self.capacity
+        self.last_refill = None
+
+        # Per track id: time of the last analysis, thumbnail at that time, and the result
+        self.analyzed_at = {}
+        self.thumbnails = {}
+        self.results = {}
+
+        # Metrics
+        self.analyses = 0
+        self.refreshes = 0
+        self.skipped = 0
+        self.staleness_total = 0.0
+        self.max_staleness_seen = 0.0
+        self.overdue = 0
+
+    def _thumbnail(self, gray, box):
+        x, y, w, h = box
+        roi = gray[y:y+h, x:x+w]
+        if roi.size == 0:
+            return None
+        return cv2.resize(roi, (THUMBNAIL_SIZE, THUMBNAIL_SIZE), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def change(self, track, thumbnail):
+        # How much the face changed since its last analysis, 0 to 1 (1 is a mean difference of
+        # 32 gray levels or more); 1 when there is nothing to compare
+        previous = self.thumbnails.get(track.id)
+        if previous is None or thumbnail is None:
+            return 1.0
+        return min(1.0, float(np.abs(thumbnail - previous).mean()) / 32.0)
+
+    def priority(self, track, thumbnail, frame_area, timestamp):
+        # A face covering 5% of the frame counts as fully large
+        x, y, w, h = track.box
+        score = self.size_weight * min(1.0, w * h / (0.05 * frame_area))
+        if track.id not in self.analyzed_at:
+            # New faces first, larger ones before smaller
+            return 100.0 + score
+        staleness = (timestamp - self.analyzed_at[track.id]) / self.max_staleness
+        # Overdue faces go before any fresh face, however large or changed
+        score += staleness + (10.0 if staleness >= 1.0 else 0.0)
+        return score + self.change_weight * self.change(track, thumbnail)
+
+    def select(self, tracks, gray, timestamp=None):
+        # Returns the tracks to analyze this frame, highest priority first. The caller analyzes
+        # them and passes each result to store().
+        if timestamp is None:
+            timestamp = time.monotonic()
+        if self.last_refill is not None:
+            self.tokens = min(self.capacity, self.tokens + (timestamp - self.last_refill) * self.budget_per_second)
+        self.last_refill = timestamp
+        if self.tokens < 1.0 or not tracks:
+            return []
+
+        frame_area = float(gray.shape[0] * gray.shape[1])
+        queue = []
+        thumbnails = {}
+        for track in tracks:
+            thumbnails[track.id] = self._thumbnail(gray, track.box)
+            heapq.heappush(queue, (-self.priority(track, thumbnails[track.id], frame_area, timestamp), track.id, track))
+
+        selected = []
+        while queue and self.tokens >= 1.0:
+            _, _, track = heapq.heappop(queue)
+            if track.id in self.analyzed_at:
+                staleness = timestamp - self.analyzed_at[track.id]
+                # Keep the result of a face that is still fresh and looks the same
+                if staleness < self.max_staleness and self.change(track, thumbnails[track.id]) < self.min_change:
+                    self.skipped += 1
+                    continue
+                self.refreshes += 1
+                self.staleness_total += staleness
+                self.max_staleness_seen = max(self.max_staleness_seen, staleness)
+                if staleness > self.max_staleness:
+                    self.overdue += 1
+            self.tokens -= 1.0
+            self.analyzed_at[track.id] = timestamp
+            self.thumbnails[track.id] = thumbnails[track.id]
+            self.analyses += 1
+            selected.append(track)
+        return selected
+
+    def store(self, track, result):
+        self.results[track.id] = result
+
+    def result(self, track):
+        # Latest analysis result of this face, or None
+        return self.results.get(track.id)
+
+    def forget(self, tracks):
+        # Drop the state of tracks that ended
+        for track in tracks:
+            self.analyzed_at.pop(track.id, None)
+            self.thumbnails.pop(track.id, None)
+            self.results.pop(track.id, None)
+
+    def summary(self):
+        return (f"Analysis scheduler: {self.analyses} analyses at {self.budget_per_second:.1f}/s, "
+                f"mean refresh {self.staleness_total / max(1, self.refreshes):.2f}s, max {self.max_staleness_seen:.2f}s, "
+                f"{self.overdue} past the {self.max_staleness:.1f}s limit, "
+                f"{self.skipped} skips of unchanged faces")
@@ -0,0 +1,354 @@
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from batch_analysis import (ACTIONS, AGE_SIZE, EMOTION_SIZE, DeepFaceAttributeModels, age_result,
+                            build_deepface_model, emotion_result, preprocess_face)
+from face_detectors import MODELS_DIR
+
+# Backends that can be selected with FACE_ATTRIBUTE_BACKEND
+ATTRIBUTE_BACKENDS = ['deepface', 'onnx', 'tflite']
+
+# DeepFace model names and input shapes (without the batch dimension) of each action
+ACTION_MODELS = {
+    'emotion': ("Emotion", (EMOTION_SIZE, EMOTION_SIZE, 1)),
+    'age': ("Age", (AGE_SIZE, AGE_SIZE, 3)),
+}
+
+
+def model_path(action, extension, quantized=True):
+    # e.g. models/emotion_int8.onnx, models/age.tflite
+    suffix = "_int8" if quantized else ""
+    return os.path.join(MODELS_DIR, f"{action}{suffix}.{extension}")
+
+
+def _find_model(action, extension):
+    # Prefer the int8 model, fall back to the float export
+    for quantized in (True, False):
+        path = model_path(action, extension, quantized)
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(f"No {extension} model for {action} in {MODELS_DIR}, run: "
+                            f"python attribute_backends.py export")
+
+
+def _default_threads():
+    # configure_threads() publishes the TensorFlow intra-op thread count, use it for these runtimes too
+    return int(os.environ.get("TF_NUM_INTRAOP_THREADS", 0)) or None
+
+
+class _BatchedAttributeModels:
+    # DeepFace.analyze-compatible analyze() for backends providing predict_emotion/predict_age
+    def _allocate_inputs(self):
+        self.emotion_input = np.empty((1, EMOTION_SIZE, EMOTION_SIZE, 1), dtype=np.float32)
+        self.age_input = np.empty((1, AGE_SIZE, AGE_SIZE, 3), dtype=np.float32)
+
+    def analyze(self, img_path, actions=ACTIONS, enforce_detection=False, **kwargs):
+        # img_path is a face crop (BGR array) or an image file, like DeepFace.analyze with
+        # detector_backend='skip'. Returns a one element list of DeepFace-style results.
+        image = cv2.imread(img_path) if isinstance(img_path, str) else img_path
+        if isinstance(actions, str):
+            actions = [actions]
+        unsupported = [a for a in actions if a not in self.actions]
+        if unsupported:
+            raise ValueError(f"Actions not loaded in this backend: {unsupported}")
+
+        h, w = image.shape[:2]
+        result = {'region': {'x': 0, 'y': 0, 'w': w, 'h': h}}
+        preprocess_face(image,
+                        self.emotion_input[0] if 'emotion' in actions else None,
+                        self.age_input[0] if 'age' in actions else None)
+        if 'emotion' in actions:
+            result.update(emotion_result(self.predict_emotion(self.emotion_input)[0]))
+        if 'age' in actions:
+            result.update(age_result(self.predict_age(self.age_input)[0]))
+        return [result]
+
+
+class DeepFaceBackend(DeepFaceAttributeModels):
+    # The reference path: DeepFace.analyze with full TensorFlow float32 models. Callers pass
+    # face crops from our own detector, already aligned, so DeepFace's detector and alignment
+    # are skipped unless asked for.
+    def analyze(self, img_path, actions=ACTIONS, enforce_detection=False, **kwargs):
+        from deepface import DeepFace
+
+        kwargs.setdefault('detector_backend', 'skip')
+        kwargs.setdefault('align', False)
+        return DeepFace.analyze(img_path, actions=actions, enforce_detection=enforce_detection, **kwargs)
+
+
+class ONNXAttributeBackend(_BatchedAttributeModels):
+    # Emotion and age models exported to ONNX (optionally int8 quantized), run with ONNX Runtime
+    def __init__(self, actions=ACTIONS, emotion_model=None, age_model=None, threads=None):
+        import onnxruntime as ort
+
+        self.actions = tuple(actions)
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads or _default_threads() or 0
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.sessions = {}
+        self.model_paths = {}
+        for action, path in (('emotion', emotion_model), ('age', age_model)):
+            if action in self.actions:
+                self.model_paths[action] = path or _find_model(action, "onnx")
+                self.sessions[action] = ort.InferenceSession(self.model_paths[action], options,
+                                                             providers=['CPUExecutionProvider'])
+        self._allocate_inputs()
+
+    def _run(self, action, batch):
+        session = self.sessions[action]
+        return session.run(None, {session.get_inputs()[0].name: batch})[0]
+
+    def predict_emotion(self, batch):
+        return self._run('emotion', batch)
+
+    def predict_age(self, batch):
+        return self._run('age', batch)
+
+
+class TFLiteAttributeBackend(_BatchedAttributeModels):
+    # Emotion and age models converted to TFLite, float or full int8 with quantized input/output
+    def __init__(self, actions=ACTIONS, emotion_model=None, age_model=None, threads=None):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+        self.actions = tuple(actions)
+        self.interpreters = {}
+        self.model_paths = {}
+        for action, path in (('emotion', emotion_model), ('age', age_model)):
+            if action in self.actions:
+                self.model_paths[action] = path or _find_model(action, "tflite")
+                interpreter = Interpreter(model_path=self.model_paths[action],
+                                          num_threads=threads or _default_threads())
+                interpreter.allocate_tensors()
+                self.interpreters[action] = interpreter
+        self._allocate_inputs()
+
+    def _run(self, action, batch):
+        interpreter = self.interpreters[action]
+        input_details = interpreter.get_input_details()[0]
+
+        # Resize the input when the batch size changes
+        if input_details['shape'][0] != len(batch):
+            interpreter.resize_tensor_input(input_details['index'], [len(batch)] + list(batch.shape[1:]))
+            interpreter.allocate_tensors()
+            input_details = interpreter.get_input_details()[0]
+
+        scale, zero_point = input_details['quantization']
+        if input_details['dtype'] != np.float32 and scale:
+            info = np.iinfo(input_details['dtype'])
+            batch = np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(input_details['dtype'])
+        interpreter.set_tensor(input_details['index'], batch)
+        interpreter.invoke()
+
+        output_details = interpreter.get_output_details()[0]
+        output = interpreter.get_tensor(output_details['index'])
+        scale, zero_point = output_details['quantization']
+        if output_details['dtype'] != np.float32 and scale:
+            output = (output.astype(np.float32) - zero_point) * scale
+        return np.array(output)
+
+    def predict_emotion(self, batch):
+        return self._run('emotion', batch)
+
+    def predict_age(self, batch):
+        return self._run('age', batch)
+
+
+def load_attribute_backend(backend=None, actions=ACTIONS):
+    # Backend can be chosen without code changes via FACE_ATTRIBUTE_BACKEND
+    backend = (backend or os.environ.get("FACE_ATTRIBUTE_BACKEND", "deepface")).lower()
+
+    if backend in ('onnx', 'tflite'):
+        backend_class = ONNXAttributeBackend if backend == 'onnx' else TFLiteAttributeBackend
+        try:
+            return backend_class(actions)
+        except (ImportError, FileNotFoundError) as e:
+            print(f"Error loading {backend} attribute backend: {e}")
+            print("Falling back to DeepFace.")
+    elif backend != 'deepface':
+        print(f"Unknown attribute backend '{backend}', using DeepFace.")
+
+    return DeepFaceBackend(actions)
+
+
+def load_calibration_faces(directory, limit=200):
+    # Face crops from a directory of images, for int8 calibration and comparisons
+    from face_detect_cli import _find_images
+    from face_detectors import load_face_detector
+    from face_identity import largest_face
+
+    face_detector = load_face_detector()
+    faces = []
+    for path in _find_images([directory], recursive=True):
+        image = cv2.imread(path)
+        face = largest_face(image, face_detector) if image is not None else None
+        if face is not None:
+            faces.append(face)
+        if len(faces) >= limit:
+            break
+    return faces
+
+
+def export_models(output_dir=MODELS_DIR, actions=ACTIONS, formats=('onnx', 'tflite'), calibration_faces=None):
+    # Exports the DeepFace Keras models. ONNX gets a float model plus a dynamically quantized
+    # int8 model; TFLite gets full int8 with calibration faces, dynamic range quantization without.
+    import tensorflow as tf
+
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    for action in actions:
+        name, input_shape = ACTION_MODELS[action]
+        model = build_deepface_model(name)
+
+        if 'onnx' in formats:
+            import tf2onnx
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            float_path = os.path.join(output_dir, f"{action}.onnx")
+            int8_path = os.path.join(output_dir, f"{action}_int8.onnx")
+            signature = (tf.TensorSpec((None,) + input_shape, tf.float32, name="input"),)
+            tf2onnx.convert.from_keras(model, input_signature=signature, opset=13, output_path=float_path)
+            quantize_dynamic(float_path, int8_path, weight_type=QuantType.QInt8)
+            written += [float_path, int8_path]
+
+        if 'tflite' in formats:
+            converter = tf.lite.TFLiteConverter.from_keras_model(model)
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            if calibration_faces:
+                def representative_dataset():
+                    sample = {'emotion': np.empty((1, EMOTION_SIZE, EMOTION_SIZE, 1), dtype=np.float32),
+                              'age': np.empty((1, AGE_SIZE, AGE_SIZE, 3), dtype=np.float32)}
+                    for face in calibration_faces:
+                        preprocess_face(face,
+                                        sample['emotion'][0] if action == 'emotion' else None,
+                                        sample['age'][0] if action == 'age' else None)
+                        yield [sample[action]]
+
+                converter.representative_dataset = representative_dataset
+                converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+                converter.inference_input_type = tf.int8
+                converter.inference_output_type = tf.int8
+            path = os.path.join(output_dir, f"{action}_int8.tflite")
+            with open(path, 'wb') as f:
+                f.write(converter.convert())
+            written.append(path)
+    return written
+
+
+def compare_backends(reference, candidates, faces, actions=ACTIONS, batch_size=32):
+    # Accuracy delta of each candidate against the reference backend on the same face crops,
+    # with single-face latency and batched throughput. Returns {name: metrics}.
+    from batch_analysis import BatchAnalyzer
+
+    def run_single(backend):
+        results, timings = [], []
+        for face in faces:
+            start = time.perf_counter()
+            # DeepFace would otherwise run its own face detection on the crop
+            results.append(backend.analyze(face, actions=list(actions), detector_backend='skip')[0])
+            timings.append(time.perf_counter() - start)
+        return results, np.array(timings) * 1000.0
+
+    def run_batched(backend):
+        if not hasattr(backend, 'predict_emotion'):
+            return 0.0
+        analyzer = BatchAnalyzer(backend, batch_size)
+        start = time.perf_counter()
+        for face in faces:
+            analyzer.add(face)
+            if analyzer.full():
+                analyzer.flush()
+        analyzer.flush()
+        elapsed = time.perf_counter() - start
+        return len(faces) / elapsed if elapsed else 0.0
+
+    reference_results, reference_ms = run_single(reference)
+    report = {'reference': {'mean_ms': reference_ms.mean(), 'p95_ms': np.percentile(reference_ms, 95),
+                            'faces_per_s': run_batched(reference)}}
+
+    for name, backend in candidates.items():
+        results, timings = run_single(backend)
+        metrics = {'mean_ms': timings.mean(), 'p95_ms': np.percentile(timings, 95),
+                   'faces_per_s': run_batched(backend)}
+        if 'emotion' in actions:
+            metrics['emotion_agreement'] = np.mean([
+                r['dominant_emotion'] == ref['dominant_emotion'] for r, ref in zip(results, reference_results)])
+            metrics['emotion_score_delta'] = np.mean([
+                np.mean([abs(r['emotion'][k] - ref['emotion'][k]) for k in ref['emotion']])
+                for r, ref in zip(results, reference_results)])
+        if 'age' in actions:
+            metrics['age_mae'] = np.mean([abs(r['age'] - ref['age']) for r, ref in zip(results, reference_results)])
+        report[name] = metrics
+    return report
+
+
+def main(argv=None):
+    import argparse
+
+    from concurrency import configure_threads
+
+    parser = argparse.ArgumentParser(description="Export and compare emotion/age attribute backends")
+    parser.add_argument("command", choices=['export', 'compare'])
+    parser.add_argument("faces", nargs='?', help="Directory of face images for calibration (export) or comparison")
+    parser.add_argument("--formats", nargs='+', default=['onnx', 'tflite'], choices=['onnx', 'tflite'],
+                        help="Formats to export")
+    parser.add_argument("--backends", nargs='+', default=['onnx', 'tflite'], choices=['onnx', 'tflite'],
+                        help="Backends to compare against DeepFace")
+    parser.add_argument("--actions", nargs='+', default=list(ACTIONS), choices=ACTIONS, help="Attributes")
+    parser.add_argument("--limit", type=int, default=200, help="Maximum number of faces to use")
+    parser.add_argument("--output", default=MODELS_DIR, help="Export directory")
+    args = parser.parse_args(argv)
+
+    # Configure OpenCV/TensorFlow threads and CPU affinity
+    configure_threads()
+
+    faces = load_calibration_faces(args.faces, args.limit) if args.faces else []
+
+    if args.command == 'export':
+        for path in export_models(args.output, args.actions, args.formats, faces):
+            print(f"Wrote {path}")
+        return 0
+
+    if not faces:
+        print("Error: compare needs a directory of images with faces")
+        return 1
+
+    from soak_test import current_rss_mb
+
+    # Memory is measured as each backend is loaded, candidates first so TensorFlow is not counted for them
+    rss_start = current_rss_mb()
+    candidates = {}
+    memory = {}
+    for name in args.backends:
+        before = current_rss_mb()
+        candidates[name] = (ONNXAttributeBackend if name == 'onnx' else TFLiteAttributeBackend)(args.actions)
+        memory[name] = current_rss_mb() - before
+    before = current_rss_mb()
+    reference = DeepFaceBackend(args.actions)
+    memory['reference'] = current_rss_mb() - before
+
+    report = compare_backends(reference, candidates, faces, args.actions)
+    print(f"{len(faces)} faces, process RSS {rss_start:.0f} -> {current_rss_mb():.0f} MB")
+    for name, metrics in report.items():
+        line = (f"{name:10s} {metrics['mean_ms']:7.2f} ms/face (p95 {metrics['p95_ms']:.2f}), "
+                f"{metrics['faces_per_s']:7.1f} faces/s batched, +{memory[name]:.0f} MB")
+        if 'emotion_agreement' in metrics:
+            line += (f", emotion agreement {metrics['emotion_agreement'] * 100:.1f}% "
+                     f"(score delta {metrics['emotion_score_delta']:.2f})")
+        if 'age_mae' in metrics:
+            line += f", age MAE {metrics['age_mae']:.2f}"
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+import json
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import cv2
+import numpy as np
+
+from image_loading import load_crops, load_gray, scale_boxes
+
+# Output order of the DeepFace emotion model
+EMOTION_LABELS = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
+
+# Input sizes of the DeepFace attribute models
+EMOTION_SIZE = 48
+AGE_SIZE = 224
+
+ACTIONS = ('emotion', 'age')
+
+
+def build_deepface_model(name):
+    # The Keras model behind a DeepFace attribute client ("Emotion" or "Age")
+    try:
+        from deepface.modules import modeling
+        client = modeling.build_model(task="facial_attribute", model_name=name)
+    except (ImportError, TypeError):
+        # Older DeepFace releases
+        from deepface import DeepFace
+        client = DeepFace.build_model(name)
+    return client.model
+
+
+class DeepFaceAttributeModels:
+    # Runs the DeepFace emotion and age networks directly on preprocessed batches, with the
+    # preprocessing DeepFace.analyze applies to a single face
+    def __init__(self, actions=ACTIONS):
+        self.actions = tuple(actions)
+        self.emotion_model = build_deepface_model("Emotion") if 'emotion' in self.actions else None
+        self.age_model = build_deepface_model("Age") if 'age' in self.actions else None
+
+    def predict_emotion(self, batch):
+        # batch: (N, 48, 48, 1) float32 gray in [0, 1] -> (N, 7) probabilities
+        return np.asarray(self.emotion_model.predict_on_batch(batch))
+
+    def predict_age(self, batch):
+        # batch: (N, 224, 224, 3) float32 BGR in [0, 1] -> (N, 101) age probabilities
+        return np.asarray(self.age_model.predict_on_batch(batch))
+
+
+def preprocess_face(face_img, emotion_out=None, age_out=None):
+    # Writes the model inputs for a BGR uint8 face crop into the given float32 arrays:
+    # emotion_out (48, 48, 1) gray in [0, 1], age_out (224, 224, 3) BGR in [0, 1]
+    if age_out is not None:
+        resized = cv2.resize(face_img, (AGE_SIZE, AGE_SIZE))
+        np.multiply(resized, 1.0 / 255.0, out=age_out, casting='unsafe')
+    if emotion_out is not None:
+        gray = cv2.cvtColor(face_img, cv2.COLOR_BGR2GRAY)
+        resized = cv2.resize(gray, (EMOTION_SIZE, EMOTION_SIZE))
+        np.multiply(resized, 1.0 / 255.0, out=emotion_out[:, :, 0], casting='unsafe')
+
+
+def emotion_result(probabilities):
+    scores = {label: float(p) * 100.0 for label, p in zip(EMOTION_LABELS, probabilities)}
+    return {'emotion': scores, 'dominant_emotion': EMOTION_LABELS[int(np.argmax(probabilities))]}
+
+
+def age_result(probabilities):
+    # Apparent age is the expectation over the 0..100 output classes
+    return {'age': int(round(float(np.dot(probabilities, np.arange(len(probabilities))))))}
+
+
+class BatchAnalyzer:
+    # Collects face crops into preallocated input tensors and runs each attribute network
+    # once per batch instead of once per face. Results come back in the order faces were added.
+    def __init__(self, models, batch_size=64):
+        self.models = models
+        self.actions = models.actions
+        self.batch_size = batch_size
+        self.emotion_batch = np.empty((batch_size, EMOTION_SIZE, EMOTION_SIZE, 1), dtype=np.float32)
+        self.age_batch = np.empty((batch_size, AGE_SIZE, AGE_SIZE, 3), dtype=np.float32)
+        self.count = 0
+
+        # Metrics
+        self.faces = 0
+        self.batches = 0
+        self.inference_time = 0.0
+
+    def full(self):
+        return self.count >= self.batch_size
+
+    def add(self, face_img):
+        # face_img: BGR uint8 face crop
+        i = self.count
+        preprocess_face(face_img,
+                        self.emotion_batch[i] if 'emotion' in self.actions else None,
+                        self.age_batch[i] if 'age' in self.actions else None)
+        self.count += 1
+
+    def flush(self):
+        # Returns one result dict per face added since the last flush
+        n = self.count
+        if n == 0:
+            return []
+
+        start = time.perf_counter()
+        results = [{} for _ in range(n)]
+        if 'emotion' in self.actions:
+            for result, probabilities in zip(results, self.models.predict_emotion(self.emotion_batch[:n])):
+                result.update(emotion_result(probabilities))
+        if 'age' in self.actions:
+            for result, probabilities in zip(results, self.models.predict_age(self.age_batch[:n])):
+                result.update(age_result(probabilities))
+        self.inference_time += time.perf_counter() - start
+
+        self.faces += n
+        self.batches += 1
+        self.count = 0
+        return results
+
+
+def _load_and_detect(path, face_detector_factory, local, crop_size=AGE_SIZE, decode_size=None):
+    # Runs in a worker thread: detect faces with a per-thread detector on a reduced-size gray
+    # decode, then decode again only as large as the face crops need for the models
+    if not hasattr(local, 'face_detector'):
+        local.face_detector = face_detector_factory()
+    gray, scale = load_gray(path, decode_size)
+    if gray is None:
+        return path, None, []
+    faces = local.face_detector.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+    faces = scale_boxes(faces, scale)
+    # Copies, so the decoded image is freed as soon as this returns. Faces that could not be
+    # cropped (the second decode failed or the box clipped to nothing) get None.
+    crops = {i: crop.copy() for i, crop in enumerate(load_crops(path, faces, crop_size)) if crop.size}
+    return path, [crops.get(i) for i in range(len(faces))], faces
+
+
+def analyze_images(paths, analyzer, face_detector_factory, workers=4, decode_size=None):
+    # Yields (path, faces) in input order, faces being a list of dicts with the box and
+    # attributes, or None if the image could not be read. Faces without a usable crop only
+    # have the box. Images are decoded and detected in worker threads while the analyzer
+    # fills batches across image boundaries.
+    local = threading.local()
+    # The largest model input decides how much resolution the crops need
+    crop_size = AGE_SIZE if 'age' in analyzer.actions else EMOTION_SIZE
+    pending = []  # [path, faces, remaining crops] waiting for their batch
+    owners = []   # (pending entry, face index) for each crop in the current batch
+
+    def flush():
+        for (entry, face_index), result in zip(owners, analyzer.flush()):
+            entry[1][face_index].update(result)
+            entry[2] -= 1
+        owners.clear()
+        while pending and pending[0][2] == 0:
+            entry = pending.pop(0)
+            yield entry[0], entry[1]
+
+    def load(path):
+        return _load_and_detect(path, face_detector_factory, local, crop_size, decode_size)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Only a bounded window of images is decoded ahead of the analyzer
+        paths = iter(paths)
+        futures = deque(executor.submit(load, path) for path in islice(paths, 2 * workers))
+        while futures:
+            path, crops, faces = futures.popleft().result()
+            for next_path in islice(paths, 1):
+                futures.append(executor.submit(load, next_path))
+
+            if crops is None:
+                pending.append([path, None, 0])
+            else:
+                entry = [path, [{'box': list(face)} for face in faces], sum(1 for crop in crops if crop is not None)]
+                pending.append(entry)
+                for i, crop in enumerate(crops):
+                    if crop is None:
+                        continue
+                    analyzer.add(crop)
+                    owners.append((entry, i))
+                    if analyzer.full():
+                        yield from flush()
+
+            # Completed images at the front are written without waiting for the next batch
+            while pending and pending[0][2] == 0:
+                entry = pending.pop(0)
+                yield entry[0], entry[1]
+
+    yield from flush()
+
+
+def run_analysis(args):
+    # Shared by this script and "face-detect analyze"
+    from attribute_backends import load_attribute_backend
+    from face_detect_cli import _find_images
+    from face_detectors import load_face_detector
+
+    print("Loading attribute models...", file=sys.stderr)
+    analyzer = BatchAnalyzer(load_attribute_backend(args.attribute_backend, args.actions), args.batch_size)
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+    images = failed = 0
+    start = time.perf_counter()
+    try:
+        for path, faces in analyze_images(_find_images(args.paths, args.recursive), analyzer,
+                                          lambda: load_face_detector(args.backend), args.workers,
+                                          args.decode_size):
+            if faces is None:
+                print(f"Error: Could not open image file: {path}", file=sys.stderr)
+                failed += 1
+                continue
+            images += 1
+            out.write(json.dumps({'path': path, 'faces': faces}) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Analyzed {analyzer.faces} faces in {images} images ({failed} failed) in {elapsed:.2f}s, "
+          f"{analyzer.faces / elapsed if elapsed else 0:.1f} faces/s, {analyzer.batches} batches, "
+          f"{analyzer.inference_time:.2f}s in the models", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    import argparse
+
+    from concurrency import configure_threads
+
+    parser = argparse.ArgumentParser(description="Batched emotion and age analysis of image directories")
+    parser.add_argument("paths", nargs='+', help="Image files or directories")
+    parser.add_argument("-o", "--output", help="JSON lines output file (default: stdout)")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Search directories recursively")
+    parser.add_argument("--actions", nargs='+', default=list(ACTIONS), choices=ACTIONS, help="Attributes to analyze")
+    parser.add_argument("--batch-size", type=int, default=64, help="Faces per model forward pass")
+    parser.add_argument("--workers", type=int, default=4, help="Threads decoding images and detecting faces")
+    parser.add_argument("--backend", choices=['haar', 'yunet', 'ssd', 'lbp+haar', 'lbp+yunet', 'lbp+ssd'],
+                        help="Face detector backend")
+    parser.add_argument("--decode-size", type=int,
+                        help="Long side images are decoded at for detection, 0 for full size "
+                             "(default: FACE_DETECT_DECODE_SIZE or 1280)")
+    parser.add_argument("--attribute-backend", choices=['deepface', 'onnx', 'tflite'],
+                        help="Emotion/age model runtime (default: FACE_ATTRIBUTE_BACKEND or deepface)")
+    args = parser.parse_args(argv)
+
+    # Configure OpenCV/TensorFlow threads and CPU affinity
+    configure_threads()
+
+    return run_analysis(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
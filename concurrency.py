@@ -0,0 +1,204 @@
+import multiprocessing
+import os
+import sys
+import time
+
+# Environment variables used to configure threading for every entry point:
+#   FACE_DETECT_CV_THREADS        OpenCV worker threads (cv2.setNumThreads)
+#   FACE_DETECT_TF_INTRA_THREADS  TensorFlow intra-op threads used by DeepFace
+#   FACE_DETECT_TF_INTER_THREADS  TensorFlow inter-op threads used by DeepFace
+#   FACE_DETECT_CPU_AFFINITY      CPUs this process may run on, e.g. "0-3,8"
+#   FACE_DETECT_WORKER            "index/count" to give this process its share of the CPUs,
+#                                 e.g. "0/2" and "1/2" for two copies of a GUI
+
+
+def parse_cpu_list(text):
+    cpus = []
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-')
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return sorted(set(cpus))
+
+
+def available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def set_cpu_affinity(cpus):
+    # Pinning is only supported where the OS exposes it; elsewhere psutil is used if installed
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+        return True
+    try:
+        import psutil
+        psutil.Process().cpu_affinity(list(cpus))
+        return True
+    except (ImportError, AttributeError, OSError):
+        return False
+
+
+def worker_cpus(index, count, cpus=None):
+    # Split the CPUs into contiguous, non-overlapping chunks, one per worker
+    cpus = cpus if cpus is not None else available_cpus()
+    count = max(1, min(count, len(cpus)))
+    chunk = len(cpus) // count
+    extra = len(cpus) % count
+    start = index % count * chunk + min(index % count, extra)
+    size = chunk + (1 if index % count < extra else 0)
+    return cpus[start:start + size]
+
+
+def _env_int(name):
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+def configure_threads(cv_threads=None, tf_intra_threads=None, tf_inter_threads=None, cpus=None):
+    # Explicit arguments win over environment variables
+    if cpus is None and os.environ.get("FACE_DETECT_CPU_AFFINITY"):
+        cpus = parse_cpu_list(os.environ["FACE_DETECT_CPU_AFFINITY"])
+
+    worker = os.environ.get("FACE_DETECT_WORKER")
+    if worker:
+        index, count = (int(v) for v in worker.split('/'))
+        cpus = worker_cpus(index, count, cpus)
+
+    if cpus:
+        if not set_cpu_affinity(cpus):
+            print("Warning: CPU affinity is not supported on this platform")
+        num_cpus = len(cpus)
+    else:
+        num_cpus = len(available_cpus())
+
+    # cv_threads=0 is valid: OpenCV then runs without its thread pool
+    if cv_threads is None:
+        cv_threads = _env_int("FACE_DETECT_CV_THREADS")
+    if cv_threads is None:
+        cv_threads = num_cpus
+    tf_intra_threads = tf_intra_threads or _env_int("FACE_DETECT_TF_INTRA_THREADS") or num_cpus
+    tf_inter_threads = tf_inter_threads or _env_int("FACE_DETECT_TF_INTER_THREADS") or 1
+
+    # OpenMP/BLAS pools and TensorFlow read these when they start up
+    os.environ.setdefault("OMP_NUM_THREADS", str(tf_intra_threads))
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(tf_intra_threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = str(tf_inter_threads)
+
+    # If TensorFlow is already imported (e.g. via deepface) configure it directly,
+    # this only works before the first model is run
+    if 'tensorflow' in sys.modules:
+        tf = sys.modules['tensorflow']
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(tf_intra_threads)
+            tf.config.threading.set_inter_op_parallelism_threads(tf_inter_threads)
+        except (RuntimeError, AttributeError) as e:
+            print(f"Warning: Could not configure TensorFlow threads: {e}")
+
+    import cv2
+    cv2.setNumThreads(cv_threads)
+
+    return {
+        'cpus': cpus or available_cpus(),
+        'cv_threads': cv_threads,
+        'tf_intra_threads': tf_intra_threads,
+        'tf_inter_threads': tf_inter_threads,
+    }
+
+
+def init_pool_worker(counter, num_workers):
+    # ProcessPoolExecutor / multiprocessing.Pool initializer that pins each worker to its own CPUs:
+    #   counter = multiprocessing.Value('i', 0)
+    #   Pool(n, initializer=init_pool_worker, initargs=(counter, n))
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+
+    cpus = worker_cpus(index, num_workers)
+    return configure_threads(cv_threads=len(cpus), tf_intra_threads=len(cpus), tf_inter_threads=1, cpus=cpus)
+
+
+def _benchmark_worker(args):
+    index, num_workers, threads, frames, duration = args
+    import cv2
+    from face_detectors import load_face_detector
+
+    cpus = worker_cpus(index, num_workers)
+    configure_threads(cv_threads=threads, tf_intra_threads=threads, tf_inter_threads=1, cpus=cpus)
+    face_detector = load_face_detector()
+
+    processed = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        frame = frames[processed % len(frames)]
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        face_detector.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+        processed += 1
+
+    return processed / (time.perf_counter() - start)
+
+
+def benchmark_splits(frames, duration=5.0, cpus=None):
+    # Try every way of dividing the CPUs into worker processes x OpenCV threads and
+    # report the aggregate detection throughput of each split
+    num_cpus = len(cpus or available_cpus())
+    results = []
+
+    for num_workers in range(1, num_cpus + 1):
+        if num_cpus % num_workers:
+            continue
+        threads = num_cpus // num_workers
+        jobs = [(i, num_workers, threads, frames, duration) for i in range(num_workers)]
+        with multiprocessing.Pool(num_workers) as pool:
+            fps = pool.map(_benchmark_worker, jobs)
+        results.append({'workers': num_workers, 'threads': threads, 'fps': sum(fps)})
+        print(f"{num_workers:3d} workers x {threads:3d} threads: {sum(fps):8.1f} frames/s")
+
+    best = max(results, key=lambda r: r['fps'])
+    return best, results
+
+
+def _load_benchmark_frames(video_path, count=50):
+    import cv2
+    import numpy as np
+
+    frames = []
+    if video_path:
+        cap = cv2.VideoCapture(video_path)
+        while len(frames) < count:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+
+    if not frames:
+        # Synthetic 640x480 frames when no video is available
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 256, (480, 640, 3), dtype=np.uint8) for _ in range(count)]
+
+    return frames
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Find the best worker/thread split for this machine")
+    parser.add_argument("--benchmark", action="store_true", help="Run the thread split benchmark")
+    parser.add_argument("--video", help="Video file to take benchmark frames from")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Duration of each benchmark run")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        best, _ = benchmark_splits(_load_benchmark_frames(args.video), args.seconds)
+        print(f"Best split: {best['workers']} workers x {best['threads']} threads "
+              f"({best['fps']:.1f} frames/s)")
+        print(f"Use FACE_DETECT_WORKER=i/{best['workers']} and FACE_DETECT_CV_THREADS={best['threads']}")
+    else:
+        print(configure_threads())
@@ -0,0 +1,97 @@
+import os
+
+# Degradation steps, applied in this order as load increases
+SKIP_EYES = 'skip_eyes'
+SKIP_SMILE = 'skip_smile'
+LOW_RESOLUTION = 'low_resolution'
+COARSE_SCALE = 'coarse_scale'
+DEFAULT_STEPS = [SKIP_EYES, SKIP_SMILE, LOW_RESOLUTION, COARSE_SCALE]
+
+
+class DegradationLadder:
+    # Per-frame deadline with an ordered list of degradation steps. Frame times are smoothed
+    # with an exponential moving average; the ladder moves one step down after degrade_after
+    # frames over budget and one step back up only after recover_after frames comfortably
+    # under it (below recover_fraction of the budget), so it does not oscillate. After a step
+    # down the average restarts, so one slow spike does not run down the whole ladder.
+    def __init__(self, budget_ms=None, steps=None, degrade_after=3, recover_after=30,
+                 recover_fraction=0.6, smoothing=0.2):
+        self.budget_ms = budget_ms or float(os.environ.get("FACE_DETECT_FRAME_BUDGET_MS", 30.0))
+        self.steps = list(steps or DEFAULT_STEPS)
+        self.degrade_after = degrade_after
+        self.recover_after = recover_after
+        self.recover_fraction = recover_fraction
+        self.smoothing = smoothing
+
+        self.level = 0
+        self.average_ms = None
+        self.over_frames = 0
+        self.under_frames = 0
+
+        # Metrics
+        self.frames = 0
+        self.frames_over_budget = 0
+        self.frames_at_level = [0] * (len(self.steps) + 1)
+        self.degrades = 0
+        self.recoveries = 0
+
+    def active(self, step):
+        # True when this step is switched on at the current level
+        return self.steps.index(step) < self.level
+
+    def level_name(self):
+        return "full quality" if self.level == 0 else self.steps[self.level - 1]
+
+    def update(self, frame_ms):
+        # Call once per frame with the processing time; returns the level for the next frame
+        self.frames += 1
+        self.frames_at_level[self.level] += 1
+        if frame_ms > self.budget_ms:
+            self.frames_over_budget += 1
+
+        if self.average_ms is None:
+            self.average_ms = frame_ms
+        else:
+            self.average_ms += self.smoothing * (frame_ms - self.average_ms)
+
+        if self.average_ms > self.budget_ms:
+            self.over_frames += 1
+            self.under_frames = 0
+        elif self.average_ms < self.budget_ms * self.recover_fraction:
+            self.under_frames += 1
+            self.over_frames = 0
+        else:
+            self.over_frames = 0
+            self.under_frames = 0
+
+        if self.over_frames >= self.degrade_after and self.level < len(self.steps):
+            self.level += 1
+            self.degrades += 1
+            self.over_frames = 0
+            # Judge the new level on its own frame times
+            self.average_ms = None
+        elif self.under_frames >= self.recover_after and self.level > 0:
+            self.level -= 1
+            self.recoveries += 1
+            self.under_frames = 0
+        return self.level
+
+    def stats(self):
+        return {
+            'level': self.level,
+            'level_name': self.level_name(),
+            'average_ms': self.average_ms or 0.0,
+            'budget_ms': self.budget_ms,
+            'frames': self.frames,
+            'frames_over_budget': self.frames_over_budget,
+            'frames_at_level': list(self.frames_at_level),
+            'degrades': self.degrades,
+            'recoveries': self.recoveries,
+        }
+
+    def summary(self):
+        stats = self.stats()
+        levels = ", ".join(f"{i}: {n}" for i, n in enumerate(stats['frames_at_level']))
+        return (f"Degradation: {stats['frames']} frames, {stats['frames_over_budget']} over "
+                f"{stats['budget_ms']:.0f} ms budget, {stats['degrades']} steps down, "
+                f"{stats['recoveries']} recoveries, frames per level ({levels})")
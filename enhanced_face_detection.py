@@ -2,10 +2,24 @@ import cv2
 import numpy as np
 import os
 import time
+from face_detectors import load_face_detector
+from concurrency import configure_threads
+from frame_buffers import FrameBufferPool
+from motion_gate import MotionGate, detect_with_gate
+from profiling import FrameProfiler
+from video_sources import open_video_source
+from expression_classifier import load_expression_classifier
+from presence_events import PresenceMonitor
 
 def main():
+    # Configure OpenCV/TensorFlow threads and CPU affinity
+    configure_threads()
+    
+    # Optional --profile capture window
+    profiler = FrameProfiler.from_command_line()
+    
     # Initialize webcam
-    cap = cv2.VideoCapture(0)
+    cap = open_video_source()
     
     # Check if webcam is opened correctly
     if not cap.isOpened():
@@ -14,17 +28,10 @@ def main():
     
     # Load face detection model
     print("Loading face detection models...")
-    face_detector = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-    
-    # Load smile detection
-    smile_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_smile.xml')
+    face_detector = load_face_detector()
     
-    # Load eye detection
-    eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
-    
-    # Additional cascades for more expression detection
-    lefteye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_lefteye_2splits.xml')
-    righteye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_righteye_2splits.xml')
+    # Load expression classifier (smile and eye state for all faces at once)
+    expression_classifier = load_expression_classifier()
     
     print("Enhanced Face Detection App Started. Press 'q' to quit.")
     
@@ -45,61 +52,67 @@ def main():
         else:
             return "Senior (50+)"
     
+    # Reusable per-stage frame buffers
+    buffer_pool = FrameBufferPool()
+    
+    # Skip detection on frames where nothing moved
+    motion_gate = MotionGate()
+    faces = None
+    face_results = {}
+    
+    # Face entered/left/count events when FACE_DETECT_EVENTS is set
+    presence = PresenceMonitor.from_env()
+    
     while True:
         # Capture frame-by-frame
-        ret, frame = cap.read()
+        ret, frame = buffer_pool.read(cap)
         
         if not ret:
             print("Error: Failed to capture image")
             break
         
         # Make a copy for drawing
-        display_frame = frame.copy()
+        display_frame = buffer_pool.copy(frame)
         
         # Convert to grayscale for cascade classifiers
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        gray = buffer_pool.gray(frame)
         
-        # Detect faces using cascade classifier
-        faces = face_detector.detectMultiScale(
+        # Detect faces using cascade classifier, only where the frame changed
+        faces, gate_decision = detect_with_gate(
+            motion_gate,
+            face_detector,
             gray,
+            faces,
             scaleFactor=1.1,
             minNeighbors=5,
             minSize=(30, 30)
         )
         
+        # Report debounced presence changes
+        if presence:
+            presence.update(faces)
+        
+        # Forget results for faces that are gone, unchanged faces keep theirs
+        face_results = {face: face_results[face] for face in faces if face in face_results}
+        
+        # Classify expressions of new or moved faces in one batch
+        new_faces = [face for face in faces if face not in face_results]
+        for face, result in zip(new_faces, expression_classifier.classify(gray, new_faces)):
+            face_results[face] = result
+        
         # Process each face
         for (x, y, w, h) in faces:
             # Draw rectangle around face
             cv2.rectangle(display_frame, (x, y), (x+w, y+h), (255, 0, 0), 2)
             
-            # Get face region
-            face_roi = frame[y:y+h, x:x+w]
-            face_roi_gray = gray[y:y+h, x:x+w]
-            
-            # Detect smiles
-            smiles = smile_cascade.detectMultiScale(face_roi_gray, scaleFactor=1.7, minNeighbors=20)
-            
-            # Detect eyes
-            eyes = eye_cascade.detectMultiScale(face_roi_gray)
-            left_eyes = lefteye_cascade.detectMultiScale(face_roi_gray)
-            right_eyes = righteye_cascade.detectMultiScale(face_roi_gray)
+            result = face_results[(x, y, w, h)]
+            eyes = result['eyes']
+            expression = f"{result['expression']} ({result['confidence']:.2f})"
             
             # Draw rectangles around eyes
             for (ex, ey, ew, eh) in eyes:
                 cv2.rectangle(display_frame[y:y+h, x:x+w], (ex, ey), (ex+ew, ey+eh), (0, 255, 0), 2)
             
-            # Determine expression
-            expression = "Neutral"
-            if len(smiles) > 0:
-                expression = "Smiling"
-            
-            # Check if eyes are detected
-            if len(eyes) > 0 or len(left_eyes) > 0 or len(right_eyes) > 0:
-                if len(eyes) == 0:
-                    expression = "Winking"
-            else:
-                expression = "Eyes Closed"
-            
             # Estimate age based on face size
             age_text = estimate_age(w, h)
             
@@ -113,13 +126,30 @@ def main():
         cv2.putText(display_frame, f"Faces detected: {len(faces)}", (10, 30), 
                     cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
         
+        # Display motion gate decision and hit rate
+        cv2.putText(display_frame, f"Detection: {gate_decision} ({motion_gate.hit_rate() * 100:.0f}% gated)", (10, 60), 
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
+        
         # Display the resulting frame
         cv2.imshow('Enhanced Face Detection', display_frame)
         
+        # Advance the profiling window
+        profiler.tick()
+        
         # Break the loop when 'q' is pressed
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
     
+    # Write and summarize profiles if --profile was given
+    profiler.finish()
+    
+    # Report frame buffer allocations and motion gate hit rate
+    print(buffer_pool.summary())
+    print(motion_gate.summary())
+    if presence:
+        presence.close()
+        print(presence.summary())
+    
     # Release resources
     cap.release()
     cv2.destroyAllWindows()
@@ -1,11 +1,18 @@
 import cv2
 import tkinter as tk
 from tkinter import ttk, messagebox
-from PIL import Image, ImageTk
 import numpy as np
 import os
 import threading
 import time
+from face_detectors import load_face_detector
+from concurrency import configure_threads
+from frame_buffers import FrameBufferPool
+from profiling import FrameProfiler
+from video_sources import open_video_source
+from expression_classifier import load_expression_classifier
+from degradation import COARSE_SCALE, LOW_RESOLUTION, SKIP_EYES, SKIP_SMILE, DegradationLadder
+from presence_events import PresenceMonitor
 
 # Age ranges
 AGE_RANGES = ['0-2', '4-6', '8-12', '15-20', '25-32', '38-43', '48-53', '60+']
@@ -49,9 +56,13 @@ class EnhancedFaceDetectionApp:
         self.faces_var = tk.StringVar(value="0")
         ttk.Label(self.results_frame, textvariable=self.faces_var, font=("Arial", 12, "bold")).grid(row=2, column=1, sticky=tk.W, pady=2)
         
+        ttk.Label(self.results_frame, text="Quality Level:").grid(row=3, column=0, sticky=tk.W, pady=2)
+        self.quality_var = tk.StringVar(value="0")
+        ttk.Label(self.results_frame, textvariable=self.quality_var, font=("Arial", 12, "bold")).grid(row=3, column=1, sticky=tk.W, pady=2)
+        
         # Detection settings
         settings_frame = ttk.LabelFrame(self.results_frame, text="Detection Settings", padding="10")
-        settings_frame.grid(row=3, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=10)
+        settings_frame.grid(row=4, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=10)
         
         # Scale factor
         ttk.Label(settings_frame, text="Scale Factor:").grid(row=0, column=0, sticky=tk.W, pady=2)
@@ -90,12 +101,21 @@ class EnhancedFaceDetectionApp:
         self.is_running = False
         self.thread = None
         
+        # Reusable per-stage frame buffers
+        self.buffer_pool = FrameBufferPool()
+        
+        # Optional --profile capture window
+        self.profiler = FrameProfiler.from_command_line()
+        
         # Face detection variables
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        self.eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
-        self.smile_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_smile.xml')
-        self.lefteye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_lefteye_2splits.xml')
-        self.righteye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_righteye_2splits.xml')
+        self.face_cascade = load_face_detector()
+        self.expression_classifier = load_expression_classifier()
+        
+        # Per-frame deadline, degrades expression and detection quality under load
+        self.degradation = DegradationLadder()
+        
+        # Face entered/left/count events when FACE_DETECT_EVENTS is set, opened per run
+        self.presence = None
         
     def estimate_age(self, face_width, face_height):
         face_size = (face_width + face_height) / 2
@@ -118,7 +138,7 @@ class EnhancedFaceDetectionApp:
             return
             
         # Initialize video capture
-        self.cap = cv2.VideoCapture(0)
+        self.cap = open_video_source()
         if not self.cap.isOpened():
             messagebox.showerror("Error", "Could not open webcam")
             return
@@ -128,6 +148,9 @@ class EnhancedFaceDetectionApp:
         self.stop_button.config(state=tk.NORMAL)
         self.status_var.set("Running")
         
+        # Open the event sink for this run
+        self.presence = PresenceMonitor.from_env()
+        
         # Start video thread
         self.is_running = True
         self.thread = threading.Thread(target=self.video_loop)
@@ -150,10 +173,20 @@ class EnhancedFaceDetectionApp:
         self.status_var.set("Stopped")
         self.video_label.config(image="")
         
+        # Report frame buffer allocations and time spent degraded
+        print(self.buffer_pool.summary())
+        print(self.degradation.summary())
+        
+        # Close the event sink, flushing file and TCP sinks
+        presence, self.presence = self.presence, None
+        if presence:
+            presence.close()
+            print(presence.summary())
+        
     def video_loop(self):
         try:
             while self.is_running:
-                ret, frame = self.cap.read()
+                ret, frame = self.buffer_pool.read(self.cap)
                 if not ret:
                     self.status_var.set("Error: Failed to capture image")
                     break
@@ -161,77 +194,98 @@ class EnhancedFaceDetectionApp:
                 # Process the frame
                 processed_frame = self.process_frame(frame)
                 
-                # Convert to PhotoImage
-                cv2image = cv2.cvtColor(processed_frame, cv2.COLOR_BGR2RGB)
-                img = Image.fromarray(cv2image)
-                imgtk = ImageTk.PhotoImage(image=img)
+                # Display the frame
+                self.show_frame(processed_frame)
                 
-                # Update the video label
-                self.video_label.imgtk = imgtk
-                self.video_label.config(image=imgtk)
+                # Advance the profiling window
+                self.profiler.tick()
                 
                 # Process at 30 fps
                 time.sleep(0.033)
         except Exception as e:
             self.status_var.set(f"Error: {str(e)}")
         finally:
+            # Write and summarize profiles if --profile was given
+            self.profiler.finish()
             if self.is_running:
                 self.stop_video()
     
+    def show_frame(self, processed_frame):
+        # Convert to PhotoImage, reusing the RGB, PIL and PhotoImage buffers
+        cv2image = self.buffer_pool.rgb(processed_frame)
+        img = self.buffer_pool.pil_image(cv2image)
+        imgtk = self.buffer_pool.photo_image(img)
+        
+        # Update the video label
+        self.video_label.imgtk = imgtk
+        self.video_label.config(image=imgtk)
+    
     def process_frame(self, frame):
+        # Frame processing time drives the degradation ladder
+        start_time = time.perf_counter()
+        
         # Make a copy for drawing
-        display_frame = frame.copy()
+        display_frame = self.buffer_pool.copy(frame)
         
         # Convert to grayscale for cascade classifiers
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        gray = self.buffer_pool.gray(frame)
         
         # Get current detection settings
         scale_factor = self.scale_factor_var.get()
         min_neighbors = self.min_neighbors_var.get()
         
-        # Detect faces using cascade classifier
-        faces = self.face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=scale_factor,
-            minNeighbors=min_neighbors,
-            minSize=(30, 30)
-        )
+        # Coarser scale steps when the frame budget is exceeded
+        if self.degradation.active(COARSE_SCALE):
+            scale_factor = max(scale_factor, 1.3)
+        
+        # Detect faces using cascade classifier, at half resolution when degraded
+        if self.degradation.active(LOW_RESOLUTION):
+            height, width = gray.shape
+            small_gray = self.buffer_pool.resize(gray, (width // 2, height // 2), name='small_gray')
+            faces = self.face_cascade.detectMultiScale(
+                small_gray,
+                scaleFactor=scale_factor,
+                minNeighbors=min_neighbors,
+                minSize=(15, 15)
+            )
+            faces = [(2 * x, 2 * y, 2 * w, 2 * h) for (x, y, w, h) in faces]
+        else:
+            faces = self.face_cascade.detectMultiScale(
+                gray,
+                scaleFactor=scale_factor,
+                minNeighbors=min_neighbors,
+                minSize=(30, 30)
+            )
         
         # Update faces count
         self.faces_var.set(str(len(faces)))
         
+        # Report debounced presence changes
+        if self.presence:
+            self.presence.update(faces)
+        
+        # Classify expressions of all faces in one batch, skipping passes when degraded
+        skip_eyes = self.degradation.active(SKIP_EYES)
+        skip_smile = self.degradation.active(SKIP_SMILE)
+        if skip_eyes and skip_smile:
+            results = [None] * len(faces)
+        else:
+            results = self.expression_classifier.classify(gray, faces, eyes=not skip_eyes, smile=not skip_smile)
+        
         # Process each face
-        for (x, y, w, h) in faces:
+        for (x, y, w, h), result in zip(faces, results):
             # Draw rectangle around face
             cv2.rectangle(display_frame, (x, y), (x+w, y+h), (255, 0, 0), 2)
             
-            # Get face region
-            face_roi = frame[y:y+h, x:x+w]
-            face_roi_gray = gray[y:y+h, x:x+w]
-            
-            # Detect smiles
-            smiles = self.smile_cascade.detectMultiScale(face_roi_gray, scaleFactor=1.7, minNeighbors=20)
-            
-            # Detect eyes
-            eyes = self.eye_cascade.detectMultiScale(face_roi_gray)
-            left_eyes = self.lefteye_cascade.detectMultiScale(face_roi_gray)
-            right_eyes = self.righteye_cascade.detectMultiScale(face_roi_gray)
-            
-            # Draw rectangles around eyes
-            for (ex, ey, ew, eh) in eyes:
-                cv2.rectangle(display_frame[y:y+h, x:x+w], (ex, ey), (ex+ew, ey+eh), (0, 255, 0), 2)
-            
-            # Determine expression
-            expression = "Neutral"
-            if len(smiles) > 0:
-                expression = "Smiling"
-            
-            # Check if eyes are detected
-            if len(eyes) > 0 or len(left_eyes) > 0 or len(right_eyes) > 0:
-                if len(eyes) == 0:
-                    expression = "Winking"
+            if result is None:
+                expression = "Unknown"
             else:
-                expression = "Eyes Closed"
+                # Draw rectangles around eyes
+                for (ex, ey, ew, eh) in result['eyes']:
+                    cv2.rectangle(display_frame[y:y+h, x:x+w], (ex, ey), (ex+ew, ey+eh), (0, 255, 0), 2)
+                
+                # Expression with its confidence
+                expression = f"{result['expression']} ({result['confidence']:.2f})"
             
             # Update expression in UI
             self.expression_var.set(expression)
@@ -252,6 +306,14 @@ class EnhancedFaceDetectionApp:
         cv2.putText(display_frame, f"Faces detected: {len(faces)}", (10, 30), 
                     cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
         
+        # Display degradation level and smoothed frame time
+        frame_ms = (time.perf_counter() - start_time) * 1000.0
+        self.degradation.update(frame_ms)
+        quality = f"{self.degradation.level}/{len(self.degradation.steps)} ({self.degradation.level_name()})"
+        self.quality_var.set(f"{quality}, {self.degradation.stats()['average_ms']:.0f} ms")
+        cv2.putText(display_frame, f"Quality: {quality}", (10, 60), 
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
+        
         return display_frame
     
     def on_close(self):
@@ -259,6 +321,9 @@ class EnhancedFaceDetectionApp:
         self.window.destroy()
 
 def main():
+    # Configure OpenCV/TensorFlow threads and CPU affinity
+    configure_threads()
+    
     # Create the main window
     root = tk.Tk()
     app = EnhancedFaceDetectionApp(root)
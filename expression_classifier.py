@@ -0,0 +1,277 @@
+import cv2
+import numpy as np
+import os
+
+from face_detectors import MODELS_DIR
+
+# Optional 68-point LBF landmark model for the cv2.face Facemark API (opencv-contrib-python)
+LBF_MODEL = os.path.join(MODELS_DIR, "lbfmodel.yaml")
+
+# Expression labels, same as the original per-face cascade rules
+NEUTRAL = "Neutral"
+SMILING = "Smiling"
+WINKING = "Winking"
+EYES_CLOSED = "Eyes Closed"
+
+
+def _probability(evidence, threshold):
+    # Maps a non-negative score to 0..1 so that reaching the threshold gives exactly 0.5
+    return evidence / (evidence + threshold) if evidence > 0 else 0.0
+
+
+def _logistic(value, threshold, scale):
+    return 1.0 / (1.0 + np.exp(-(value - threshold) / scale))
+
+
+def _label(p_smile, p_left, p_right):
+    # Eye state overrides the smile, like the original rules, but a wink needs exactly one open eye
+    p_open = max(p_left, p_right)
+    if p_left < 0.5 and p_right < 0.5:
+        return EYES_CLOSED, 1.0 - p_open
+    if (p_left >= 0.5) != (p_right >= 0.5):
+        return WINKING, min(p_open, 1.0 - min(p_left, p_right))
+    if p_smile >= 0.5:
+        return SMILING, p_smile
+    return NEUTRAL, 1.0 - p_smile
+
+
+class ExpressionClassifier:
+    # Classifies all faces of a frame at once from normalized face crops.
+    # The crops are resized to crop_size and laid side by side in two strips, the eye band
+    # and the mouth band, so each cascade runs once per frame over a small fixed-size image
+    # instead of four multi-scale scans per face. Detections are assigned back to faces by
+    # their position in the strip and scored by their neighbor count.
+    def __init__(self, crop_size=96, smile_neighbors=20, eye_neighbors=3):
+        self.crop_size = crop_size
+        self.smile_neighbors = smile_neighbors
+        self.eye_neighbors = eye_neighbors
+        self.gap = 8
+
+        self.eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
+        self.smile_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_smile.xml')
+
+        # Bands of the normalized crop, as fractions of its height
+        self.eye_band = (int(0.15 * crop_size), int(0.55 * crop_size))
+        self.mouth_band = (int(0.55 * crop_size), crop_size)
+
+        self.crop = np.empty((crop_size, crop_size), dtype=np.uint8)
+        self.eye_strip = None
+        self.mouth_strip = None
+
+    def _strips(self, count):
+        # Reused strips, only reallocated when the number of faces grows
+        width = count * (self.crop_size + self.gap)
+        if self.eye_strip is None or self.eye_strip.shape[1] < width:
+            self.eye_strip = np.zeros((self.eye_band[1] - self.eye_band[0], width), dtype=np.uint8)
+            self.mouth_strip = np.zeros((self.mouth_band[1] - self.mouth_band[0], width), dtype=np.uint8)
+        return self.eye_strip[:, :width], self.mouth_strip[:, :width]
+
+    def _assign(self, boxes, counts, num_faces):
+        # Groups strip detections by face, dropping any that straddle two crops
+        stride = self.crop_size + self.gap
+        per_face = [[] for _ in range(num_faces)]
+        for (x, y, w, h), n in zip(boxes, counts):
+            index = int(x // stride)
+            if index < num_faces and x + w <= index * stride + self.crop_size:
+                per_face[index].append((x - index * stride, y, w, h, n))
+        return per_face
+
+    def classify(self, gray, faces, eyes=True, smile=True):
+        # Returns one dict per face: expression, confidence, eyes (boxes in face coordinates)
+        # and the smile/left eye/right eye probabilities. eyes=False or smile=False skip that
+        # pass; skipped eyes count as open and a skipped smile as neutral.
+        faces = [tuple(int(v) for v in face) for face in faces]
+        if not faces:
+            return []
+
+        size = self.crop_size
+        eye_strip, mouth_strip = self._strips(len(faces))
+        for i, (x, y, w, h) in enumerate(faces):
+            cv2.resize(gray[y:y+h, x:x+w], (size, size), dst=self.crop, interpolation=cv2.INTER_AREA)
+            cv2.equalizeHist(self.crop, dst=self.crop)
+            left = i * (size + self.gap)
+            eye_strip[:, left:left+size] = self.crop[self.eye_band[0]:self.eye_band[1]]
+            mouth_strip[:, left:left+size] = self.crop[self.mouth_band[0]:self.mouth_band[1]]
+
+        # One pass per cascade over all faces; minNeighbors=1 keeps the neighbor counts as scores
+        face_eyes = face_smiles = [[] for _ in faces]
+        if eyes:
+            found, counts = self.eye_cascade.detectMultiScale2(
+                eye_strip, scaleFactor=1.05, minNeighbors=1,
+                minSize=(size // 10, size // 10), maxSize=(size // 3, size // 3))
+            face_eyes = self._assign(found, counts, len(faces))
+        if smile:
+            found, counts = self.smile_cascade.detectMultiScale2(
+                mouth_strip, scaleFactor=1.15, minNeighbors=1,
+                minSize=(size // 4, size // 8), maxSize=(size * 3 // 4, size // 3))
+            face_smiles = self._assign(found, counts, len(faces))
+
+        results = []
+        for (x, y, w, h), eye_hits, smile_hits in zip(faces, face_eyes, face_smiles):
+            # Eyes on each half of the face; the image left half holds the subject's right eye
+            left_score = max([n for (ex, _, ew, _, n) in eye_hits if ex + ew / 2 >= size / 2] or [0])
+            right_score = max([n for (ex, _, ew, _, n) in eye_hits if ex + ew / 2 < size / 2] or [0])
+            p_left = _probability(left_score, self.eye_neighbors) if eyes else 1.0
+            p_right = _probability(right_score, self.eye_neighbors) if eyes else 1.0
+            p_smile = _probability(max([n for (*_, n) in smile_hits] or [0]), self.smile_neighbors)
+
+            expression, confidence = _label(p_smile, p_left, p_right)
+
+            # Accepted eye boxes scaled back to face coordinates for drawing
+            scale_x, scale_y = w / float(size), h / float(size)
+            eye_boxes = [(int(ex * scale_x), int((ey + self.eye_band[0]) * scale_y),
+                          int(ew * scale_x), int(eh * scale_y))
+                         for (ex, ey, ew, eh, n) in eye_hits if n >= self.eye_neighbors]
+
+            results.append({
+                'expression': expression,
+                'confidence': float(confidence),
+                'eyes': eye_boxes,
+                'smile': float(p_smile),
+                'left_eye': float(p_left),
+                'right_eye': float(p_right),
+            })
+        return results
+
+
+class LandmarkExpressionClassifier:
+    # Classifies expressions from 68-point facial landmarks fitted for all faces in one call.
+    # Eye openness is the eye aspect ratio, the smile is mouth width relative to eye distance.
+    def __init__(self, model_path=None, ear_threshold=0.2, smile_threshold=0.6):
+        if not hasattr(cv2, 'face'):
+            raise ImportError("cv2.face is not available, install opencv-contrib-python")
+        self.model_path = model_path or LBF_MODEL
+        if not os.path.exists(self.model_path):
+            raise FileNotFoundError(f"Facemark LBF model not found: {self.model_path}")
+
+        self.facemark = cv2.face.createFacemarkLBF()
+        self.facemark.loadModel(self.model_path)
+        self.ear_threshold = ear_threshold
+        self.smile_threshold = smile_threshold
+
+    @staticmethod
+    def _eye_aspect_ratio(points):
+        # points: the 6 landmarks of one eye, corner to corner
+        vertical = np.linalg.norm(points[1] - points[5]) + np.linalg.norm(points[2] - points[4])
+        horizontal = np.linalg.norm(points[0] - points[3])
+        return vertical / (2.0 * horizontal) if horizontal > 0 else 0.0
+
+    def classify(self, gray, faces, eyes=True, smile=True):
+        # All landmarks come from one fit, so eyes/smile are accepted for compatibility only
+        faces = [tuple(int(v) for v in face) for face in faces]
+        if not faces:
+            return []
+
+        ok, landmarks = self.facemark.fit(gray, np.array(faces, dtype=np.int32))
+        if not ok:
+            return [{'expression': NEUTRAL, 'confidence': 0.0, 'eyes': [], 'smile': 0.0,
+                     'left_eye': 0.0, 'right_eye': 0.0} for _ in faces]
+
+        results = []
+        for (x, y, w, h), points in zip(faces, landmarks):
+            points = points.reshape(-1, 2)
+            right_eye, left_eye = points[36:42], points[42:48]
+
+            p_right = float(_logistic(self._eye_aspect_ratio(right_eye), self.ear_threshold, 0.03))
+            p_left = float(_logistic(self._eye_aspect_ratio(left_eye), self.ear_threshold, 0.03))
+
+            eye_distance = np.linalg.norm(points[45] - points[36])
+            mouth_ratio = np.linalg.norm(points[54] - points[48]) / eye_distance if eye_distance > 0 else 0.0
+            p_smile = float(_logistic(mouth_ratio, self.smile_threshold, 0.03))
+
+            expression, confidence = _label(p_smile, p_left, p_right)
+
+            eye_boxes = []
+            for eye in (right_eye, left_eye):
+                ex, ey, ew, eh = cv2.boundingRect(eye.astype(np.int32))
+                pad = max(ew, eh) // 3
+                eye_boxes.append((ex - x - pad, ey - y - pad, ew + 2 * pad, eh + 2 * pad))
+
+            results.append({
+                'expression': expression,
+                'confidence': float(confidence),
+                'eyes': eye_boxes,
+                'smile': p_smile,
+                'left_eye': p_left,
+                'right_eye': p_right,
+            })
+        return results
+
+
+def load_expression_classifier(kind=None, **kwargs):
+    # FACE_EXPRESSION_BACKEND=landmarks uses the LBF landmark model when it is installed
+    kind = (kind or os.environ.get("FACE_EXPRESSION_BACKEND", "cascade")).lower()
+
+    if kind == 'landmarks':
+        try:
+            return LandmarkExpressionClassifier(**kwargs)
+        except (ImportError, FileNotFoundError, cv2.error) as e:
+            print(f"Error loading landmark expression classifier: {e}")
+            print("Falling back to cascade expression classifier.")
+        kwargs = {}
+    elif kind != 'cascade':
+        print(f"Unknown expression classifier '{kind}', using cascades.")
+
+    return ExpressionClassifier(**kwargs)
+
+
+def _legacy_classify(cascades, gray, faces):
+    # The original four cascade scans per face, kept for benchmarking
+    smile_cascade, eye_cascade, lefteye_cascade, righteye_cascade = cascades
+    labels = []
+    for (x, y, w, h) in faces:
+        face_roi_gray = gray[y:y+h, x:x+w]
+        smiles = smile_cascade.detectMultiScale(face_roi_gray, scaleFactor=1.7, minNeighbors=20)
+        eyes = eye_cascade.detectMultiScale(face_roi_gray)
+        left_eyes = lefteye_cascade.detectMultiScale(face_roi_gray)
+        right_eyes = righteye_cascade.detectMultiScale(face_roi_gray)
+        labels.append((smiles, eyes, left_eyes, right_eyes))
+    return labels
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from face_detectors import load_face_detector
+
+    parser = argparse.ArgumentParser(description="Compare the expression classifier with per-face cascade scans")
+    parser.add_argument("images", nargs='+', help="Images with faces")
+    parser.add_argument("--backend", choices=['cascade', 'landmarks'], help="Expression classifier")
+    parser.add_argument("--repeat", type=int, default=20, help="Timing repetitions per image")
+    args = parser.parse_args()
+
+    face_detector = load_face_detector()
+    classifier = load_expression_classifier(args.backend)
+    cascades = [cv2.CascadeClassifier(cv2.data.haarcascades + name) for name in (
+        'haarcascade_smile.xml', 'haarcascade_eye.xml',
+        'haarcascade_lefteye_2splits.xml', 'haarcascade_righteye_2splits.xml')]
+
+    new_time = old_time = 0.0
+    total_faces = 0
+    for path in args.images:
+        image = cv2.imread(path)
+        if image is None:
+            print(f"Error: Could not open image file: {path}")
+            continue
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        faces = face_detector.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+        total_faces += len(faces)
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            results = classifier.classify(gray, faces)
+        new_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            _legacy_classify(cascades, gray, faces)
+        old_time += time.perf_counter() - start
+
+        for face, result in zip(faces, results):
+            print(f"{path} {tuple(int(v) for v in face)}: {result['expression']} ({result['confidence']:.2f})")
+
+    if total_faces:
+        runs = total_faces * args.repeat
+        print(f"Per face: classifier {new_time / runs * 1000:.2f} ms, "
+              f"four cascade scans {old_time / runs * 1000:.2f} ms")
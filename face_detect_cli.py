@@ -0,0 +1,455 @@
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+
+from profiling import FrameProfiler, add_profile_arguments
+
+# Heavy modules (cv2, numpy, tkinter, PIL, mediapipe, deepface) are only imported inside
+# the subcommand that needs them, so e.g. "face-detect batch --backend haar" starts quickly.
+
+# Live applications: (app, gui) -> module with a main() function
+LIVE_APPS = {
+    ('simple', False): 'simple_face_detection',
+    ('simple', True): 'simple_face_detection_gui',
+    ('enhanced', False): 'enhanced_face_detection',
+    ('enhanced', True): 'enhanced_face_detection_gui',
+    ('deepface', False): 'face_detection_app',
+    ('deepface', True): 'face_detection_gui',
+    ('opencv', False): 'face_detection_opencv_py313',
+    ('opencv', True): 'face_detection_gui_opencv_py313',
+    ('mediapipe', False): 'face_detection_app_py313',
+    ('mediapipe', True): 'face_detection_gui_py313',
+}
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# Face detection parameters shared by batch, video, bench and serve
+DETECTION_PARAMS = {'scaleFactor': 1.1, 'minNeighbors': 5, 'minSize': (30, 30)}
+
+
+def _load_detector(args):
+    from face_detectors import load_face_detector
+
+    face_detector = load_face_detector(args.backend)
+    if getattr(args, 'proposals', None):
+        from region_proposals import ProposalDetector, RegionProposer
+        face_detector = ProposalDetector(face_detector, RegionProposer(args.proposals))
+    return face_detector
+
+
+def _detect(face_detector, image):
+    import cv2
+
+    # Proposal detectors look at the color frame and convert it themselves
+    if getattr(face_detector, 'accepts_color', False) or image.ndim == 2:
+        gray = image
+    else:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    faces = face_detector.detectMultiScale(gray, **DETECTION_PARAMS)
+    return [[int(v) for v in face] for face in faces]
+
+
+def _draw_faces(image, faces):
+    import cv2
+
+    for (x, y, w, h) in faces:
+        cv2.rectangle(image, (x, y), (x+w, y+h), (255, 0, 0), 2)
+    cv2.putText(image, f"Faces detected: {len(faces)}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+
+
+def _find_images(paths, recursive):
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        if recursive:
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield os.path.join(root, name)
+        else:
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(path, name)
+
+
+def cmd_live(args):
+    if args.backend:
+        os.environ["FACE_DETECTOR_BACKEND"] = args.backend
+    if args.source:
+        os.environ["FACE_DETECT_SOURCE"] = args.source
+    if args.replay_fps:
+        os.environ["FACE_DETECT_REPLAY_FPS"] = str(args.replay_fps)
+    if args.fast:
+        os.environ["FACE_DETECT_REPLAY_MODE"] = "fast"
+    if args.loop:
+        os.environ["FACE_DETECT_REPLAY_LOOP"] = "1"
+    if args.timestamps:
+        os.environ["FACE_DETECT_REPLAY_TIMESTAMPS"] = args.timestamps
+    if args.events:
+        os.environ["FACE_DETECT_EVENTS"] = args.events
+    if args.event_window is not None:
+        os.environ["FACE_DETECT_EVENT_WINDOW"] = str(args.event_window)
+    module = importlib.import_module(LIVE_APPS[(args.app, args.gui)])
+    module.main()
+    return 0
+
+
+def cmd_batch(args):
+    from face_detectors import describe_face_detector
+    from image_loading import default_decode_size, load_gray, scale_boxes
+
+    face_detector = _load_detector(args)
+    detector_info = describe_face_detector(face_detector)
+    # Detection runs on a reduced-size decode, so the decode size is part of the cached result
+    decode_size = default_decode_size() if args.decode_size is None else args.decode_size
+    params = dict(DETECTION_PARAMS, decode_size=decode_size)
+
+    cache = None
+    if not args.no_cache:
+        from result_cache import ResultCache
+        cache = ResultCache(args.cache)
+
+    profiler = FrameProfiler.from_args(args, name="batch")
+    out = open(args.output, 'w') if args.output else sys.stdout
+    processed = cached = failed = 0
+    start = time.perf_counter()
+
+    try:
+        for path in _find_images(args.paths, args.recursive):
+            faces = cache.get(path, detector_info, params) if cache else None
+            if faces is not None:
+                cached += 1
+            else:
+                gray, scale = load_gray(path, decode_size)
+                if gray is None:
+                    print(f"Error: Could not open image file: {path}", file=sys.stderr)
+                    failed += 1
+                    continue
+                faces = [list(face) for face in scale_boxes(_detect(face_detector, gray), scale)]
+                if cache:
+                    cache.put(path, detector_info, params, faces)
+            processed += 1
+            out.write(json.dumps({'path': path, 'faces': faces}) + "\n")
+            profiler.tick()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if cache:
+            cache.close()
+        profiler.finish()
+
+    elapsed = time.perf_counter() - start
+    print(f"Processed {processed} images ({cached} cached, {failed} failed) in {elapsed:.2f}s",
+          file=sys.stderr)
+    return 1 if failed else 0
+
+
+def cmd_analyze(args):
+    from batch_analysis import run_analysis
+
+    return run_analysis(args)
+
+
+def cmd_video(args):
+    import cv2
+    from video_sources import ReplaySource
+
+    face_detector = _load_detector(args)
+    cap = ReplaySource(args.input, realtime=False)
+    if not cap.isOpened():
+        print(f"Error: Could not open video: {args.input}", file=sys.stderr)
+        return 1
+
+    writer = None
+    if args.output:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30
+        size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        writer = cv2.VideoWriter(args.output, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+
+    profiler = FrameProfiler.from_args(args, name="video")
+    out = open(args.json, 'w') if args.json else None
+    anonymizer = None
+    if args.anonymize:
+        from anonymize import Anonymizer
+        anonymizer = Anonymizer(args.anonymize)
+    presence = None
+    if args.events:
+        from presence_events import PresenceMonitor, open_event_sink
+        presence = PresenceMonitor(open_event_sink(args.events), args.event_window)
+    frame_index = 0
+    start = time.perf_counter()
+
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        faces = _detect(face_detector, frame)
+        if out:
+            out.write(json.dumps({'frame': frame_index, 'faces': faces}) + "\n")
+        if presence:
+            # Event times are the position in the video
+            presence.update(faces, cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0)
+        if writer:
+            if anonymizer:
+                # Privacy-safe output: faces are obscured instead of outlined
+                anonymizer.apply(frame, faces, cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0)
+            else:
+                _draw_faces(frame, faces)
+            writer.write(frame)
+        frame_index += 1
+        profiler.tick()
+
+    elapsed = time.perf_counter() - start
+    cap.release()
+    if writer:
+        writer.release()
+    if out:
+        out.close()
+    if presence:
+        presence.close()
+        print(presence.summary(), file=sys.stderr)
+    if hasattr(face_detector, 'summary'):
+        print(face_detector.summary(), file=sys.stderr)
+    if anonymizer:
+        print(anonymizer.summary(), file=sys.stderr)
+    profiler.finish()
+
+    print(f"Processed {frame_index} frames in {elapsed:.2f}s "
+          f"({frame_index / elapsed if elapsed else 0:.1f} fps)", file=sys.stderr)
+    return 0
+
+
+def cmd_bench(args):
+    import cv2
+    import numpy as np
+
+    if args.threads:
+        from concurrency import benchmark_splits, _load_benchmark_frames
+        benchmark_splits(_load_benchmark_frames(args.video, args.frames), args.seconds)
+        return 0
+
+    frames = []
+    if args.video:
+        cap = cv2.VideoCapture(args.video)
+        while len(frames) < args.frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+    if not frames:
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 256, (480, 640, 3), dtype=np.uint8) for _ in range(args.frames)]
+
+    face_detector = _load_detector(args)
+    _detect(face_detector, frames[0])  # warm up
+
+    profiler = FrameProfiler.from_args(args, name="bench")
+    timings = []
+    total_faces = 0
+    detections = []
+    for frame in frames:
+        start = time.perf_counter()
+        faces = _detect(face_detector, frame)
+        timings.append(time.perf_counter() - start)
+        total_faces += len(faces)
+        detections.append(faces)
+        profiler.tick()
+    profiler.finish()
+
+    timings = np.array(timings) * 1000.0
+    print(f"Backend: {args.backend or os.environ.get('FACE_DETECTOR_BACKEND', 'haar')}")
+    print(f"Frames: {len(frames)}  Faces: {total_faces}")
+    if hasattr(face_detector, 'summary'):
+        print(face_detector.summary())
+    print(f"Mean: {timings.mean():.2f} ms  Median: {np.median(timings):.2f} ms  "
+          f"P95: {np.percentile(timings, 95):.2f} ms  FPS: {1000.0 / timings.mean():.1f}")
+
+    if args.reference:
+        # Recall and speed relative to another backend on the same frames
+        from face_detectors import load_face_detector
+        from tiled_detection import _recall
+
+        reference_detector = load_face_detector(args.reference)
+        _detect(reference_detector, frames[0])  # warm up
+        start = time.perf_counter()
+        reference = [_detect(reference_detector, frame) for frame in frames]
+        reference_ms = (time.perf_counter() - start) * 1000.0 / len(frames)
+        matched = sum(_recall(ref, found) * len(ref) for ref, found in zip(reference, detections))
+        total = sum(len(ref) for ref in reference)
+        print(f"Reference {args.reference}: {total} faces, mean {reference_ms:.2f} ms, "
+              f"recall {matched / total * 100 if total else 100.0:.1f}%, "
+              f"{reference_ms / timings.mean():.1f}x faster")
+    return 0
+
+
+def cmd_serve(args):
+    import threading
+    from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+
+    import cv2
+    import numpy as np
+
+    # Cascade classifiers are not thread safe, so each request thread gets its own detector
+    local = threading.local()
+
+    def get_detector():
+        if not hasattr(local, 'face_detector'):
+            local.face_detector = _load_detector(args)
+        return local.face_detector
+
+    class DetectionHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._send_json(200, {'status': 'ok'})
+            else:
+                self._send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            # POST /detect with the encoded image (JPEG/PNG) as the request body
+            if self.path != '/detect':
+                self._send_json(404, {'error': 'not found'})
+                return
+            length = int(self.headers.get('Content-Length', 0))
+            data = np.frombuffer(self.rfile.read(length), dtype=np.uint8)
+            image = cv2.imdecode(data, cv2.IMREAD_COLOR) if length else None
+            if image is None:
+                self._send_json(400, {'error': 'could not decode image'})
+                return
+            self._send_json(200, {'faces': _detect(get_detector(), image)})
+            profiler.tick()
+
+    # cProfile only sees the thread it runs in, so requests are handled serially while profiling
+    profiler = FrameProfiler.from_args(args, name="serve")
+    server_class = HTTPServer if args.profile else ThreadingHTTPServer
+    server = server_class((args.host, args.port), DetectionHandler)
+    print(f"Serving face detection on http://{args.host}:{args.port}/detect")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        profiler.finish()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="face-detect", description="Face detection tools")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    def add_backend(sub):
+        sub.add_argument("--backend", choices=['haar', 'yunet', 'ssd', 'lbp+haar', 'lbp+yunet', 'lbp+ssd'],
+                         help="Face detector backend (default: FACE_DETECTOR_BACKEND or haar)")
+        add_profile_arguments(sub)
+
+    def add_proposal_arguments(sub):
+        sub.add_argument("--proposals", choices=['skin', 'foreground', 'lbp'],
+                         help="Only scan candidate regions found from skin tone, motion or an LBP pass")
+
+    def add_event_arguments(sub):
+        sub.add_argument("--events", help="Write face entered/left/count events to a file, \"-\" for stdout, "
+                                          "or udp://host:port or tcp://host:port (live: enhanced app only)")
+        sub.add_argument("--event-window", type=float,
+                         help="Seconds a face must be seen or missing before an event (default: 0.5)")
+
+    live = subparsers.add_parser("live", help="Run live webcam detection")
+    live.add_argument("--app", default="enhanced", choices=sorted({app for app, _ in LIVE_APPS}),
+                      help="Which application to run")
+    live.add_argument("--gui", action="store_true", help="Use the Tk GUI instead of an OpenCV window")
+    live.add_argument("--source", help="Camera index, video file, stream URL or GStreamer pipeline "
+                                       "(default: FACE_DETECT_SOURCE or 0)")
+    replay = live.add_argument_group("replay", "Options for a video file or image sequence --source")
+    replay.add_argument("--replay-fps", type=float, help="Frame rate to replay at (default: the file's rate or 30)")
+    replay.add_argument("--fast", action="store_true", help="Serve frames as fast as they are read")
+    replay.add_argument("--loop", action="store_true", help="Restart at the end of the file")
+    replay.add_argument("--timestamps", help="File with one recorded frame timestamp in seconds per line")
+    add_event_arguments(live)
+    add_backend(live)
+    live.set_defaults(func=cmd_live)
+
+    batch = subparsers.add_parser("batch", help="Detect faces in image files and directories")
+    batch.add_argument("paths", nargs='+', help="Image files or directories")
+    batch.add_argument("-o", "--output", help="JSON lines output file (default: stdout)")
+    batch.add_argument("-r", "--recursive", action="store_true", help="Search directories recursively")
+    batch.add_argument("--cache", help="Result cache file (default: FACE_DETECT_CACHE or ~/.face_detection_cache.sqlite)")
+    batch.add_argument("--no-cache", action="store_true", help="Do not use the result cache")
+    batch.add_argument("--decode-size", type=int,
+                       help="Long side images are decoded at for detection, 0 for full size "
+                            "(default: FACE_DETECT_DECODE_SIZE or 1280)")
+    add_backend(batch)
+    batch.set_defaults(func=cmd_batch)
+
+    analyze = subparsers.add_parser("analyze", help="Batched emotion and age analysis of image files and directories")
+    analyze.add_argument("paths", nargs='+', help="Image files or directories")
+    analyze.add_argument("-o", "--output", help="JSON lines output file (default: stdout)")
+    analyze.add_argument("-r", "--recursive", action="store_true", help="Search directories recursively")
+    analyze.add_argument("--actions", nargs='+', default=['emotion', 'age'], choices=['emotion', 'age'],
+                         help="Attributes to analyze")
+    analyze.add_argument("--batch-size", type=int, default=64, help="Faces per model forward pass")
+    analyze.add_argument("--workers", type=int, default=4, help="Threads decoding images and detecting faces")
+    analyze.add_argument("--attribute-backend", choices=['deepface', 'onnx', 'tflite'],
+                         help="Emotion/age model runtime (default: FACE_ATTRIBUTE_BACKEND or deepface)")
+    analyze.add_argument("--decode-size", type=int,
+                         help="Long side images are decoded at for detection, 0 for full size "
+                              "(default: FACE_DETECT_DECODE_SIZE or 1280)")
+    add_backend(analyze)
+    analyze.set_defaults(func=cmd_analyze)
+
+    video = subparsers.add_parser("video", help="Detect faces in a video file or image sequence")
+    video.add_argument("input", help="Input video file, image directory or glob pattern")
+    video.add_argument("-o", "--output", help="Write the annotated video to this file")
+    video.add_argument("--json", help="Write per-frame detections as JSON lines to this file")
+    video.add_argument("--anonymize", choices=['pixelate', 'blur'],
+                       help="Obscure faces in the --output video instead of outlining them")
+    add_event_arguments(video)
+    add_proposal_arguments(video)
+    add_backend(video)
+    video.set_defaults(func=cmd_video)
+
+    bench = subparsers.add_parser("bench", help="Benchmark face detection speed")
+    bench.add_argument("--video", help="Video file to take frames from (default: synthetic frames)")
+    bench.add_argument("--frames", type=int, default=100, help="Number of frames")
+    bench.add_argument("--threads", action="store_true", help="Benchmark process/thread splits instead")
+    bench.add_argument("--seconds", type=float, default=5.0, help="Duration of each thread split run")
+    add_proposal_arguments(bench)
+    bench.add_argument("--reference", choices=['haar', 'yunet', 'ssd'],
+                       help="Also report recall and speedup against this backend")
+    add_backend(bench)
+    bench.set_defaults(func=cmd_bench)
+
+    serve = subparsers.add_parser("serve", help="Serve face detection over HTTP")
+    serve.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    serve.add_argument("--port", type=int, default=8000, help="Port to listen on")
+    add_backend(serve)
+    serve.set_defaults(func=cmd_serve)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    # Thread and CPU affinity settings apply to every subcommand
+    if args.command != 'live':
+        from concurrency import configure_threads
+        configure_threads()
+
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
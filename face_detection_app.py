@@ -1,11 +1,25 @@
 import cv2
 import numpy as np
-from deepface import DeepFace
 import time
+from face_detectors import load_face_detector
+from concurrency import configure_threads
+from frame_buffers import FrameBufferPool
+from profiling import FrameProfiler
+from video_sources import open_video_source
+from attribute_backends import load_attribute_backend
+from face_alignment import FaceAligner
+from face_tracking import FaceTracker
+from analysis_scheduler import AnalysisScheduler
 
 def main():
+    # Configure OpenCV/TensorFlow threads and CPU affinity
+    configure_threads()
+    
+    # Optional --profile capture window
+    profiler = FrameProfiler.from_command_line()
+    
     # Initialize webcam
-    cap = cv2.VideoCapture(0)
+    cap = open_video_source()
     
     # Check if webcam is opened correctly
     if not cap.isOpened():
@@ -13,28 +27,34 @@ def main():
         return
     
     # Face cascade classifier
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    face_cascade = load_face_detector()
+    
+    # Emotion and age models (DeepFace, ONNX Runtime or TFLite)
+    attribute_backend = load_attribute_backend()
     
-    # Frame processing rate limiter for DeepFace analysis (once per second)
-    last_analysis_time = 0
-    analysis_interval = 1.0  # seconds
+    # Eye-based alignment of our face crops before analysis
+    face_aligner = FaceAligner()
     
-    # Variables to store analysis results
-    emotion = "Unknown"
-    age = "Unknown"
+    # Faces are tracked so each keeps its own results, and a per-second analysis budget
+    # goes to new, large, stale and changing faces first
+    face_tracker = FaceTracker()
+    analysis_scheduler = AnalysisScheduler()
     
     print("Face Detection App Started. Press 'q' to quit.")
     
+    # Reusable per-stage frame buffers
+    buffer_pool = FrameBufferPool()
+    
     while True:
         # Capture frame-by-frame
-        ret, frame = cap.read()
+        ret, frame = buffer_pool.read(cap)
         
         if not ret:
             print("Error: Failed to capture image")
             break
         
         # Convert to grayscale for face detection
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        gray = buffer_pool.gray(frame)
         
         # Detect faces
         faces = face_cascade.detectMultiScale(
@@ -44,43 +64,54 @@ def main():
             minSize=(30, 30)
         )
         
-        # Current time for analysis rate limiting
-        current_time = time.time()
+        # Follow faces across frames
+        current_time = time.monotonic()
+        tracks = face_tracker.update(faces, current_time)
+        analysis_scheduler.forget(face_tracker.removed)
+        
+        # Analyze the faces the budget allows this frame, before anything is drawn on it
+        for track in analysis_scheduler.select(tracks, gray, current_time):
+            try:
+                # Face region from our own box, aligned once on the eyes
+                face_img = face_aligner.align(frame, track.box, gray)
+                
+                # Analyze emotion and age in one call, DeepFace's own detection is skipped
+                analysis = attribute_backend.analyze(face_img, actions=['emotion', 'age'], enforce_detection=False)
+                analysis_scheduler.store(track, analysis[0])
+            except Exception as e:
+                print(f"Analysis error: {e}")
         
         # Process each face
-        for (x, y, w, h) in faces:
+        for track in tracks:
+            x, y, w, h = track.box
+            
             # Draw rectangle around face
             cv2.rectangle(frame, (x, y), (x+w, y+h), (255, 0, 0), 2)
             
-            # Perform DeepFace analysis once per second when faces are detected
-            if current_time - last_analysis_time > analysis_interval:
-                try:
-                    # Get face region
-                    face_img = frame[y:y+h, x:x+w]
-                    
-                    # Analyze emotion
-                    emotion_analysis = DeepFace.analyze(face_img, actions=['emotion'], enforce_detection=False)
-                    emotion = emotion_analysis[0]['dominant_emotion']
-                    
-                    # Analyze age
-                    age_analysis = DeepFace.analyze(face_img, actions=['age'], enforce_detection=False)
-                    age = age_analysis[0]['age']
-                    
-                    last_analysis_time = current_time
-                except Exception as e:
-                    print(f"Analysis error: {e}")
-            
-            # Display emotion and age
+            # Display this face's latest emotion and age
+            result = analysis_scheduler.result(track)
+            emotion = result['dominant_emotion'] if result else "Unknown"
+            age = result['age'] if result else "Unknown"
             cv2.putText(frame, f"Emotion: {emotion}", (x, y-30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
             cv2.putText(frame, f"Age: {age}", (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
         
         # Display the resulting frame
         cv2.imshow('Face Detection', frame)
         
+        # Advance the profiling window
+        profiler.tick()
+        
         # Break the loop when 'q' is pressed
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
     
+    # Write and summarize profiles if --profile was given
+    profiler.finish()
+    
+    # Report frame buffer allocations and analysis refresh times
+    print(buffer_pool.summary())
+    print(analysis_scheduler.summary())
+    
     # Release resources
     cap.release()
     cv2.destroyAllWindows()
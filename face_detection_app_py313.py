@@ -2,10 +2,20 @@ import cv2
 import numpy as np
 import mediapipe as mp
 import time
+from concurrency import configure_threads
+from frame_buffers import FrameBufferPool
+from profiling import FrameProfiler
+from video_sources import open_video_source
 
 def main():
+    # Configure OpenCV/TensorFlow threads and CPU affinity
+    configure_threads()
+    
+    # Optional --profile capture window
+    profiler = FrameProfiler.from_command_line()
+    
     # Initialize webcam
-    cap = cv2.VideoCapture(0)
+    cap = open_video_source()
     
     # Check if webcam is opened correctly
     if not cap.isOpened():
@@ -19,16 +29,19 @@ def main():
     
     print("Face Detection App Started. Press 'q' to quit.")
     
+    # Reusable per-stage frame buffers
+    buffer_pool = FrameBufferPool()
+    
     while True:
         # Capture frame-by-frame
-        ret, frame = cap.read()
+        ret, frame = buffer_pool.read(cap)
         
         if not ret:
             print("Error: Failed to capture image")
             break
         
         # Convert to RGB for MediaPipe
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        rgb_frame = buffer_pool.rgb(frame)
         
         # Process the image with MediaPipe Face Detection
         results = face_detection.process(rgb_frame)
@@ -51,10 +64,19 @@ def main():
         # Display the resulting frame
         cv2.imshow('Face Detection', frame)
         
+        # Advance the profiling window
+        profiler.tick()
+        
         # Break the loop when 'q' is pressed
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
     
+    # Write and summarize profiles if --profile was given
+    profiler.finish()
+    
+    # Report frame buffer allocations
+    print(buffer_pool.summary())
+    
     # Release resources
     cap.release()
     cv2.destroyAllWindows()
@@ -1,11 +1,18 @@
 import cv2
 import tkinter as tk
 from tkinter import ttk, messagebox
-from PIL import Image, ImageTk
 import numpy as np
-from deepface import DeepFace
 import threading
 import time
+from face_detectors import load_face_detector
+from concurrency import configure_threads
+from frame_buffers import FrameBufferPool
+from profiling import FrameProfiler
+from video_sources import open_video_source
+from attribute_backends import load_attribute_backend
+from face_alignment import FaceAligner
+from face_tracking import FaceTracker
+from analysis_scheduler import AnalysisScheduler
 
 class FaceDetectionApp:
     def __init__(self, window):
@@ -63,17 +70,28 @@ class FaceDetectionApp:
         self.is_running = False
         self.thread = None
         
+        # Reusable per-stage frame buffers
+        self.buffer_pool = FrameBufferPool()
+        
+        # Optional --profile capture window
+        self.profiler = FrameProfiler.from_command_line()
+        
         # Face detection variables
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        self.last_analysis_time = 0
-        self.analysis_interval = 1.0  # seconds
+        self.face_cascade = load_face_detector()
+        self.attribute_backend = load_attribute_backend()
+        self.face_aligner = FaceAligner()
+        
+        # Faces are tracked so each keeps its own results, and a per-second analysis budget
+        # goes to new, large, stale and changing faces first
+        self.face_tracker = FaceTracker()
+        self.analysis_scheduler = AnalysisScheduler()
         
     def start_video(self):
         if self.is_running:
             return
             
         # Initialize video capture
-        self.cap = cv2.VideoCapture(0)
+        self.cap = open_video_source()
         if not self.cap.isOpened():
             messagebox.showerror("Error", "Could not open webcam")
             return
@@ -105,10 +123,14 @@ class FaceDetectionApp:
         self.status_var.set("Stopped")
         self.video_label.config(image="")
         
+        # Report frame buffer allocations and analysis refresh times
+        print(self.buffer_pool.summary())
+        print(self.analysis_scheduler.summary())
+        
     def video_loop(self):
         try:
             while self.is_running:
-                ret, frame = self.cap.read()
+                ret, frame = self.buffer_pool.read(self.cap)
                 if not ret:
                     self.status_var.set("Error: Failed to capture image")
                     break
@@ -116,26 +138,35 @@ class FaceDetectionApp:
                 # Process the frame
                 processed_frame = self.process_frame(frame)
                 
-                # Convert to PhotoImage
-                cv2image = cv2.cvtColor(processed_frame, cv2.COLOR_BGR2RGB)
-                img = Image.fromarray(cv2image)
-                imgtk = ImageTk.PhotoImage(image=img)
+                # Display the frame
+                self.show_frame(processed_frame)
                 
-                # Update the video label
-                self.video_label.imgtk = imgtk
-                self.video_label.config(image=imgtk)
+                # Advance the profiling window
+                self.profiler.tick()
                 
                 # Process at 30 fps
                 time.sleep(0.033)
         except Exception as e:
             self.status_var.set(f"Error: {str(e)}")
         finally:
+            # Write and summarize profiles if --profile was given
+            self.profiler.finish()
             if self.is_running:
                 self.stop_video()
     
+    def show_frame(self, processed_frame):
+        # Convert to PhotoImage, reusing the RGB, PIL and PhotoImage buffers
+        cv2image = self.buffer_pool.rgb(processed_frame)
+        img = self.buffer_pool.pil_image(cv2image)
+        imgtk = self.buffer_pool.photo_image(img)
+        
+        # Update the video label
+        self.video_label.imgtk = imgtk
+        self.video_label.config(image=imgtk)
+    
     def process_frame(self, frame):
         # Convert to grayscale for face detection
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        gray = self.buffer_pool.gray(frame)
         
         # Detect faces
         faces = self.face_cascade.detectMultiScale(
@@ -145,35 +176,42 @@ class FaceDetectionApp:
             minSize=(30, 30)
         )
         
-        # Current time for analysis rate limiting
-        current_time = time.time()
+        # Follow faces across frames
+        current_time = time.monotonic()
+        tracks = self.face_tracker.update(faces, current_time)
+        self.analysis_scheduler.forget(self.face_tracker.removed)
+        
+        # Analyze the faces the budget allows this frame, before anything is drawn on it
+        for track in self.analysis_scheduler.select(tracks, gray, current_time):
+            try:
+                # Face region from our own box, aligned once on the eyes
+                face_img = self.face_aligner.align(frame, track.box, gray)
+                
+                # Analyze emotion and age in one call, DeepFace's own detection is skipped
+                analysis = self.attribute_backend.analyze(face_img, actions=['emotion', 'age'], enforce_detection=False)
+                self.analysis_scheduler.store(track, analysis[0])
+            except Exception as e:
+                print(f"Analysis error: {e}")
         
         # Process each face
-        for (x, y, w, h) in faces:
+        for track in tracks:
+            x, y, w, h = track.box
+            
             # Draw rectangle around face
             cv2.rectangle(frame, (x, y), (x+w, y+h), (255, 0, 0), 2)
             
-            # Perform DeepFace analysis once per second when faces are detected
-            if current_time - self.last_analysis_time > self.analysis_interval:
-                try:
-                    # Get face region
-                    face_img = frame[y:y+h, x:x+w]
-                    
-                    # Analyze emotion
-                    emotion_analysis = DeepFace.analyze(face_img, actions=['emotion'], enforce_detection=False)
-                    emotion = emotion_analysis[0]['dominant_emotion']
-                    
-                    # Analyze age
-                    age_analysis = DeepFace.analyze(face_img, actions=['age'], enforce_detection=False)
-                    age = age_analysis[0]['age']
-                    
-                    # Update UI with results
-                    self.emotion_var.set(emotion.capitalize())
-                    self.age_var.set(str(age))
-                    
-                    self.last_analysis_time = current_time
-                except Exception as e:
-                    print(f"Analysis error: {e}")
+            # Display this face's latest emotion and age
+            result = self.analysis_scheduler.result(track)
+            if result:
+                cv2.putText(frame, f"{result['dominant_emotion'].capitalize()}, {result['age']}", (x, y-10),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+        
+        # Update UI with the results of the largest face
+        analyzed = [t for t in tracks if self.analysis_scheduler.result(t)]
+        if analyzed:
+            result = self.analysis_scheduler.result(max(analyzed, key=lambda t: t.box[2] * t.box[3]))
+            self.emotion_var.set(result['dominant_emotion'].capitalize())
+            self.age_var.set(str(result['age']))
         
         return frame
     
@@ -182,6 +220,9 @@ class FaceDetectionApp:
         self.window.destroy()
 
 def main():
+    # Configure OpenCV/TensorFlow threads and CPU affinity
+    configure_threads()
+    
     # Create the main window
     root = tk.Tk()
     app = FaceDetectionApp(root)
@@ -2,10 +2,21 @@ import cv2
 import numpy as np
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from PIL import Image, ImageTk
 import threading
 import time
 import os
+from face_detectors import load_face_detector, describe_face_detector
+from concurrency import configure_threads
+from frame_buffers import FrameBufferPool
+from video_recorder import VideoRecorder
+from result_cache import ResultCache
+from profiling import FrameProfiler
+from video_sources import open_video_source
+from tiled_detection import TILED_MIN_PIXELS, TiledDetector
+from anonymize import Anonymizer
+
+# Face detection parameters, also part of the result cache key
+DETECTION_PARAMS = {'scaleFactor': 1.1, 'minNeighbors': 5, 'minSize': (30, 30)}
 
 class FaceDetectionApp:
     def __init__(self, window, window_title):
@@ -15,7 +26,14 @@ class FaceDetectionApp:
         self.window.configure(bg="#f0f0f0")
         
         # Load face cascade classifier
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        self.face_cascade = load_face_detector()
+        self.detector_info = describe_face_detector(self.face_cascade)
+        
+        # Persistent cache of detection results for opened image files
+        self.result_cache = ResultCache()
+        
+        # Tiled detection for very large images, created on first use
+        self.tiled_detector = None
         
         # Initialize variables
         self.cap = None
@@ -24,6 +42,21 @@ class FaceDetectionApp:
         self.stop_event = threading.Event()
         self.current_image = None
         
+        # Smoothed rate of processed webcam frames, used as the recording frame rate
+        self.processed_fps = None
+        
+        # Optional --profile capture window
+        self.profiler = FrameProfiler.from_command_line()
+        
+        # Reusable per-stage frame buffers
+        self.buffer_pool = FrameBufferPool()
+        
+        # Background recorder for the annotated webcam feed
+        self.recorder = VideoRecorder()
+        
+        # Pixelates or blurs faces before display and recording (FACE_DETECT_ANONYMIZE mode)
+        self.anonymizer = Anonymizer()
+        
         # Create GUI elements
         self.create_widgets()
         
@@ -49,6 +82,14 @@ class FaceDetectionApp:
         self.save_btn.pack(side=tk.LEFT, padx=5)
         self.save_btn.config(state=tk.DISABLED)
         
+        self.record_btn = ttk.Button(self.control_frame, text="Start Recording", command=self.toggle_recording)
+        self.record_btn.pack(side=tk.LEFT, padx=5)
+        self.record_btn.config(state=tk.DISABLED)
+        
+        self.anonymize_var = tk.BooleanVar(value="FACE_DETECT_ANONYMIZE" in os.environ)
+        self.anonymize_check = ttk.Checkbutton(self.control_frame, text="Anonymize Faces", variable=self.anonymize_var)
+        self.anonymize_check.pack(side=tk.LEFT, padx=5)
+        
         # Create video display
         self.video_label = ttk.Label(self.video_frame)
         self.video_label.pack(fill=tk.BOTH, expand=True)
@@ -69,7 +110,12 @@ class FaceDetectionApp:
             # Stop webcam
             self.stop_event.set()
             if self.processing_thread:
-                self.processing_thread.join()
+                # The thread may be waiting for a stream that is down; releasing the capture
+                # below wakes it
+                self.processing_thread.join(timeout=1.0)
+            if self.recorder.is_recording:
+                self.toggle_recording()
+            self.record_btn.config(state=tk.DISABLED)
             if self.cap:
                 self.cap.release()
             self.cap = None
@@ -77,30 +123,30 @@ class FaceDetectionApp:
             self.webcam_btn.config(text="Try Webcam")
             self.status_var.set("Webcam stopped")
             self.save_btn.config(state=tk.DISABLED)
+            
+            # Report frame buffer allocations
+            print(self.buffer_pool.summary())
         else:
             try:
                 # Start webcam
-                self.cap = cv2.VideoCapture(0)
+                self.cap = open_video_source()
                 if not self.cap.isOpened():
                     messagebox.showerror("Webcam Error", "Could not open webcam. Please check your camera permissions or try using image files instead.")
                     self.status_var.set("Error: Could not open webcam. Try using image files.")
                     return
                 
-                # Try to read a frame to verify webcam works
-                ret, frame = self.cap.read()
-                if not ret:
-                    messagebox.showerror("Webcam Error", "Failed to capture image from webcam. Please try using image files instead.")
-                    self.status_var.set("Error: Failed to capture image from webcam")
-                    self.cap.release()
-                    return
+                # Frames are not read here: a stream that is down would block the window.
+                # process_webcam stops the webcam after repeated read failures.
                 
                 self.is_webcam_active = True
                 self.webcam_btn.config(text="Stop Webcam")
                 self.status_var.set("Webcam started")
                 self.save_btn.config(state=tk.NORMAL)
+                self.record_btn.config(state=tk.NORMAL)
                 
-                # Reset stop event
+                # Reset stop event and the measured frame rate
                 self.stop_event.clear()
+                self.processed_fps = None
                 
                 # Start processing in a separate thread
                 self.processing_thread = threading.Thread(target=self.process_webcam)
@@ -114,10 +160,11 @@ class FaceDetectionApp:
         frame_count = 0
         error_count = 0
         max_errors = 5
+        last_processed = None
         
         while not self.stop_event.is_set():
             try:
-                ret, frame = self.cap.read()
+                ret, frame = self.buffer_pool.read(self.cap)
                 if not ret:
                     error_count += 1
                     if error_count >= max_errors:
@@ -136,27 +183,62 @@ class FaceDetectionApp:
                     # Process the frame
                     processed_frame = self.detect_faces(frame)
                     
+                    # Measure the processed frame rate; with the frame skip and the detection
+                    # time it is usually well below half the camera rate
+                    now = time.perf_counter()
+                    if last_processed is not None and now > last_processed:
+                        rate = 1.0 / (now - last_processed)
+                        self.processed_fps = rate if self.processed_fps is None else 0.9 * self.processed_fps + 0.1 * rate
+                    last_processed = now
+                    
+                    # Queue the annotated frame for recording, this never blocks
+                    if self.recorder.is_recording:
+                        self.recorder.write(processed_frame)
+                        if frame_count % 60 == 0:
+                            stats = self.recorder.stats()
+                            self.status_var.set(f"Recording: {stats['written']} frames written, "
+                                                f"{stats['dropped'] + stats['skipped']} dropped")
+                    
                     # Display the frame
                     self.display_image(processed_frame)
+                    
+                    # Advance the profiling window
+                    self.profiler.tick()
                 
                 # Small delay to reduce CPU usage
                 time.sleep(0.01)
             except Exception as e:
                 self.status_var.set(f"Error processing webcam frame: {str(e)}")
                 time.sleep(0.1)
+        
+        # Write and summarize profiles if --profile was given
+        self.profiler.finish()
+    
+    def find_faces(self, frame):
+        # Convert to grayscale for face detection
+        gray = self.buffer_pool.gray(frame)
+        
+        # Detect faces
+        return self.face_cascade.detectMultiScale(gray, **DETECTION_PARAMS)
+    
+    def find_faces_tiled(self, image):
+        # Overlapping tiles detected across a thread pool, each thread with its own detector
+        if self.tiled_detector is None:
+            self.tiled_detector = TiledDetector(load_face_detector)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return self.tiled_detector.detectMultiScale(gray, **DETECTION_PARAMS)
     
-    def detect_faces(self, frame):
+    def detect_faces(self, frame, faces=None):
         try:
-            # Convert to grayscale for face detection
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            # Detect faces unless results are already known
+            is_video = faces is None
+            if is_video:
+                faces = self.find_faces(frame)
             
-            # Detect faces
-            faces = self.face_cascade.detectMultiScale(
-                gray,
-                scaleFactor=1.1,
-                minNeighbors=5,
-                minSize=(30, 30)
-            )
+            # Obscure faces first so neither the display nor a recording shows them; video
+            # frames also cover recently missed faces from the tracker
+            if self.anonymize_var.get():
+                self.anonymizer.apply(frame, faces, track=is_video)
             
             # Process each face
             for (x, y, w, h) in faces:
@@ -194,9 +276,20 @@ class FaceDetectionApp:
                     self.status_var.set("Error: Could not open image")
                     return
                     
-                processed_image = self.detect_faces(image)
+                # Very large images are split into tiles detected in parallel
+                tiled = image.shape[0] * image.shape[1] > TILED_MIN_PIXELS
+                params = dict(DETECTION_PARAMS, tiled=True) if tiled else DETECTION_PARAMS
+                
+                # Reuse cached results when this image was already processed with the same settings
+                faces = self.result_cache.get(file_path, self.detector_info, params)
+                cached = faces is not None
+                if not cached:
+                    faces = self.find_faces_tiled(image) if tiled else self.find_faces(image)
+                    self.result_cache.put(file_path, self.detector_info, params, faces)
+                
+                processed_image = self.detect_faces(image, faces)
                 self.display_image(processed_image)
-                self.status_var.set(f"Image loaded: {os.path.basename(file_path)}")
+                self.status_var.set(f"Image loaded: {os.path.basename(file_path)}" + (" (cached)" if cached else ""))
                 self.save_btn.config(state=tk.NORMAL)
                 self.current_image = processed_image
             except Exception as e:
@@ -221,27 +314,62 @@ class FaceDetectionApp:
                     messagebox.showerror("Error", f"Error saving image: {str(e)}")
                     self.status_var.set(f"Error saving image: {str(e)}")
     
+    def toggle_recording(self):
+        if self.recorder.is_recording:
+            # Stop recording and wait for queued frames to be written
+            stats = self.recorder.stop()
+            self.record_btn.config(text="Start Recording")
+            self.status_var.set(f"Recording saved: {os.path.basename(stats['path'])} "
+                                f"({stats['written']} frames, {stats['dropped']} dropped, "
+                                f"{stats['skipped']} skipped)")
+            return
+        
+        if not self.is_webcam_active or self.cap is None:
+            return
+        
+        # Open save file dialog
+        file_path = filedialog.asksaveasfilename(
+            title="Save Recording",
+            defaultextension=".mp4",
+            filetypes=[("MP4 files", "*.mp4"), ("AVI files", "*.avi"), ("All files", "*.*")]
+        )
+        
+        if file_path:
+            try:
+                # Record at the measured processed frame rate, so playback runs at real speed.
+                # Before it is measured, assume every other camera frame is processed.
+                fps = self.processed_fps or (self.cap.get(cv2.CAP_PROP_FPS) or 30) / 2
+                width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                self.recorder.fourcc = 'XVID' if file_path.lower().endswith('.avi') else 'mp4v'
+                self.recorder.start(file_path, fps, (width, height))
+                self.record_btn.config(text="Stop Recording")
+                self.status_var.set(f"Recording to {os.path.basename(file_path)}")
+            except Exception as e:
+                messagebox.showerror("Error", f"Error starting recording: {str(e)}")
+                self.status_var.set(f"Error starting recording: {str(e)}")
+    
     def display_image(self, image):
         try:
             # Convert to RGB for display
-            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            
-            # Convert to PIL Image
-            pil_image = Image.fromarray(image_rgb)
+            image_rgb = self.buffer_pool.rgb(image)
             
             # Resize to fit the window
-            w, h = pil_image.size
+            h, w = image_rgb.shape[:2]
             max_w = self.video_frame.winfo_width() - 20
             max_h = self.video_frame.winfo_height() - 20
             
             if max_w > 0 and max_h > 0:  # Ensure window is initialized
                 # Calculate scaling factor to fit within the frame
                 scale = min(max_w / w, max_h / h)
-                new_size = (int(w * scale), int(h * scale))
-                pil_image = pil_image.resize(new_size, Image.LANCZOS)
+                new_size = (max(1, int(w * scale)), max(1, int(h * scale)))
+                image_rgb = self.buffer_pool.resize(image_rgb, new_size, name='display')
+            
+            # Convert to PIL Image
+            pil_image = self.buffer_pool.pil_image(image_rgb)
             
             # Convert to PhotoImage
-            self.photo = ImageTk.PhotoImage(image=pil_image)
+            self.photo = self.buffer_pool.photo_image(pil_image)
             
             # Update the label
             self.video_label.config(image=self.photo)
@@ -254,14 +382,23 @@ class FaceDetectionApp:
         if self.is_webcam_active:
             self.stop_event.set()
             if self.processing_thread:
-                self.processing_thread.join()
+                # The thread may be waiting for a stream that is down; releasing the capture
+                # below wakes it
+                self.processing_thread.join(timeout=1.0)
+            self.recorder.stop()
             if self.cap:
                 self.cap.release()
         
         # Close window
+        self.result_cache.close()
+        if self.tiled_detector:
+            self.tiled_detector.close()
         self.window.destroy()
 
 def main():
+    # Configure OpenCV/TensorFlow threads and CPU affinity
+    configure_threads()
+    
     # Create main window
     root = tk.Tk()
     app = FaceDetectionApp(root, "Face Detection App")
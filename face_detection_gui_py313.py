@@ -3,10 +3,14 @@ import numpy as np
 import mediapipe as mp
 import tkinter as tk
 from tkinter import ttk, filedialog
-from PIL import Image, ImageTk
 import threading
 import time
 import os
+from concurrency import configure_threads
+from frame_buffers import FrameBufferPool
+from profiling import FrameProfiler
+from video_sources import open_video_source
+from image_loading import load_color
 
 class FaceDetectionApp:
     def __init__(self, window, window_title):
@@ -20,12 +24,25 @@ class FaceDetectionApp:
         self.mp_drawing = mp.solutions.drawing_utils
         self.face_detection = self.mp_face_detection.FaceDetection(min_detection_confidence=0.5)
         
+        # Frames are annotated in RGB, so keypoints are drawn with an RGB red
+        self.keypoint_spec = self.mp_drawing.DrawingSpec(color=(255, 0, 0))
+        
+        # Optional --profile capture window
+        self.profiler = FrameProfiler.from_command_line()
+        
+        # Reusable per-stage frame buffers, the RGB buffer is shared by MediaPipe and the display
+        self.buffer_pool = FrameBufferPool()
+        
         # Initialize variables
         self.cap = None
         self.is_webcam_active = False
         self.processing_thread = None
         self.stop_event = threading.Event()
         
+        # Last processed webcam frame for saving, written by the webcam thread
+        self.frame_lock = threading.Lock()
+        self.last_frame = None
+        
         # Create GUI elements
         self.create_widgets()
         
@@ -70,7 +87,9 @@ class FaceDetectionApp:
             # Stop webcam
             self.stop_event.set()
             if self.processing_thread:
-                self.processing_thread.join()
+                # The thread may be waiting for a stream that is down; releasing the capture
+                # below wakes it
+                self.processing_thread.join(timeout=1.0)
             if self.cap:
                 self.cap.release()
             self.cap = None
@@ -78,9 +97,12 @@ class FaceDetectionApp:
             self.webcam_btn.config(text="Start Webcam")
             self.status_var.set("Webcam stopped")
             self.save_btn.config(state=tk.DISABLED)
+            
+            # Report frame buffer allocations
+            print(self.buffer_pool.summary())
         else:
             # Start webcam
-            self.cap = cv2.VideoCapture(0)
+            self.cap = open_video_source()
             if not self.cap.isOpened():
                 self.status_var.set("Error: Could not open webcam")
                 return
@@ -100,32 +122,56 @@ class FaceDetectionApp:
     
     def process_webcam(self):
         while not self.stop_event.is_set():
-            ret, frame = self.cap.read()
+            ret, frame = self.buffer_pool.read(self.cap)
             if not ret:
-                self.status_var.set("Error: Failed to capture image")
+                if not self.stop_event.is_set():
+                    self.status_var.set("Error: Failed to capture image")
                 break
             
             # Process the frame
             processed_frame = self.detect_faces(frame)
             
-            # Display the frame
-            self.display_image(processed_frame)
+            # Keep a copy for save_image, the RGB buffer is reused for the next frame
+            with self.frame_lock:
+                if self.last_frame is None or self.last_frame.shape != processed_frame.shape:
+                    self.last_frame = processed_frame.copy()
+                else:
+                    np.copyto(self.last_frame, processed_frame)
+            
+            # Display the frame (already RGB)
+            self.display_image(processed_frame, is_rgb=True)
+            
+            # Advance the profiling window
+            self.profiler.tick()
             
             # Small delay to reduce CPU usage
             time.sleep(0.01)
+        
+        # Write and summarize profiles if --profile was given
+        self.profiler.finish()
     
     def detect_faces(self, frame):
-        # Convert to RGB for MediaPipe
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        # The RGB buffer is only reallocated when the frame size changes
+        rgb_frame = self.buffer_pool.get('rgb', frame.shape)
+        
+        # Convert to RGB for MediaPipe into the reused buffer
+        rgb_frame.flags.writeable = True
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb_frame)
+        
+        # Mark the buffer read-only so MediaPipe can use it without copying
+        rgb_frame.flags.writeable = False
         
         # Process the image with MediaPipe Face Detection
         results = self.face_detection.process(rgb_frame)
         
+        # Annotate the RGB frame so it can be displayed without another conversion
+        rgb_frame.flags.writeable = True
+        
         # Draw face detections
         if results.detections:
             for detection in results.detections:
                 # Draw the face detection box
-                self.mp_drawing.draw_detection(frame, detection)
+                self.mp_drawing.draw_detection(rgb_frame, detection, self.keypoint_spec)
                 
                 # Get bounding box coordinates
                 bbox = detection.location_data.relative_bounding_box
@@ -134,9 +180,9 @@ class FaceDetectionApp:
                 
                 # Display confidence score
                 confidence = round(detection.score[0] * 100, 1)
-                cv2.putText(frame, f"Confidence: {confidence}%", (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+                cv2.putText(rgb_frame, f"Confidence: {confidence}%", (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
         
-        return frame
+        return rgb_frame
     
     def open_image(self):
         # Stop webcam if active
@@ -150,26 +196,29 @@ class FaceDetectionApp:
         )
         
         if file_path:
-            # Read and process the image
-            image = cv2.imread(file_path)
+            # Read and process the image. MediaPipe runs on a small input anyway, so large JPEGs
+            # are decoded at reduced size, keeping the long side at least 1920 for display and saving
+            image, _ = load_color(file_path, 1920)
             if image is not None:
                 processed_image = self.detect_faces(image)
-                self.display_image(processed_image)
+                self.display_image(processed_image, is_rgb=True)
                 self.status_var.set(f"Image loaded: {os.path.basename(file_path)}")
                 self.save_btn.config(state=tk.NORMAL)
-                self.current_image = processed_image
+                # Keep a copy since the RGB buffer is reused for the next frame
+                self.current_image = processed_image.copy()
             else:
                 self.status_var.set("Error: Could not open image")
     
     def save_image(self):
         if hasattr(self, 'current_image') or self.is_webcam_active:
-            # Get current image
+            # Take the last frame the webcam thread processed, without touching the camera
+            # or the buffers that thread is working in
             if self.is_webcam_active:
-                ret, frame = self.cap.read()
-                if not ret:
-                    self.status_var.set("Error: Failed to capture image")
-                    return
-                self.current_image = self.detect_faces(frame)
+                with self.frame_lock:
+                    if self.last_frame is None:
+                        self.status_var.set("Error: No webcam frame processed yet")
+                        return
+                    self.current_image = self.last_frame.copy()
             
             # Open save file dialog
             file_path = filedialog.asksaveasfilename(
@@ -179,30 +228,30 @@ class FaceDetectionApp:
             )
             
             if file_path:
-                # Save the image
-                cv2.imwrite(file_path, self.current_image)
+                # Save the image (annotated frames are kept in RGB)
+                cv2.imwrite(file_path, cv2.cvtColor(self.current_image, cv2.COLOR_RGB2BGR))
                 self.status_var.set(f"Image saved: {os.path.basename(file_path)}")
     
-    def display_image(self, image):
-        # Convert to RGB for display
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        
-        # Convert to PIL Image
-        pil_image = Image.fromarray(image_rgb)
+    def display_image(self, image, is_rgb=False):
+        # Convert to RGB for display unless the frame is already RGB
+        image_rgb = image if is_rgb else self.buffer_pool.rgb(image)
         
         # Resize to fit the window
-        w, h = pil_image.size
+        h, w = image_rgb.shape[:2]
         max_w = self.video_frame.winfo_width() - 20
         max_h = self.video_frame.winfo_height() - 20
         
         if max_w > 0 and max_h > 0:  # Ensure window is initialized
             # Calculate scaling factor to fit within the frame
             scale = min(max_w / w, max_h / h)
-            new_size = (int(w * scale), int(h * scale))
-            pil_image = pil_image.resize(new_size, Image.LANCZOS)
+            new_size = (max(1, int(w * scale)), max(1, int(h * scale)))
+            image_rgb = self.buffer_pool.resize(image_rgb, new_size, name='display')
+        
+        # Convert to PIL Image
+        pil_image = self.buffer_pool.pil_image(image_rgb)
         
         # Convert to PhotoImage
-        self.photo = ImageTk.PhotoImage(image=pil_image)
+        self.photo = self.buffer_pool.photo_image(pil_image)
         
         # Update the label
         self.video_label.config(image=self.photo)
@@ -213,7 +262,9 @@ class FaceDetectionApp:
         if self.is_webcam_active:
             self.stop_event.set()
             if self.processing_thread:
-                self.processing_thread.join()
+                # The thread may be waiting for a stream that is down; releasing the capture
+                # below wakes it
+                self.processing_thread.join(timeout=1.0)
             if self.cap:
                 self.cap.release()
         
@@ -221,6 +272,9 @@ class FaceDetectionApp:
         self.window.destroy()
 
 def main():
+    # Configure OpenCV/TensorFlow threads and CPU affinity
+    configure_threads()
+    
     # Create main window
     root = tk.Tk()
     app = FaceDetectionApp(root, "Face Detection App")
@@ -0,0 +1,300 @@
+import cv2
+import numpy as np
+import os
+import time
+
+# Directory holding locally downloaded detector models
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+
+# Default model files for the OpenCV DNN backends
+YUNET_MODEL = os.path.join(MODELS_DIR, "face_detection_yunet_2023mar.onnx")
+SSD_CONFIG = os.path.join(MODELS_DIR, "deploy.prototxt")
+SSD_MODEL = os.path.join(MODELS_DIR, "res10_300x300_ssd_iter_140000.caffemodel")
+
+# LBP cascades are not part of the opencv-python package; download one into models/
+LBP_CASCADE = os.path.join(MODELS_DIR, "lbpcascade_frontalface_improved.xml")
+
+# Backends that can be selected with FACE_DETECTOR_BACKEND
+DETECTOR_BACKENDS = ['haar', 'yunet', 'ssd', 'lbp+haar', 'lbp+yunet', 'lbp+ssd']
+
+
+class DNNFaceDetector:
+    # Drop-in replacement for a face CascadeClassifier that runs an OpenCV DNN model.
+    # Frames are downscaled so their width is at most input_width before inference,
+    # which is the main speed/recall trade-off for these detectors.
+    def __init__(self, backend="yunet", model_path=None, config_path=None,
+                 input_width=320, score_threshold=0.6, nms_threshold=0.3, top_k=5000):
+        if backend not in ('yunet', 'ssd'):
+            raise ValueError(f"Unknown DNN face detector backend: {backend}")
+
+        self.backend = backend
+        self.input_width = input_width
+        self.score_threshold = score_threshold
+        self.input_size = None
+
+        if backend == 'yunet':
+            self.model_path = model_path or YUNET_MODEL
+            if not os.path.exists(self.model_path):
+                raise FileNotFoundError(f"YuNet model not found: {self.model_path}")
+            # The input size is set per frame once the frame shape is known
+            self.net = cv2.FaceDetectorYN.create(self.model_path, "", (320, 320),
+                                                 score_threshold, nms_threshold, top_k)
+        else:
+            self.model_path = model_path or SSD_MODEL
+            self.config_path = config_path or SSD_CONFIG
+            for path in (self.model_path, self.config_path):
+                if not os.path.exists(path):
+                    raise FileNotFoundError(f"SSD model file not found: {path}")
+            self.net = cv2.dnn.readNetFromCaffe(self.config_path, self.model_path)
+
+    def set_input_width(self, input_width):
+        self.input_width = input_width
+        self.input_size = None
+
+    def _prepare(self, image):
+        # Both networks expect a 3 channel BGR image
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+        h, w = image.shape[:2]
+        scale = min(1.0, self.input_width / float(w))
+        in_w, in_h = max(1, int(round(w * scale))), max(1, int(round(h * scale)))
+
+        if scale < 1.0:
+            image = cv2.resize(image, (in_w, in_h), interpolation=cv2.INTER_LINEAR)
+
+        return image, scale
+
+    def detect(self, image):
+        # Returns an (N, 5) float array of x, y, w, h, score in original image coordinates
+        resized, scale = self._prepare(image)
+        in_h, in_w = resized.shape[:2]
+
+        if self.backend == 'yunet':
+            if self.input_size != (in_w, in_h):
+                self.net.setInputSize((in_w, in_h))
+                self.input_size = (in_w, in_h)
+            _, faces = self.net.detect(resized)
+            if faces is None or len(faces) == 0:
+                return np.empty((0, 5), dtype=np.float32)
+            detections = np.hstack([faces[:, 0:4], faces[:, 14:15]])
+        else:
+            blob = cv2.dnn.blobFromImage(resized, 1.0, (in_w, in_h), (104.0, 177.0, 123.0))
+            self.net.setInput(blob)
+            out = self.net.forward()[0, 0]
+            out = out[out[:, 2] >= self.score_threshold]
+            if len(out) == 0:
+                return np.empty((0, 5), dtype=np.float32)
+            # SSD boxes are relative corner coordinates
+            x1, y1 = out[:, 3] * in_w, out[:, 4] * in_h
+            x2, y2 = out[:, 5] * in_w, out[:, 6] * in_h
+            detections = np.stack([x1, y1, x2 - x1, y2 - y1, out[:, 2]], axis=1)
+
+        detections = detections.astype(np.float32)
+        detections[:, 0:4] /= scale
+        return detections
+
+    def detectMultiScale(self, image, scaleFactor=None, minNeighbors=None, minSize=(30, 30), maxSize=None):
+        # scaleFactor and minNeighbors only apply to cascades and are accepted for compatibility
+        detections = self.detect(image)
+        if len(detections) == 0:
+            return ()
+
+        # Clip boxes to the image so callers can safely slice face regions
+        h, w = image.shape[:2]
+        boxes = np.round(detections[:, 0:4]).astype(np.int32)
+        x1 = np.clip(boxes[:, 0], 0, w)
+        y1 = np.clip(boxes[:, 1], 0, h)
+        x2 = np.clip(boxes[:, 0] + boxes[:, 2], 0, w)
+        y2 = np.clip(boxes[:, 1] + boxes[:, 3], 0, h)
+        boxes = np.stack([x1, y1, x2 - x1, y2 - y1], axis=1)
+
+        keep = (boxes[:, 2] >= minSize[0]) & (boxes[:, 3] >= minSize[1])
+        if maxSize is not None and maxSize[0] > 0 and maxSize[1] > 0:
+            keep &= (boxes[:, 2] <= maxSize[0]) & (boxes[:, 3] <= maxSize[1])
+        boxes = boxes[keep]
+
+        if len(boxes) == 0:
+            return ()
+        return boxes
+
+
+def load_lbp_cascade(path=None):
+    # The LBP face cascade from FACE_LBP_CASCADE or models/, or None if it is missing
+    path = path or os.environ.get("FACE_LBP_CASCADE", LBP_CASCADE)
+    cascade = cv2.CascadeClassifier(path) if os.path.exists(path) else None
+    if cascade is None or cascade.empty():
+        print(f"LBP face cascade not found: {path}")
+        return None
+    return cascade
+
+
+class TwoStageDetector:
+    # The fast LBP cascade proposes faces with loose settings, and a stronger detector (Haar
+    # cascade or DNN) verifies each proposal on a small crop around it, searching only sizes
+    # close to the proposed one. Results are the verifier's boxes, so they match what the
+    # verifier would report on the full frame.
+    def __init__(self, lbp_cascade, verifier, propose_neighbors=2, margin=0.4, size_range=1.5):
+        self.lbp_cascade = lbp_cascade
+        self.verifier = verifier
+        self.propose_neighbors = propose_neighbors
+        self.margin = margin
+        self.size_range = size_range
+
+        # Metrics
+        self.proposals = 0
+        self.verified = 0
+
+    def detectMultiScale(self, image, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30), maxSize=None):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        height, width = gray.shape[:2]
+
+        # The LBP window is 24 pixels, smaller proposals are not possible
+        lbp_min = (max(24, int(minSize[0] / self.size_range)), max(24, int(minSize[1] / self.size_range)))
+        proposals = self.lbp_cascade.detectMultiScale(gray, scaleFactor=scaleFactor,
+                                                      minNeighbors=self.propose_neighbors, minSize=lbp_min)
+        self.proposals += len(proposals)
+
+        faces = []
+        for (x, y, w, h) in proposals:
+            # Crop with a margin and search sizes around the proposal only
+            pad = int(self.margin * max(w, h))
+            x1, y1 = max(0, x - pad), max(0, y - pad)
+            x2, y2 = min(width, x + w + pad), min(height, y + h + pad)
+            size_min = max(minSize[0], int(w / self.size_range))
+            size_max = int(w * self.size_range)
+            if maxSize:
+                size_max = min(size_max, maxSize[0])
+            if size_max < size_min:
+                continue
+            found = self.verifier.detectMultiScale(gray[y1:y2, x1:x2], scaleFactor=scaleFactor,
+                                                   minNeighbors=minNeighbors, minSize=(size_min, size_min),
+                                                   maxSize=(size_max, size_max))
+            for (fx, fy, fw, fh) in found:
+                box = np.array([fx + x1, fy + y1, fw, fh], dtype=np.float32)
+                # Neighboring proposals can verify the same face
+                if faces and _box_iou(box, np.asarray(faces, dtype=np.float32)).max() > 0.3:
+                    continue
+                faces.append(tuple(int(v) for v in box))
+        self.verified += len(faces)
+
+        if len(faces) == 0:
+            return ()
+        return np.array(faces, dtype=np.int32)
+
+
+def load_face_detector(backend=None, **kwargs):
+    # Backend and DNN input width can be chosen without code changes via environment variables
+    backend = (backend or os.environ.get("FACE_DETECTOR_BACKEND", "haar")).lower()
+
+    if backend.startswith('lbp+'):
+        verifier = load_face_detector(backend[4:], **kwargs)
+        lbp_cascade = load_lbp_cascade()
+        if lbp_cascade is not None:
+            return TwoStageDetector(lbp_cascade, verifier)
+        print(f"Falling back to the {backend[4:]} face detector alone.")
+        return verifier
+
+    if backend in ('yunet', 'ssd'):
+        if 'input_width' not in kwargs and os.environ.get("FACE_DNN_INPUT_WIDTH"):
+            kwargs['input_width'] = int(os.environ["FACE_DNN_INPUT_WIDTH"])
+        try:
+            return DNNFaceDetector(backend, **kwargs)
+        except (FileNotFoundError, cv2.error) as e:
+            print(f"Error loading {backend} face detector: {e}")
+            print("Falling back to Haar cascade face detector.")
+    elif backend != 'haar':
+        print(f"Unknown face detector backend '{backend}', using Haar cascade.")
+
+    return cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+
+def describe_face_detector(detector):
+    # Identifies the detector and its settings, e.g. for result cache fingerprints
+    if isinstance(detector, TwoStageDetector):
+        verifier = describe_face_detector(detector.verifier)
+        return {
+            'backend': f"lbp+{verifier['backend']}",
+            'proposal_model': os.path.basename(os.environ.get("FACE_LBP_CASCADE", LBP_CASCADE)),
+            'propose_neighbors': detector.propose_neighbors,
+            'margin': detector.margin,
+            'size_range': detector.size_range,
+            'verifier': verifier,
+        }
+    if isinstance(detector, DNNFaceDetector):
+        return {
+            'backend': detector.backend,
+            'model': os.path.basename(detector.model_path),
+            'input_width': detector.input_width,
+            'score_threshold': detector.score_threshold,
+        }
+    return {'backend': 'haar', 'model': 'haarcascade_frontalface_default.xml'}
+
+
+def _box_iou(box, boxes):
+    # IoU between one (x, y, w, h) box and an array of boxes
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[0] + box[2], boxes[:, 0] + boxes[:, 2])
+    y2 = np.minimum(box[1] + box[3], boxes[:, 1] + boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    union = box[2] * box[3] + boxes[:, 2] * boxes[:, 3] - inter
+    return inter / np.maximum(union, 1e-6)
+
+
+def tune_input_width(detector, frames, candidate_widths=(160, 240, 320, 480, 640), min_recall=0.95):
+    # Pick the smallest input width whose detections still match the widest setting.
+    # Recall is measured against the largest candidate width on the same frames.
+    widths = sorted(candidate_widths)
+    results = {}
+
+    for width in widths:
+        detector.set_input_width(width)
+        detector.detectMultiScale(frames[0])  # warm up
+        start = time.perf_counter()
+        boxes = [np.asarray(detector.detectMultiScale(frame)).reshape(-1, 4) for frame in frames]
+        elapsed = (time.perf_counter() - start) / len(frames)
+        results[width] = {'ms_per_frame': elapsed * 1000.0, 'boxes': boxes}
+
+    reference = results[widths[-1]]['boxes']
+    total = sum(len(b) for b in reference)
+
+    for width in widths:
+        matched = 0
+        for ref, found in zip(reference, results[width]['boxes']):
+            for box in ref:
+                if len(found) and _box_iou(box, found).max() >= 0.5:
+                    matched += 1
+        results[width]['recall'] = matched / total if total else 1.0
+        del results[width]['boxes']
+
+    best = next((w for w in widths if results[w]['recall'] >= min_recall), widths[-1])
+    detector.set_input_width(best)
+    return best, results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Tune the DNN face detector input width on a video")
+    parser.add_argument("video", help="Video file to sample frames from")
+    parser.add_argument("--backend", default="yunet", choices=['yunet', 'ssd'])
+    parser.add_argument("--frames", type=int, default=100, help="Number of frames to sample")
+    args = parser.parse_args()
+
+    cap = cv2.VideoCapture(args.video)
+    frames = []
+    while len(frames) < args.frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+
+    if not frames:
+        print(f"Error: Could not read frames from {args.video}")
+    else:
+        best, results = tune_input_width(DNNFaceDetector(args.backend), frames)
+        for width, stats in sorted(results.items()):
+            print(f"width={width:4d}  {stats['ms_per_frame']:7.2f} ms/frame  recall={stats['recall']:.2f}")
+        print(f"Best input width: {best}")
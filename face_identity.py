@@ -0,0 +1,319 @@
+import json
+import os
+import time
+
+import numpy as np
+
+# Files making up an identity index directory
+EMBEDDINGS_FILE = "embeddings.f32"
+IDS_FILE = "ids.json"
+IVF_FILE = "ivf.npz"
+
+# Default location of the OpenCV SFace recognition model
+SFACE_MODEL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models",
+                           "face_recognition_sface_2021dec.onnx")
+
+
+class DeepFaceEmbedder:
+    # Face embeddings from DeepFace.represent, run on our own crops with detection skipped
+    def __init__(self, model_name="Facenet512"):
+        self.model_name = model_name
+
+    def embed(self, face_img):
+        from deepface import DeepFace
+
+        result = DeepFace.represent(face_img, model_name=self.model_name,
+                                    detector_backend='skip', enforce_detection=False)
+        return np.asarray(result[0]['embedding'], dtype=np.float32)
+
+
+class SFaceEmbedder:
+    # Face embeddings from the OpenCV SFace model, no TensorFlow required
+    def __init__(self, model_path=None):
+        import cv2
+
+        self.cv2 = cv2
+        model_path = model_path or SFACE_MODEL
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"SFace model not found: {model_path}")
+        self.recognizer = cv2.FaceRecognizerSF.create(model_path, "")
+
+    def embed(self, face_img):
+        face = self.cv2.resize(face_img, (112, 112), interpolation=self.cv2.INTER_AREA)
+        return self.recognizer.feature(face).reshape(-1).astype(np.float32)
+
+
+def load_face_embedder(backend=None):
+    backend = (backend or os.environ.get("FACE_EMBEDDER_BACKEND", "deepface")).lower()
+    if backend == 'sface':
+        return SFaceEmbedder()
+    return DeepFaceEmbedder()
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class FaceIdentityIndex:
+    # Enrolled face embeddings stored as a memory-mapped float32 matrix with a JSON sidecar
+    # holding the identity of each row. Opening an index only maps the file, so it loads
+    # instantly regardless of size. Embeddings are L2-normalized when added, so the
+    # similarity score is the cosine similarity.
+    def __init__(self, directory, dim=None, initial_capacity=1024):
+        self.directory = directory
+        self.embeddings_path = os.path.join(directory, EMBEDDINGS_FILE)
+        self.ids_path = os.path.join(directory, IDS_FILE)
+        self.ivf_path = os.path.join(directory, IVF_FILE)
+        self.initial_capacity = initial_capacity
+        self.matrix = None
+        self.ivf = None
+
+        if os.path.exists(self.ids_path):
+            with open(self.ids_path) as f:
+                meta = json.load(f)
+            self.dim = meta['dim']
+            self.capacity = meta['capacity']
+            self.ids = meta['ids']
+            if dim is not None and dim != self.dim:
+                raise ValueError(f"Index at {directory} has dimension {self.dim}, not {dim}")
+            self.matrix = np.memmap(self.embeddings_path, dtype=np.float32, mode='r+',
+                                    shape=(self.capacity, self.dim))
+            if os.path.exists(self.ivf_path):
+                self.ivf = dict(np.load(self.ivf_path))
+        else:
+            self.dim = dim
+            self.capacity = 0
+            self.ids = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _reserve(self, count):
+        # Grow the backing file by doubling so appends stay amortized O(1)
+        if self.capacity >= count:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        capacity = max(self.initial_capacity, self.capacity)
+        while capacity < count:
+            capacity *= 2
+
+        if self.matrix is not None:
+            self.matrix.flush()
+            del self.matrix
+        with open(self.embeddings_path, 'ab') as f:
+            f.truncate(capacity * self.dim * 4)
+
+        self.capacity = capacity
+        self.matrix = np.memmap(self.embeddings_path, dtype=np.float32, mode='r+',
+                                shape=(self.capacity, self.dim))
+
+    def add(self, identity, embedding):
+        return self.add_many([identity], [embedding])[0]
+
+    def add_many(self, identities, embeddings):
+        embeddings = _normalize(embeddings).reshape(len(identities), -1)
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+        if embeddings.shape[1] != self.dim:
+            raise ValueError(f"Expected embeddings of dimension {self.dim}, got {embeddings.shape[1]}")
+
+        start = len(self.ids)
+        self._reserve(start + len(identities))
+        self.matrix[start:start + len(identities)] = embeddings
+        self.ids.extend(str(i) for i in identities)
+        return list(range(start, start + len(identities)))
+
+    def save(self):
+        if self.matrix is not None:
+            self.matrix.flush()
+
+        # Write the sidecar atomically so a crash never leaves a half written index
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.ids_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'dim': self.dim, 'capacity': self.capacity, 'ids': self.ids}, f)
+        os.replace(tmp_path, self.ids_path)
+
+    def build_approximate_index(self, n_lists=None, iterations=10, sample_size=50000, seed=0):
+        # Inverted file index: rows are grouped under k-means centroids and a query only
+        # scans the rows of its closest centroids
+        count = len(self.ids)
+        if count == 0:
+            return
+        n_lists = n_lists or max(1, int(np.sqrt(count)))
+        vectors = self.matrix[:count]
+
+        rng = np.random.default_rng(seed)
+        sample = vectors[np.sort(rng.choice(count, min(count, sample_size), replace=False))]
+        centroids = sample[rng.choice(len(sample), min(n_lists, len(sample)), replace=False)].copy()
+
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(len(centroids)):
+                members = sample[assignment == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+
+        # Assign every row in chunks to keep memory bounded
+        assignment = np.empty(count, dtype=np.int32)
+        for start in range(0, count, 65536):
+            chunk = vectors[start:start + 65536]
+            assignment[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+
+        order = np.argsort(assignment, kind='stable').astype(np.int64)
+        offsets = np.searchsorted(assignment[order], np.arange(len(centroids) + 1)).astype(np.int64)
+
+        self.ivf = {'centroids': centroids, 'order': order, 'offsets': offsets,
+                    'count': np.int64(count)}
+        np.savez(self.ivf_path, **self.ivf)
+
+    def _candidate_rows(self, query, n_probe):
+        centroids = self.ivf['centroids']
+        probes = np.argsort(-(centroids @ query))[:n_probe]
+        order, offsets = self.ivf['order'], self.ivf['offsets']
+        rows = [order[offsets[c]:offsets[c + 1]] for c in probes]
+
+        # Rows added after the index was built are always scanned
+        indexed = int(self.ivf['count'])
+        if len(self.ids) > indexed:
+            rows.append(np.arange(indexed, len(self.ids)))
+        return np.sort(np.concatenate(rows))
+
+    def search(self, embedding, k=5, approximate=False, n_probe=8):
+        # Returns [(identity, score), ...] sorted by decreasing cosine similarity
+        count = len(self.ids)
+        if count == 0:
+            return []
+
+        query = _normalize(embedding).reshape(-1)
+        if approximate and self.ivf is not None:
+            rows = self._candidate_rows(query, n_probe)
+            scores = self.matrix[rows] @ query
+        else:
+            rows = None
+            scores = self.matrix[:count] @ query
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        if rows is not None:
+            return [(self.ids[rows[i]], float(scores[i])) for i in top]
+        return [(self.ids[i], float(scores[i])) for i in top]
+
+    def identify(self, embedding, threshold=0.5, approximate=False):
+        # Best matching identity, or None when no enrolled face is similar enough
+        matches = self.search(embedding, k=1, approximate=approximate)
+        if matches and matches[0][1] >= threshold:
+            return matches[0]
+        return None
+
+
+def largest_face(image, face_detector):
+    import cv2
+
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    faces = face_detector.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+    if len(faces) == 0:
+        return None
+    x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+    return image[y:y+h, x:x+w]
+
+
+def enroll_directory(index, directory, embedder, face_detector):
+    # Each sub-directory name is an identity and its images are that person's faces
+    import cv2
+
+    enrolled = 0
+    for identity in sorted(os.listdir(directory)):
+        person_dir = os.path.join(directory, identity)
+        if not os.path.isdir(person_dir):
+            continue
+        for name in sorted(os.listdir(person_dir)):
+            image = cv2.imread(os.path.join(person_dir, name))
+            if image is None:
+                continue
+            face = largest_face(image, face_detector)
+            if face is None:
+                print(f"No face found in {os.path.join(identity, name)}")
+                continue
+            index.add(identity, embedder.embed(face))
+            enrolled += 1
+    index.save()
+    return enrolled
+
+
+def benchmark_search(count=100000, dim=512, queries=100, directory=None):
+    # Builds a random index and times exact and approximate queries
+    import tempfile
+
+    directory = directory or tempfile.mkdtemp(prefix="face_index_")
+    rng = np.random.default_rng(0)
+    index = FaceIdentityIndex(directory, dim=dim)
+    for start in range(0, count, 10000):
+        n = min(10000, count - start)
+        index.add_many([f"person_{i}" for i in range(start, start + n)],
+                       rng.standard_normal((n, dim)).astype(np.float32))
+    index.save()
+
+    start = time.perf_counter()
+    index = FaceIdentityIndex(directory)
+    load_ms = (time.perf_counter() - start) * 1000.0
+
+    probes = rng.standard_normal((queries, dim)).astype(np.float32)
+    start = time.perf_counter()
+    for q in probes:
+        index.search(q, k=5)
+    exact_ms = (time.perf_counter() - start) * 1000.0 / queries
+
+    index.build_approximate_index()
+    start = time.perf_counter()
+    for q in probes:
+        index.search(q, k=5, approximate=True)
+    approx_ms = (time.perf_counter() - start) * 1000.0 / queries
+
+    return {'count': count, 'load_ms': load_ms, 'exact_ms': exact_ms, 'approx_ms': approx_ms}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Face identity index")
+    parser.add_argument("command", choices=['enroll', 'identify', 'build', 'bench'])
+    parser.add_argument("path", nargs='?', help="Directory of identity folders (enroll) or image (identify)")
+    parser.add_argument("--index", default="face_index", help="Index directory")
+    parser.add_argument("--embedder", choices=['deepface', 'sface'], help="Embedding backend")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Minimum similarity to match")
+    parser.add_argument("--count", type=int, default=100000, help="Number of random faces for bench")
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        result = benchmark_search(args.count)
+        print(f"{result['count']} faces: load {result['load_ms']:.2f} ms, "
+              f"exact search {result['exact_ms']:.2f} ms, approximate search {result['approx_ms']:.2f} ms")
+    elif args.command == 'build':
+        index = FaceIdentityIndex(args.index)
+        index.build_approximate_index()
+        print(f"Built approximate index for {len(index)} faces")
+    else:
+        import cv2
+        from face_detectors import load_face_detector
+
+        embedder = load_face_embedder(args.embedder)
+        face_detector = load_face_detector()
+        index = FaceIdentityIndex(args.index)
+
+        if args.command == 'enroll':
+            enrolled = enroll_directory(index, args.path, embedder, face_detector)
+            print(f"Enrolled {enrolled} faces, index now holds {len(index)} faces")
+        else:
+            image = cv2.imread(args.path)
+            face = largest_face(image, face_detector) if image is not None else None
+            if face is None:
+                print(f"Error: No face found in {args.path}")
+            else:
+                match = index.identify(embedder.embed(face), args.threshold, approximate=index.ivf is not None)
+                print(f"Identity: {match[0]} ({match[1]:.2f})" if match else "Identity: Unknown")
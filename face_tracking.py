@@ -0,0 +1,81 @@
+import itertools
+import time
+
+import numpy as np
+
+from face_detectors import _box_iou
+
+
+class Track:
+    # One face followed across frames
+    def __init__(self, track_id, box, timestamp):
+        self.id = track_id
+        self.box = box
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.hits = 1
+        self.missed = 0
+
+    def duration(self):
+        return self.last_seen - self.first_seen
+
+
+class FaceTracker:
+    # Follows detections across frames by greedy IoU matching. A track that is not matched
+    # keeps its last box until it has been missing for max_missed_time seconds, so a face the
+    # detector drops for a frame or two keeps its identity.
+    def __init__(self, iou_threshold=0.3, max_missed_time=1.0):
+        self.iou_threshold = iou_threshold
+        self.max_missed_time = max_missed_time
+        self.tracks = []
+        self.removed = []
+        self.ids = itertools.count(1)
+
+    def update(self, faces, timestamp=None):
+        # Returns the tracks matched or started this frame; self.tracks also holds tracks that
+        # are currently missing and self.removed the tracks dropped by this update
+        if timestamp is None:
+            timestamp = time.monotonic()
+        boxes = np.asarray(faces, dtype=np.float32).reshape(-1, 4)
+
+        # Candidate pairs, best overlap first
+        pairs = []
+        for t, track in enumerate(self.tracks):
+            if len(boxes):
+                ious = _box_iou(np.asarray(track.box, dtype=np.float32), boxes)
+                pairs += [(iou, t, d) for d, iou in enumerate(ious) if iou >= self.iou_threshold]
+        pairs.sort(reverse=True)
+
+        matched_tracks, matched_faces = set(), set()
+        current = []
+        for _, t, d in pairs:
+            if t in matched_tracks or d in matched_faces:
+                continue
+            matched_tracks.add(t)
+            matched_faces.add(d)
+            track = self.tracks[t]
+            track.box = tuple(int(v) for v in faces[d])
+            track.last_seen = timestamp
+            track.hits += 1
+            track.missed = 0
+            current.append(track)
+
+        # Missing tracks age out
+        kept, self.removed = [], []
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.missed += 1
+                if timestamp - track.last_seen > self.max_missed_time:
+                    self.removed.append(track)
+                    continue
+            kept.append(track)
+
+        # Unmatched detections start new tracks
+        for d, face in enumerate(faces):
+            if d not in matched_faces:
+                track = Track(next(self.ids), tuple(int(v) for v in face), timestamp)
+                kept.append(track)
+                current.append(track)
+
+        self.tracks = kept
+        return current
@@ -0,0 +1,95 @@
+import cv2
+import numpy as np
+
+
+class FrameBufferPool:
+    # Hands out one reusable array per pipeline stage ("frame", "gray", "display", "rgb", ...).
+    # Arrays are only reallocated when the frame size or type changes, so in steady state a
+    # loop does no per-frame large allocations. Allocation counts are kept for reporting.
+    def __init__(self):
+        self.buffers = {}
+        self.pil_images = {}
+        self.photo_images = {}
+        self.requests = 0
+        self.allocations = 0
+        self.allocated_bytes = 0
+
+    def _count_allocation(self, nbytes):
+        self.allocations += 1
+        self.allocated_bytes += nbytes
+
+    def get(self, name, shape, dtype=np.uint8):
+        self.requests += 1
+        buf = self.buffers.get(name)
+        if buf is None or buf.shape != tuple(shape) or buf.dtype != dtype:
+            buf = np.empty(shape, dtype=dtype)
+            self.buffers[name] = buf
+            self._count_allocation(buf.nbytes)
+        return buf
+
+    def read(self, cap, name='frame'):
+        # VideoCapture.read fills the given array in place when its size matches
+        self.requests += 1
+        buf = self.buffers.get(name)
+        ret, frame = cap.read(buf) if buf is not None else cap.read()
+        if ret and frame is not buf:
+            self.buffers[name] = frame
+            self._count_allocation(frame.nbytes)
+        return ret, frame
+
+    def copy(self, src, name='display'):
+        dst = self.get(name, src.shape, src.dtype)
+        np.copyto(dst, src)
+        return dst
+
+    def gray(self, frame, name='gray'):
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.get(name, frame.shape[:2]))
+
+    def rgb(self, frame, name='rgb'):
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self.get(name, frame.shape))
+
+    def resize(self, image, size, name='resized', interpolation=cv2.INTER_AREA):
+        w, h = size
+        dst = self.get(name, (h, w) + image.shape[2:], image.dtype)
+        return cv2.resize(image, (w, h), dst=dst, interpolation=interpolation)
+
+    def pil_image(self, rgb, name='pil'):
+        # Copy an RGB array into a reused PIL image instead of creating one per frame
+        from PIL import Image
+
+        h, w = rgb.shape[:2]
+        self.requests += 1
+        image = self.pil_images.get(name)
+        if image is None or image.size != (w, h):
+            image = Image.new('RGB', (w, h))
+            self.pil_images[name] = image
+            self._count_allocation(w * h * 3)
+        image.frombytes(np.ascontiguousarray(rgb))
+        return image
+
+    def photo_image(self, pil_image, name='photo'):
+        # Paste into the previous PhotoImage when the size is unchanged
+        from PIL import ImageTk
+
+        self.requests += 1
+        photo = self.photo_images.get(name)
+        if photo is not None and (photo.width(), photo.height()) == pil_image.size:
+            photo.paste(pil_image)
+            return photo
+        photo = ImageTk.PhotoImage(image=pil_image)
+        self.photo_images[name] = photo
+        self._count_allocation(pil_image.size[0] * pil_image.size[1] * 3)
+        return photo
+
+    def stats(self):
+        return {
+            'buffers': len(self.buffers) + len(self.pil_images) + len(self.photo_images),
+            'requests': self.requests,
+            'allocations': self.allocations,
+            'allocated_mb': self.allocated_bytes / (1024 * 1024),
+        }
+
+    def summary(self):
+        stats = self.stats()
+        return (f"Buffer pool: {stats['buffers']} buffers, {stats['allocations']} allocations "
+                f"({stats['allocated_mb']:.1f} MB) for {stats['requests']} buffer requests")
@@ -0,0 +1,136 @@
+import cv2
+import numpy as np
+
+# Gate decisions
+GATE_STATIC = 'static'
+GATE_LOCAL = 'local'
+GATE_FULL = 'full'
+
+
+class MotionGate:
+    # Cheap frame differencing on a downsampled gray frame to decide whether face detection
+    # needs to run. The frame is compared against the one used for the last detection, so
+    # slow changes still accumulate until they trigger a detection.
+    def __init__(self, width=160, pixel_threshold=25, static_fraction=0.002, global_fraction=0.3,
+                 padding=0.1, max_static_frames=30):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.static_fraction = static_fraction
+        self.global_fraction = global_fraction
+        self.padding = padding
+        self.max_static_frames = max_static_frames
+
+        self.small = None
+        self.reference = None
+        self.diff = None
+        self.static_frames = 0
+
+        # Metrics
+        self.frames = 0
+        self.static_count = 0
+        self.local_count = 0
+        self.full_count = 0
+
+    def check(self, gray):
+        # Returns (decision, roi) where roi is (x, y, w, h) in full resolution for GATE_LOCAL
+        self.frames += 1
+        h, w = gray.shape[:2]
+        small_h = max(1, int(h * self.width / w))
+
+        if self.small is None or self.small.shape != (small_h, self.width):
+            self.small = np.empty((small_h, self.width), dtype=np.uint8)
+            self.diff = np.empty_like(self.small)
+            self.reference = None
+
+        cv2.resize(gray, (self.width, small_h), dst=self.small, interpolation=cv2.INTER_AREA)
+        cv2.GaussianBlur(self.small, (5, 5), 0, dst=self.small)
+
+        if self.reference is None or self.static_frames >= self.max_static_frames:
+            return self._decide(GATE_FULL)
+
+        cv2.absdiff(self.small, self.reference, dst=self.diff)
+        cv2.threshold(self.diff, self.pixel_threshold, 255, cv2.THRESH_BINARY, dst=self.diff)
+        changed = cv2.countNonZero(self.diff) / float(self.diff.size)
+
+        if changed < self.static_fraction:
+            return self._decide(GATE_STATIC)
+        if changed > self.global_fraction:
+            return self._decide(GATE_FULL)
+
+        # Bounding box of the changed pixels, scaled to full resolution and padded
+        x, y, bw, bh = cv2.boundingRect(self.diff)
+        scale = w / float(self.width)
+        pad = int(self.padding * max(w, h))
+        x1 = max(0, int(x * scale) - pad)
+        y1 = max(0, int(y * scale) - pad)
+        x2 = min(w, int((x + bw) * scale) + pad)
+        y2 = min(h, int((y + bh) * scale) + pad)
+        return self._decide(GATE_LOCAL, (x1, y1, x2 - x1, y2 - y1))
+
+    def _decide(self, decision, roi=None):
+        if decision == GATE_STATIC:
+            self.static_frames += 1
+            self.static_count += 1
+        else:
+            # Detection will run, so this frame becomes the new reference
+            self.static_frames = 0
+            if self.reference is None:
+                self.reference = self.small.copy()
+            else:
+                np.copyto(self.reference, self.small)
+            if decision == GATE_LOCAL:
+                self.local_count += 1
+            else:
+                self.full_count += 1
+        return decision, roi
+
+    def hit_rate(self):
+        # Fraction of frames where full-frame detection was avoided
+        if self.frames == 0:
+            return 0.0
+        return (self.static_count + self.local_count) / float(self.frames)
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'static': self.static_count,
+            'local': self.local_count,
+            'full': self.full_count,
+            'hit_rate': self.hit_rate(),
+        }
+
+    def summary(self):
+        stats = self.stats()
+        return (f"Motion gate: {stats['frames']} frames, {stats['static']} skipped, "
+                f"{stats['local']} local, {stats['full']} full ({stats['hit_rate'] * 100:.0f}% gated)")
+
+
+def _overlaps(box, roi):
+    x, y, w, h = box
+    rx, ry, rw, rh = roi
+    return x < rx + rw and rx < x + w and y < ry + rh and ry < y + h
+
+
+def detect_with_gate(gate, face_detector, gray, previous_faces, **params):
+    # Runs face detection only where the gate says the frame changed.
+    # Returns (faces, decision); faces is a list of (x, y, w, h) tuples.
+    decision, roi = gate.check(gray)
+
+    if decision == GATE_STATIC and previous_faces is not None:
+        return previous_faces, decision
+
+    if decision == GATE_LOCAL and previous_faces is not None:
+        # Grow the region to include previous faces it touches so they are re-detected whole
+        rx1, ry1, rw, rh = roi
+        rx2, ry2 = rx1 + rw, ry1 + rh
+        for (x, y, w, h) in previous_faces:
+            if _overlaps((x, y, w, h), (rx1, ry1, rx2 - rx1, ry2 - ry1)):
+                rx1, ry1 = min(rx1, x), min(ry1, y)
+                rx2, ry2 = max(rx2, x + w), max(ry2, y + h)
+
+        kept = [f for f in previous_faces if not _overlaps(f, (rx1, ry1, rx2 - rx1, ry2 - ry1))]
+        found = face_detector.detectMultiScale(gray[ry1:ry2, rx1:rx2], **params)
+        return kept + [(int(x) + rx1, int(y) + ry1, int(w), int(h)) for (x, y, w, h) in found], decision
+
+    faces = face_detector.detectMultiScale(gray, **params)
+    return [tuple(int(v) for v in f) for f in faces], GATE_FULL
@@ -0,0 +1,139 @@
+import json
+import os
+import socket
+import sys
+import time
+from urllib.parse import urlsplit
+
+from face_tracking import FaceTracker
+
+# Event types
+ENTERED = 'entered'
+LEFT = 'left'
+COUNT_CHANGED = 'count_changed'
+
+
+class JsonLinesSink:
+    # Writes one JSON object per event to a file ("-" for stdout), flushed per event
+    def __init__(self, path):
+        self.file = sys.stdout if path == '-' else open(path, 'a')
+
+    def __call__(self, event):
+        self.file.write(json.dumps(event, separators=(',', ':')) + "\n")
+        self.file.flush()
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class SocketSink:
+    # Sends events as JSON lines to udp://host:port (one datagram per event) or tcp://host:port.
+    # A dropped TCP connection is reopened on the next event; events in between are lost.
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.scheme = parts.scheme
+        self.address = (parts.hostname, parts.port)
+        self.sock = None
+        if self.scheme == 'udp':
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def __call__(self, event):
+        data = (json.dumps(event, separators=(',', ':')) + "\n").encode()
+        try:
+            if self.scheme == 'udp':
+                self.sock.sendto(data, self.address)
+                return
+            if self.sock is None:
+                self.sock = socket.create_connection(self.address, timeout=1.0)
+            self.sock.sendall(data)
+        except OSError as e:
+            print(f"Event socket error: {e}")
+            if self.scheme == 'tcp' and self.sock is not None:
+                self.sock.close()
+                self.sock = None
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+
+
+def open_event_sink(target=None):
+    # Callable, file path, "-", udp://host:port or tcp://host:port; defaults to FACE_DETECT_EVENTS
+    if target is None:
+        target = os.environ.get("FACE_DETECT_EVENTS")
+    if not target or callable(target):
+        return target
+    if target.startswith(('udp://', 'tcp://')):
+        return SocketSink(target)
+    return JsonLinesSink(target)
+
+
+class PresenceMonitor:
+    # Turns per-frame face boxes into debounced presence events. A tracked face is reported as
+    # entered once it has been seen for `window` seconds and as left once it has been missing
+    # for `window` seconds, so detector flicker produces no events. A count_changed event
+    # follows whenever the number of present faces changes.
+    def __init__(self, sink=None, window=None, iou_threshold=0.3):
+        self.sink = sink
+        self.window = float(os.environ.get("FACE_DETECT_EVENT_WINDOW", 0.5)) if window is None else window
+        self.tracker = FaceTracker(iou_threshold, max_missed_time=self.window)
+        self.present = set()
+        self.count = 0
+
+        # Metrics
+        self.frames = 0
+        self.events = 0
+        self.event_bytes = 0
+        self.frame_bytes = 0
+
+    @classmethod
+    def from_env(cls):
+        # A monitor writing to FACE_DETECT_EVENTS, or None when it is not set
+        sink = open_event_sink()
+        return cls(sink) if sink else None
+
+    def update(self, faces, timestamp=None):
+        # Call once per frame with the detected (x, y, w, h) boxes; returns the events emitted
+        if timestamp is None:
+            timestamp = time.monotonic()
+        self.frames += 1
+        # Size of the per-frame output this replaces
+        self.frame_bytes += len(json.dumps({'t': round(timestamp, 3), 'faces': [list(map(int, f)) for f in faces]}))
+
+        self.tracker.update(faces, timestamp)
+        events = []
+        for track in self.tracker.removed:
+            if track.id in self.present:
+                self.present.discard(track.id)
+                events.append(self._event(LEFT, timestamp, track))
+        for track in self.tracker.tracks:
+            if track.id not in self.present and track.missed == 0 and track.duration() >= self.window:
+                self.present.add(track.id)
+                events.append(self._event(ENTERED, timestamp, track))
+
+        if len(self.present) != self.count:
+            self.count = len(self.present)
+            events.append({'event': COUNT_CHANGED, 't': round(timestamp, 3), 'count': self.count})
+
+        for event in events:
+            self._emit(event)
+        return events
+
+    def _event(self, kind, timestamp, track):
+        return {'event': kind, 't': round(timestamp, 3), 'id': track.id, 'box': list(track.box)}
+
+    def _emit(self, event):
+        self.events += 1
+        self.event_bytes += len(json.dumps(event, separators=(',', ':'))) + 1
+        if self.sink:
+            self.sink(event)
+
+    def close(self):
+        if hasattr(self.sink, 'close'):
+            self.sink.close()
+
+    def summary(self):
+        ratio = self.frame_bytes / self.event_bytes if self.event_bytes else 0.0
+        return (f"Presence events: {self.events} events for {self.frames} frames, "
+                f"{self.event_bytes} bytes vs {self.frame_bytes} bytes of per-frame boxes ({ratio:.0f}x less)")
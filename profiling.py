@@ -0,0 +1,174 @@
+import argparse
+import cProfile
+import collections
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+
+def add_profile_arguments(parser):
+    group = parser.add_argument_group("profiling")
+    group.add_argument("--profile", action="store_true",
+                       help="Record CPU and memory profiles for a window of frames")
+    group.add_argument("--profile-start", type=int, default=30,
+                       help="Frame at which profiling starts (default: 30)")
+    group.add_argument("--profile-frames", type=int, default=300,
+                       help="Number of frames to profile (default: 300)")
+    group.add_argument("--profile-dir", default="profiles",
+                       help="Directory for profile output (default: profiles)")
+    group.add_argument("--profile-top", type=int, default=15,
+                       help="Number of hot functions and allocation sites to summarize")
+    return parser
+
+
+class _StackSampler(threading.Thread):
+    # Samples the call stack of one thread at a fixed interval and counts identical stacks.
+    # The counts are written in the collapsed "folded" format read by flamegraph.pl and speedscope.
+    def __init__(self, thread_id, interval=0.001):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+    def write_folded(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class FrameProfiler:
+    # Captures a cProfile profile, sampled stacks and tracemalloc snapshots for a window of
+    # frames. Call tick() once per processed frame from the processing thread and finish()
+    # when the loop ends. Does nothing unless enabled.
+    def __init__(self, enabled=False, output_dir="profiles", start_frame=30, num_frames=300, top=15,
+                 name="face_detection"):
+        self.enabled = enabled
+        self.output_dir = output_dir
+        self.start_frame = start_frame
+        self.num_frames = num_frames
+        self.top = top
+        self.name = name
+
+        self.frame_count = 0
+        self.capturing = False
+        self.done = False
+        self.profiler = None
+        self.sampler = None
+        self.start_snapshot = None
+        self.start_time = None
+        self.written = []
+        self.summary_text = ""
+
+    @classmethod
+    def from_command_line(cls, argv=None, name=None):
+        # Only the profiling options are parsed, everything else on the command line is ignored
+        parser = add_profile_arguments(argparse.ArgumentParser(add_help=False))
+        args, _ = parser.parse_known_args(sys.argv[1:] if argv is None else argv)
+        return cls.from_args(args, name)
+
+    @classmethod
+    def from_args(cls, args, name=None):
+        name = name or os.path.splitext(os.path.basename(sys.argv[0]))[0] or "face_detection"
+        return cls(enabled=args.profile, output_dir=args.profile_dir, start_frame=args.profile_start,
+                   num_frames=args.profile_frames, top=args.profile_top, name=name)
+
+    def tick(self):
+        if not self.enabled or self.done:
+            return
+
+        self.frame_count += 1
+        if not self.capturing and self.frame_count >= self.start_frame:
+            self._start()
+        elif self.capturing and self.frame_count >= self.start_frame + self.num_frames:
+            self._stop()
+
+    def _start(self):
+        print(f"Profiling frames {self.frame_count} to {self.frame_count + self.num_frames}...")
+        tracemalloc.start(10)
+        self.start_snapshot = tracemalloc.take_snapshot()
+        self.sampler = _StackSampler(threading.get_ident())
+        self.sampler.start()
+        self.profiler = cProfile.Profile()
+        self.start_time = time.perf_counter()
+        self.capturing = True
+        self.profiler.enable()
+
+    def _stop(self):
+        self.profiler.disable()
+        elapsed = time.perf_counter() - self.start_time
+        frames = self.frame_count - self.start_frame
+        self.sampler.stop()
+        end_snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        self.capturing = False
+        self.done = True
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"{self.name}_{time.strftime('%Y%m%d_%H%M%S')}")
+
+        # pstats file for snakeviz / gprof2dot / flameprof, folded stacks for flamegraph.pl / speedscope
+        self.profiler.dump_stats(base + ".prof")
+        self.sampler.write_folded(base + ".folded")
+        end_snapshot.dump(base + ".tracemalloc")
+        self.written = [base + ".prof", base + ".folded", base + ".tracemalloc"]
+
+        self.summary_text = self._summarize(end_snapshot, elapsed, frames)
+        with open(base + "_summary.txt", 'w') as f:
+            f.write(self.summary_text)
+        self.written.append(base + "_summary.txt")
+
+    def _summarize(self, end_snapshot, elapsed, frames):
+        out = io.StringIO()
+        fps = frames / elapsed if elapsed > 0 else 0.0
+        out.write(f"Profiled {frames} frames in {elapsed:.2f}s ({fps:.1f} fps)\n\n")
+
+        out.write(f"Top {self.top} functions by own time:\n")
+        stats = pstats.Stats(self.profiler, stream=out)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(self.top)
+
+        out.write(f"Top {self.top} allocation sites (live at end of window):\n")
+        for stat in end_snapshot.statistics('lineno')[:self.top]:
+            out.write(f"  {stat}\n")
+
+        out.write(f"\nTop {self.top} allocation growth during window:\n")
+        for stat in end_snapshot.compare_to(self.start_snapshot, 'lineno')[:self.top]:
+            out.write(f"  {stat}\n")
+        return out.getvalue()
+
+    def finish(self):
+        # Stops an unfinished capture window and prints the summary
+        if not self.enabled:
+            return
+        if self.capturing:
+            self._stop()
+        if not self.done:
+            print(f"Profiling did not start: only {self.frame_count} frames were processed "
+                  f"(profiling starts at frame {self.start_frame})")
+            return
+        if self.summary_text:
+            print(self.summary_text)
+            print("Profile files:")
+            for path in self.written:
+                print(f"  {path}")
+            self.summary_text = ""
@@ -0,0 +1,220 @@
+import cv2
+import numpy as np
+
+from face_detectors import load_lbp_cascade
+
+# Proposal methods
+SKIN = 'skin'
+FOREGROUND = 'foreground'
+LBP = 'lbp'
+PROPOSAL_METHODS = [SKIN, FOREGROUND, LBP]
+
+# Skin tone range in YCrCb
+SKIN_LOWER = np.array([0, 133, 77], dtype=np.uint8)
+SKIN_UPPER = np.array([255, 173, 127], dtype=np.uint8)
+
+
+def _merge_regions(regions):
+    # Replaces overlapping regions by their union until none overlap, so no area is scanned twice
+    regions = [list(r) for r in regions]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                ax1, ay1, ax2, ay2 = regions[i]
+                bx1, by1, bx2, by2 = regions[j]
+                if ax1 < bx2 and bx1 < ax2 and ay1 < by2 and by1 < ay2:
+                    regions[i] = [min(ax1, bx1), min(ay1, by1), max(ax2, bx2), max(ay2, by2)]
+                    del regions[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [(x1, y1, x2 - x1, y2 - y1) for (x1, y1, x2, y2) in regions]
+
+
+class RegionProposer:
+    # Finds regions that may contain a face on a small copy of the frame, so the face cascade
+    # only has to scan those: skin-colored blobs in YCrCb, moving foreground from a MOG2
+    # background model, or the boxes of a loose low-resolution LBP cascade pass.
+    def __init__(self, method=SKIN, width=160, padding=0.5, min_blob_area=6, lbp_cascade=None):
+        self.method = method
+        self.width = width
+        self.padding = padding
+        self.min_blob_area = min_blob_area
+        self.kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+        self.small = None
+
+        if method == LBP:
+            self.lbp_cascade = load_lbp_cascade(lbp_cascade)
+            if self.lbp_cascade is None:
+                print("Falling back to skin tone proposals.")
+                self.method = SKIN
+        elif method == FOREGROUND:
+            self.subtractor = cv2.createBackgroundSubtractorMOG2(history=300, varThreshold=16, detectShadows=False)
+        elif method != SKIN:
+            raise ValueError(f"Unknown region proposal method: {method}")
+
+    def _blob_boxes(self, image):
+        # Blob bounding boxes in small image coordinates and the small-to-full scale
+        h, w = image.shape[:2]
+        small_h = max(1, int(h * self.width / w))
+        self.small = cv2.resize(image, (self.width, small_h), dst=self.small, interpolation=cv2.INTER_AREA)
+
+        if self.method == SKIN:
+            ycrcb = cv2.cvtColor(self.small, cv2.COLOR_BGR2YCrCb)
+            mask = cv2.inRange(ycrcb, SKIN_LOWER, SKIN_UPPER)
+        else:
+            mask = self.subtractor.apply(self.small)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, self.kernel)
+        mask = cv2.dilate(mask, self.kernel)
+
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        boxes = [tuple(stats[i, :4]) for i in range(1, count) if stats[i, cv2.CC_STAT_AREA] >= self.min_blob_area]
+        return boxes, w / float(self.width)
+
+    def _lbp_boxes(self, gray, min_size):
+        # Loose LBP pass at the lowest resolution where min_size still covers the 24 pixel window
+        scale = min(1.0, 24.0 / min_size[0])
+        small = gray if scale == 1.0 else cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        boxes = self.lbp_cascade.detectMultiScale(small, scaleFactor=1.2, minNeighbors=2, minSize=(24, 24))
+        return [tuple(b) for b in boxes], 1.0 / scale
+
+    def propose(self, image, min_size=(30, 30), previous=()):
+        # Returns non-overlapping (x, y, w, h) regions in full resolution. Faces found in the
+        # previous frame are always proposed again, so a face that stops moving or whose skin
+        # mask breaks up for a frame is not lost.
+        h, w = image.shape[:2]
+        if self.method == LBP:
+            gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            boxes, scale = self._lbp_boxes(gray, min_size)
+        elif self.method == SKIN and image.ndim == 2:
+            # No color to look at, scan everything
+            return [(0, 0, w, h)]
+        else:
+            boxes, scale = self._blob_boxes(image)
+
+        regions = []
+        for (x, y, bw, bh) in [(bx * scale, by * scale, bw * scale, bh * scale) for (bx, by, bw, bh) in boxes] + list(previous):
+            pad = self.padding * max(bw, bh)
+            # Regions must be large enough for the cascade window
+            pad_x = max(pad, (2 * min_size[0] - bw) / 2.0)
+            pad_y = max(pad, (2 * min_size[1] - bh) / 2.0)
+            regions.append((max(0, int(x - pad_x)), max(0, int(y - pad_y)),
+                            min(w, int(x + bw + pad_x)), min(h, int(y + bh + pad_y))))
+        return _merge_regions(regions)
+
+
+class ProposalDetector:
+    # Wraps a face detector so it only scans the proposed regions. Takes the color frame (skin
+    # proposals need it) or a gray one, like CascadeClassifier.detectMultiScale. When the
+    # regions cover most of the frame a single full scan is cheaper and is used instead.
+    accepts_color = True
+
+    def __init__(self, face_detector, proposer, max_area_fraction=0.6):
+        self.face_detector = face_detector
+        self.proposer = proposer
+        self.max_area_fraction = max_area_fraction
+        self.previous = []
+        self.regions = []
+
+        # Metrics
+        self.frames = 0
+        self.full_scans = 0
+        self.scanned_fraction = 0.0
+
+    def detectMultiScale(self, image, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30), maxSize=None):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        height, width = gray.shape[:2]
+        params = {'scaleFactor': scaleFactor, 'minNeighbors': minNeighbors, 'minSize': minSize}
+        if maxSize:
+            params['maxSize'] = maxSize
+
+        self.regions = self.proposer.propose(image, minSize, self.previous)
+        fraction = sum(w * h for (_, _, w, h) in self.regions) / float(width * height)
+        self.frames += 1
+
+        if fraction > self.max_area_fraction:
+            self.full_scans += 1
+            self.scanned_fraction += 1.0
+            faces = [tuple(int(v) for v in f) for f in self.face_detector.detectMultiScale(gray, **params)]
+        else:
+            self.scanned_fraction += fraction
+            faces = []
+            for (x, y, w, h) in self.regions:
+                found = self.face_detector.detectMultiScale(gray[y:y+h, x:x+w], **params)
+                faces += [(int(fx) + x, int(fy) + y, int(fw), int(fh)) for (fx, fy, fw, fh) in found]
+        self.previous = faces
+        return faces
+
+    def summary(self):
+        frames = max(1, self.frames)
+        return (f"Region proposals ({self.proposer.method}): {self.frames} frames, "
+                f"{self.scanned_fraction / frames * 100:.0f}% of the frame scanned on average, "
+                f"{self.full_scans} full scans")
+
+
+def _coverage(faces, regions):
+    # Fraction of faces lying entirely inside a proposed region
+    if len(faces) == 0:
+        return 1.0
+    inside = sum(1 for (x, y, w, h) in faces
+                 if any(rx <= x and ry <= y and x + w <= rx + rw and y + h <= ry + rh for (rx, ry, rw, rh) in regions))
+    return inside / float(len(faces))
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from concurrency import configure_threads
+    from face_detectors import DETECTOR_BACKENDS, load_face_detector
+    from tiled_detection import _recall
+    from video_sources import ReplaySource
+
+    parser = argparse.ArgumentParser(description="Compare proposal-guided and full-frame face detection")
+    parser.add_argument("input", help="Video file, image directory or glob pattern")
+    parser.add_argument("--method", default=SKIN, choices=PROPOSAL_METHODS, help="Region proposal method")
+    parser.add_argument("--frames", type=int, default=300, help="Maximum number of frames")
+    parser.add_argument("--backend", choices=DETECTOR_BACKENDS, help="Face detector backend")
+    args = parser.parse_args()
+
+    # Configure OpenCV/TensorFlow threads and CPU affinity
+    configure_threads()
+
+    face_detector = load_face_detector(args.backend)
+    proposal_detector = ProposalDetector(face_detector, RegionProposer(args.method))
+    params = {'scaleFactor': 1.1, 'minNeighbors': 5, 'minSize': (30, 30)}
+
+    cap = ReplaySource(args.input, realtime=False)
+    full_time = proposal_time = 0.0
+    coverage = recall = 0.0
+    frames = 0
+    while frames < args.frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        start = time.perf_counter()
+        full = face_detector.detectMultiScale(gray, **params)
+        full_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        proposed = proposal_detector.detectMultiScale(frame, **params)
+        proposal_time += time.perf_counter() - start
+
+        coverage += _coverage(full, proposal_detector.regions)
+        recall += _recall(full, proposed)
+        frames += 1
+    cap.release()
+
+    if frames == 0:
+        print(f"Error: Could not read frames from {args.input}")
+        raise SystemExit(1)
+    print(proposal_detector.summary())
+    print(f"Full scan:      {full_time / frames * 1000:.1f} ms/frame")
+    print(f"Proposals:      {proposal_time / frames * 1000:.1f} ms/frame ({full_time / proposal_time:.1f}x faster)")
+    print(f"Coverage of full-scan faces by proposed regions: {coverage / frames * 100:.1f}%, "
+          f"recall {recall / frames * 100:.1f}%")
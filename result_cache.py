@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Bump when the stored result format changes so old entries are ignored
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".face_detection_cache.sqlite")
+
+
+def file_content_hash(path, chunk_size=1024 * 1024):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def parameter_fingerprint(backend, params):
+    # Any change to the backend or its parameters gives a different fingerprint
+    payload = json.dumps({'version': CACHE_VERSION, 'backend': backend, 'params': params},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    # Persistent detection results keyed by image content hash plus a fingerprint of the
+    # backend and parameters that produced them. File hashes are remembered by path, size
+    # and modification time so unchanged files are not re-read on later runs.
+    def __init__(self, path=None):
+        self.path = path or os.environ.get("FACE_DETECT_CACHE", DEFAULT_CACHE_PATH)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, content_hash TEXT)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "content_hash TEXT, fingerprint TEXT, result TEXT, created REAL, "
+            "PRIMARY KEY (content_hash, fingerprint))")
+        self.conn.commit()
+
+    def content_hash(self, path):
+        path = os.path.abspath(path)
+        st = os.stat(path)
+
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT size, mtime_ns, content_hash FROM files WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+
+        # New or modified file
+        content_hash = file_content_hash(path)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, content_hash) VALUES (?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime_ns, content_hash))
+            self.conn.commit()
+        return content_hash
+
+    def get(self, path, backend, params):
+        key = (self.content_hash(path), parameter_fingerprint(backend, params))
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT result FROM results WHERE content_hash = ? AND fingerprint = ?", key).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, path, backend, params, result):
+        key = (self.content_hash(path), parameter_fingerprint(backend, params))
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results (content_hash, fingerprint, result, created) "
+                "VALUES (?, ?, ?, ?)", key + (json.dumps(result, default=_to_json), time.time()))
+            self.conn.commit()
+
+    def get_or_compute(self, path, backend, params, compute):
+        # compute(path) is only called when there is no cached result
+        result = self.get(path, backend, params)
+        if result is None:
+            result = compute(path)
+            self.put(path, backend, params, result)
+            result = json.loads(json.dumps(result, default=_to_json))
+        return result
+
+    def prune(self):
+        # Forget files that no longer exist
+        with self.lock:
+            paths = [row[0] for row in self.conn.execute("SELECT path FROM files")]
+            missing = [(p,) for p in paths if not os.path.exists(p)]
+            self.conn.executemany("DELETE FROM files WHERE path = ?", missing)
+            self.conn.commit()
+        return len(missing)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def _to_json(value):
+    # NumPy arrays and scalars (e.g. detectMultiScale boxes) are stored as plain lists/numbers
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"Cannot cache value of type {type(value).__name__}")
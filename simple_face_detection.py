@@ -1,9 +1,20 @@
 import cv2
 import time
+from face_detectors import load_face_detector
+from concurrency import configure_threads
+from frame_buffers import FrameBufferPool
+from profiling import FrameProfiler
+from video_sources import open_video_source
 
 def main():
+    # Configure OpenCV/TensorFlow threads and CPU affinity
+    configure_threads()
+    
+    # Optional --profile capture window
+    profiler = FrameProfiler.from_command_line()
+    
     # Initialize webcam
-    cap = cv2.VideoCapture(0)
+    cap = open_video_source()
     
     # Check if webcam is opened correctly
     if not cap.isOpened():
@@ -11,7 +22,7 @@ def main():
         return
     
     # Face cascade classifier
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    face_cascade = load_face_detector()
     
     # Eye cascade classifier for additional detection
     eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
@@ -21,16 +32,19 @@ def main():
     
     print("Simple Face Detection App Started. Press 'q' to quit.")
     
+    # Reusable per-stage frame buffers
+    buffer_pool = FrameBufferPool()
+    
     while True:
         # Capture frame-by-frame
-        ret, frame = cap.read()
+        ret, frame = buffer_pool.read(cap)
         
         if not ret:
             print("Error: Failed to capture image")
             break
         
         # Convert to grayscale for face detection
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        gray = buffer_pool.gray(frame)
         
         # Detect faces
         faces = face_cascade.detectMultiScale(
@@ -73,10 +87,19 @@ def main():
         # Display the resulting frame
         cv2.imshow('Simple Face Detection', frame)
         
+        # Advance the profiling window
+        profiler.tick()
+        
         # Break the loop when 'q' is pressed
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
     
+    # Write and summarize profiles if --profile was given
+    profiler.finish()
+    
+    # Report frame buffer allocations
+    print(buffer_pool.summary())
+    
     # Release resources
     cap.release()
     cv2.destroyAllWindows()
@@ -1,9 +1,13 @@
 import cv2
 import tkinter as tk
 from tkinter import ttk, messagebox
-from PIL import Image, ImageTk
 import threading
 import time
+from face_detectors import load_face_detector
+from concurrency import configure_threads
+from frame_buffers import FrameBufferPool
+from profiling import FrameProfiler
+from video_sources import open_video_source
 
 class SimpleFaceDetectionApp:
     def __init__(self, window):
@@ -61,8 +65,14 @@ class SimpleFaceDetectionApp:
         self.is_running = False
         self.thread = None
         
+        # Reusable per-stage frame buffers
+        self.buffer_pool = FrameBufferPool()
+        
+        # Optional --profile capture window
+        self.profiler = FrameProfiler.from_command_line()
+        
         # Face detection variables
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        self.face_cascade = load_face_detector()
         self.eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
         self.smile_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_smile.xml')
         
@@ -71,7 +81,7 @@ class SimpleFaceDetectionApp:
             return
             
         # Initialize video capture
-        self.cap = cv2.VideoCapture(0)
+        self.cap = open_video_source()
         if not self.cap.isOpened():
             messagebox.showerror("Error", "Could not open webcam")
             return
@@ -103,10 +113,13 @@ class SimpleFaceDetectionApp:
         self.status_var.set("Stopped")
         self.video_label.config(image="")
         
+        # Report frame buffer allocations
+        print(self.buffer_pool.summary())
+        
     def video_loop(self):
         try:
             while self.is_running:
-                ret, frame = self.cap.read()
+                ret, frame = self.buffer_pool.read(self.cap)
                 if not ret:
                     self.status_var.set("Error: Failed to capture image")
                     break
@@ -114,26 +127,35 @@ class SimpleFaceDetectionApp:
                 # Process the frame
                 processed_frame = self.process_frame(frame)
                 
-                # Convert to PhotoImage
-                cv2image = cv2.cvtColor(processed_frame, cv2.COLOR_BGR2RGB)
-                img = Image.fromarray(cv2image)
-                imgtk = ImageTk.PhotoImage(image=img)
+                # Display the frame
+                self.show_frame(processed_frame)
                 
-                # Update the video label
-                self.video_label.imgtk = imgtk
-                self.video_label.config(image=imgtk)
+                # Advance the profiling window
+                self.profiler.tick()
                 
                 # Process at 30 fps
                 time.sleep(0.033)
         except Exception as e:
             self.status_var.set(f"Error: {str(e)}")
         finally:
+            # Write and summarize profiles if --profile was given
+            self.profiler.finish()
             if self.is_running:
                 self.stop_video()
     
+    def show_frame(self, processed_frame):
+        # Convert to PhotoImage, reusing the RGB, PIL and PhotoImage buffers
+        cv2image = self.buffer_pool.rgb(processed_frame)
+        img = self.buffer_pool.pil_image(cv2image)
+        imgtk = self.buffer_pool.photo_image(img)
+        
+        # Update the video label
+        self.video_label.imgtk = imgtk
+        self.video_label.config(image=imgtk)
+    
     def process_frame(self, frame):
         # Convert to grayscale for face detection
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        gray = self.buffer_pool.gray(frame)
         
         # Detect faces
         faces = self.face_cascade.detectMultiScale(
@@ -186,6 +208,9 @@ class SimpleFaceDetectionApp:
         self.window.destroy()
 
 def main():
+    # Configure OpenCV/TensorFlow threads and CPU affinity
+    configure_threads()
+    
     # Create the main window
     root = tk.Tk()
     app = SimpleFaceDetectionApp(root)
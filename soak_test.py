@@ -0,0 +1,259 @@
+import argparse
+import collections
+import csv
+import gc
+import importlib
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+# Soak targets: name -> (module, app class, whether the constructor takes a title)
+GUI_TARGETS = {
+    'enhanced-gui': ('enhanced_face_detection_gui', 'EnhancedFaceDetectionApp', False),
+    'simple-gui': ('simple_face_detection_gui', 'SimpleFaceDetectionApp', False),
+    'deepface-gui': ('face_detection_gui', 'FaceDetectionApp', False),
+    'opencv-gui': ('face_detection_gui_opencv_py313', 'FaceDetectionApp', True),
+    'mediapipe-gui': ('face_detection_gui_py313', 'FaceDetectionApp', True),
+}
+TARGETS = sorted(GUI_TARGETS) + ['detector']
+
+
+def current_rss_mb():
+    # Resident set size of this process in MB
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        # Peak rather than current RSS, still shows growth
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        return 0.0
+
+
+def object_type_counts():
+    return collections.Counter(type(o).__name__ for o in gc.get_objects())
+
+
+def synthetic_frames(width=1280, height=720, count=60, seed=0):
+    # Textured background with moving bright ellipses, so every frame is different
+    rng = np.random.default_rng(seed)
+    background = cv2.GaussianBlur(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), (21, 21), 0)
+    frames = []
+    for i in range(count):
+        frame = background.copy()
+        for k in range(3):
+            cx = int((0.2 + 0.3 * k) * width + 40 * np.sin(i / 7.0 + k))
+            cy = int(0.5 * height + 30 * np.cos(i / 5.0 + k))
+            cv2.ellipse(frame, (cx, cy), (60, 80), 0, 0, 360, (180, 190, 220), -1)
+            cv2.circle(frame, (cx - 20, cy - 20), 8, (40, 40, 40), -1)
+            cv2.circle(frame, (cx + 20, cy - 20), 8, (40, 40, 40), -1)
+        frames.append(frame)
+    return frames
+
+
+def replay_frames(path, limit=300):
+    from video_sources import ReplaySource
+
+    cap = ReplaySource(path, realtime=False)
+    frames = []
+    while len(frames) < limit:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def build_target(name):
+    # Returns (step(frame), close()) running the real processing and display path of a target
+    if name == 'detector':
+        from face_detectors import load_face_detector
+
+        face_detector = load_face_detector()
+
+        def step(frame):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            face_detector.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+
+        return step, lambda: None
+
+    import tkinter as tk
+
+    module_name, class_name, takes_title = GUI_TARGETS[name]
+    app_class = getattr(importlib.import_module(module_name), class_name)
+    root = tk.Tk()
+    root.withdraw()
+    app = app_class(root, "Soak Test") if takes_title else app_class(root)
+
+    if hasattr(app, 'process_frame'):
+        def step(frame):
+            app.show_frame(app.process_frame(frame))
+            root.update()
+    elif name == 'mediapipe-gui':
+        def step(frame):
+            app.display_image(app.detect_faces(frame), is_rgb=True)
+            root.update()
+    else:
+        def step(frame):
+            app.display_image(app.detect_faces(frame))
+            root.update()
+
+    return step, root.destroy
+
+
+def _slope_per_hour(times, values):
+    if len(times) < 2:
+        return 0.0
+    slope = np.polyfit(np.asarray(times), np.asarray(values), 1)[0]
+    return slope * 3600.0
+
+
+def analyze(samples, warmup_fraction=0.1, rss_growth_mb_per_hour=5.0, object_growth_per_hour=2000.0,
+            fps_decay=0.15):
+    # Flags monotonic memory/object growth and throughput decay after the warm-up samples
+    samples = samples[int(len(samples) * warmup_fraction):]
+    report = {'flags': []}
+    if len(samples) < 6:
+        report['flags'].append("too few samples to analyze")
+        return report
+
+    times = [s['time_s'] for s in samples]
+    third = len(samples) // 3
+    first, last = samples[:third], samples[-third:]
+
+    def mean(rows, key):
+        return sum(r[key] for r in rows) / len(rows)
+
+    report['rss_mb_per_hour'] = _slope_per_hour(times, [s['rss_mb'] for s in samples])
+    report['objects_per_hour'] = _slope_per_hour(times, [s['objects'] for s in samples])
+    report['fps_start'] = mean(first, 'fps')
+    report['fps_end'] = mean(last, 'fps')
+
+    if (report['rss_mb_per_hour'] > rss_growth_mb_per_hour
+            and mean(last, 'rss_mb') > mean(first, 'rss_mb')):
+        report['flags'].append(f"memory growth: {report['rss_mb_per_hour']:.1f} MB/hour")
+    if (report['objects_per_hour'] > object_growth_per_hour
+            and mean(last, 'objects') > mean(first, 'objects')):
+        report['flags'].append(f"object growth: {report['objects_per_hour']:.0f} objects/hour")
+    if report['fps_end'] < report['fps_start'] * (1.0 - fps_decay):
+        report['flags'].append(f"throughput decay: {report['fps_start']:.1f} -> {report['fps_end']:.1f} fps")
+    return report
+
+
+def run_soak(step, frames, duration, sample_interval, csv_path=None):
+    samples = []
+    writer = None
+    csv_file = None
+    if csv_path:
+        csv_file = open(csv_path, 'w', newline='')
+        writer = csv.DictWriter(csv_file, fieldnames=['time_s', 'frames', 'fps', 'rss_mb', 'objects'])
+        writer.writeheader()
+
+    start = time.perf_counter()
+    last_sample = start
+    frames_done = 0
+    frames_at_last_sample = 0
+    first_types = object_type_counts()
+    work = None
+
+    try:
+        # Frames are fed back to back, faster than a real camera
+        while time.perf_counter() - start < duration:
+            # The targets draw on the frame in place, so each step gets a fresh copy of the
+            # source frame in one reused buffer
+            frame = frames[frames_done % len(frames)]
+            if work is None or work.shape != frame.shape:
+                work = np.empty_like(frame)
+            np.copyto(work, frame)
+            step(work)
+            frames_done += 1
+
+            now = time.perf_counter()
+            if now - last_sample >= sample_interval:
+                sample = {
+                    'time_s': round(now - start, 2),
+                    'frames': frames_done,
+                    'fps': round((frames_done - frames_at_last_sample) / (now - last_sample), 2),
+                    'rss_mb': round(current_rss_mb(), 2),
+                    'objects': len(gc.get_objects()),
+                }
+                samples.append(sample)
+                if writer:
+                    writer.writerow(sample)
+                    csv_file.flush()
+                print(f"[{sample['time_s']:8.1f}s] {sample['fps']:6.1f} fps  "
+                      f"{sample['rss_mb']:8.1f} MB  {sample['objects']} objects")
+                last_sample = now
+                frames_at_last_sample = frames_done
+    finally:
+        if csv_file:
+            csv_file.close()
+
+    growth = object_type_counts() - first_types
+    return samples, growth.most_common(10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Long-running soak test of the face detection processing path")
+    parser.add_argument("--target", default="enhanced-gui", choices=TARGETS,
+                        help="Processing path to drive (GUI targets need a display)")
+    parser.add_argument("--video", help="Replay frames from this video or image sequence instead of synthetic frames")
+    parser.add_argument("--width", type=int, default=1280, help="Synthetic frame width")
+    parser.add_argument("--height", type=int, default=720, help="Synthetic frame height")
+    parser.add_argument("--hours", type=float, default=1.0, help="Test duration in hours")
+    parser.add_argument("--seconds", type=float, help="Test duration in seconds (overrides --hours)")
+    parser.add_argument("--sample-interval", type=float, default=30.0, help="Seconds between samples")
+    parser.add_argument("--csv", default="soak_samples.csv", help="CSV file for the samples")
+    parser.add_argument("--rss-growth", type=float, default=5.0, help="Flag RSS growth above this many MB/hour")
+    parser.add_argument("--fps-decay", type=float, default=0.15, help="Flag FPS drops larger than this fraction")
+    args = parser.parse_args()
+
+    frames = replay_frames(args.video) if args.video else synthetic_frames(args.width, args.height)
+    if not frames:
+        print(f"Error: Could not read frames from {args.video}")
+        return 2
+
+    duration = args.seconds if args.seconds is not None else args.hours * 3600.0
+    try:
+        step, close = build_target(args.target)
+    except Exception as e:
+        print(f"Error: Could not start target {args.target}: {e}")
+        return 2
+
+    try:
+        samples, growth = run_soak(step, frames, duration, args.sample_interval, args.csv)
+    finally:
+        close()
+
+    report = analyze(samples, rss_growth_mb_per_hour=args.rss_growth, fps_decay=args.fps_decay)
+    print()
+    print(f"RSS trend: {report.get('rss_mb_per_hour', 0.0):+.2f} MB/hour, "
+          f"objects trend: {report.get('objects_per_hour', 0.0):+.0f}/hour, "
+          f"FPS: {report.get('fps_start', 0.0):.1f} -> {report.get('fps_end', 0.0):.1f}")
+    print("Object types with the most growth:")
+    for type_name, count in growth:
+        print(f"  {type_name}: +{count}")
+
+    if report['flags']:
+        for flag in report['flags']:
+            print(f"FLAGGED: {flag}")
+        return 1
+    print("No memory growth or throughput decay detected")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
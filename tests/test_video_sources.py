@@ -0,0 +1,52 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import video_sources
+from video_sources import ReplaySource
+
+
+class FakeClock:
+    # Stands in for time.perf_counter/time.sleep so replay timing is deterministic
+    def __init__(self):
+        self.now = 100.0
+
+    def perf_counter(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def _image_dir(path, count):
+    for i in range(count):
+        cv2.imwrite(str(path / f"{i:03d}.png"), np.full((8, 8, 3), i, dtype=np.uint8))
+    return str(path)
+
+
+def test_drop_late_after_the_first_loop(tmp_path, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(video_sources.time, 'perf_counter', clock.perf_counter)
+    monkeypatch.setattr(video_sources.time, 'sleep', clock.sleep)
+
+    source = ReplaySource(_image_dir(tmp_path, 60), fps=30, loop=True, drop_late=True)
+    for _ in range(60):
+        assert source.read()[0]
+    assert source.stats()['dropped'] == 0
+
+    # 90 ms late after the last frame is 57 ms into the second loop: one frame a camera would
+    # already have replaced
+    clock.now += 0.09
+    assert source.read()[0]
+    assert source.loops == 1
+    assert source.stats()['dropped'] == 1
+
+    # Back on schedule, the rest of the loop is served without drops
+    for _ in range(58):
+        assert source.read()[0]
+    assert source.stats()['dropped'] == 1
+    assert source.stats()['frames'] == 119
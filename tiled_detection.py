@@ -0,0 +1,175 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# Images with more pixels than this are detected in tiles
+TILED_MIN_PIXELS = 8_000_000
+
+
+def tile_grid(width, height, tile_size=2048, overlap=256):
+    # Overlapping (x, y, w, h) tiles covering the image. Any face no larger than the overlap
+    # lies entirely inside at least one tile.
+    stride = max(1, tile_size - overlap)
+    xs = list(range(0, max(1, width - overlap), stride))
+    ys = list(range(0, max(1, height - overlap), stride))
+    return [(x, y, min(tile_size, width - x), min(tile_size, height - y)) for y in ys for x in xs]
+
+
+def merge_boxes(boxes, scores, iou_threshold=0.3, containment_threshold=0.7):
+    # Greedy NMS that also removes boxes mostly inside a better one, which is what a face
+    # cut by a tile border looks like next to the full detection from a neighboring tile
+    if len(boxes) == 0:
+        return []
+    boxes = np.asarray(boxes, dtype=np.float32)
+    scores = np.asarray(scores, dtype=np.float32)
+    areas = boxes[:, 2] * boxes[:, 3]
+    # Higher score first, larger box first among equal scores
+    order = np.lexsort((-areas, -scores))
+
+    keep = []
+    while len(order):
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        x1 = np.maximum(boxes[i, 0], boxes[rest, 0])
+        y1 = np.maximum(boxes[i, 1], boxes[rest, 1])
+        x2 = np.minimum(boxes[i, 0] + boxes[i, 2], boxes[rest, 0] + boxes[rest, 2])
+        y2 = np.minimum(boxes[i, 1] + boxes[i, 3], boxes[rest, 1] + boxes[rest, 3])
+        inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-6)
+        contained = inter / np.maximum(np.minimum(areas[i], areas[rest]), 1e-6)
+        order = rest[(iou <= iou_threshold) & (contained <= containment_threshold)]
+    return [tuple(int(v) for v in boxes[i]) for i in keep]
+
+
+class TiledDetector:
+    # Detects faces in very large images by running a detector on overlapping tiles across a
+    # thread pool (OpenCV releases the GIL) and merging the boxes. Tiles only look for faces up
+    # to the overlap size; larger faces are found by one extra pass on a downscaled copy.
+    # Cascade classifiers are not thread safe, so each worker thread builds its own detector.
+    def __init__(self, detector_factory, tile_size=2048, overlap=256, workers=None):
+        self.detector_factory = detector_factory
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.workers = workers or os.cpu_count() or 1
+        self.local = threading.local()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+
+    def _detector(self):
+        if not hasattr(self.local, 'detector'):
+            self.local.detector = self.detector_factory()
+        return self.local.detector
+
+    def _detect_region(self, image, offset, scale, params):
+        # Returns (boxes, scores) in full image coordinates
+        detector = self._detector()
+        if hasattr(detector, 'detect'):
+            # DNN detectors report a confidence per box; apply the size limits like
+            # DNNFaceDetector.detectMultiScale does
+            found = detector.detect(image)
+            keep = (found[:, 2] >= params['minSize'][0]) & (found[:, 3] >= params['minSize'][1])
+            max_size = params.get('maxSize')
+            if max_size and max_size[0] > 0 and max_size[1] > 0:
+                keep &= (found[:, 2] <= max_size[0]) & (found[:, 3] <= max_size[1])
+            boxes, scores = found[keep, :4], found[keep, 4]
+        elif hasattr(detector, 'detectMultiScale2'):
+            # Cascade: the number of merged neighbors serves as the score
+            boxes, scores = detector.detectMultiScale2(image, **params)
+        else:
+            # Wrapping detectors (two-stage, region proposals) only report boxes
+            boxes = detector.detectMultiScale(image, **params)
+            scores = [1.0] * len(boxes)
+        ox, oy = offset
+        return [(x * scale + ox, y * scale + oy, w * scale, h * scale) for (x, y, w, h) in boxes], list(scores)
+
+    def detectMultiScale(self, image, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30), maxSize=None):
+        # Same arguments and (x, y, w, h) results as CascadeClassifier.detectMultiScale
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        height, width = image.shape[:2]
+        params = {'scaleFactor': scaleFactor, 'minNeighbors': minNeighbors, 'minSize': minSize}
+
+        # Tiles look for faces up to the overlap size
+        tile_params = dict(params, maxSize=(self.overlap, self.overlap))
+        jobs = [self.executor.submit(self._detect_region, image[y:y+h, x:x+w], (x, y), 1.0, tile_params)
+                for (x, y, w, h) in tile_grid(width, height, self.tile_size, self.overlap)]
+
+        # Downscaled pass for faces larger than the overlap, which map to at least twice minSize
+        scale = self.overlap / float(2 * minSize[0])
+        if scale > 1.0 and min(width, height) / scale >= minSize[0]:
+            small = cv2.resize(image, (int(width / scale), int(height / scale)), interpolation=cv2.INTER_AREA)
+            small_params = dict(params)
+            if maxSize:
+                small_params['maxSize'] = (int(maxSize[0] / scale), int(maxSize[1] / scale))
+            jobs.append(self.executor.submit(self._detect_region, small, (0, 0), scale, small_params))
+        else:
+            jobs.append(self.executor.submit(self._detect_region, image, (0, 0), 1.0, params))
+
+        boxes, scores = [], []
+        for job in jobs:
+            found, found_scores = job.result()
+            boxes += found
+            scores += found_scores
+
+        faces = merge_boxes(boxes, scores)
+        if maxSize:
+            faces = [f for f in faces if f[2] <= maxSize[0] and f[3] <= maxSize[1]]
+        return faces
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+def _recall(reference, found, iou_threshold=0.5):
+    # Fraction of reference boxes matched by a found box
+    if len(reference) == 0:
+        return 1.0
+    from face_detectors import _box_iou
+
+    found = np.asarray(found, dtype=np.float32).reshape(-1, 4)
+    matched = sum(1 for box in reference if len(found) and _box_iou(np.asarray(box, np.float32), found).max() >= iou_threshold)
+    return matched / float(len(reference))
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from concurrency import configure_threads
+    from face_detectors import load_face_detector
+
+    parser = argparse.ArgumentParser(description="Compare tiled and full-image face detection on a large image")
+    parser.add_argument("image", help="Large image file")
+    parser.add_argument("--tile-size", type=int, default=2048, help="Tile size in pixels")
+    parser.add_argument("--overlap", type=int, default=256, help="Tile overlap, the largest face a tile finds")
+    parser.add_argument("--workers", type=int, help="Worker threads (default: all CPUs)")
+    args = parser.parse_args()
+
+    # Configure OpenCV/TensorFlow threads and CPU affinity
+    configure_threads()
+
+    image = cv2.imread(args.image)
+    if image is None:
+        print(f"Error: Could not open image file: {args.image}")
+        raise SystemExit(1)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    params = {'scaleFactor': 1.1, 'minNeighbors': 5, 'minSize': (30, 30)}
+
+    start = time.perf_counter()
+    full = load_face_detector().detectMultiScale(gray, **params)
+    full_time = time.perf_counter() - start
+
+    tiled_detector = TiledDetector(load_face_detector, args.tile_size, args.overlap, args.workers)
+    start = time.perf_counter()
+    tiled = tiled_detector.detectMultiScale(gray, **params)
+    tiled_time = time.perf_counter() - start
+    tiled_detector.close()
+
+    print(f"Image: {gray.shape[1]}x{gray.shape[0]}, {len(tile_grid(gray.shape[1], gray.shape[0], args.tile_size, args.overlap))} tiles, "
+          f"{tiled_detector.workers} workers")
+    print(f"Full image: {len(full)} faces in {full_time:.2f}s")
+    print(f"Tiled:      {len(tiled)} faces in {tiled_time:.2f}s ({full_time / tiled_time:.1f}x faster), "
+          f"recall of full-image faces {_recall(full, tiled) * 100:.0f}%")
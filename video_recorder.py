@@ -0,0 +1,125 @@
+import cv2
+import numpy as np
+import queue
+import threading
+
+
+class VideoRecorder:
+    # Writes annotated frames to a video file on a dedicated writer thread.
+    # Frames go through a bounded queue so a slow disk never blocks detection:
+    # once the queue is half full only every other frame is kept, and when it is
+    # full new frames are dropped. Frame copies use a recycled set of buffers.
+    def __init__(self, max_queue=64, fourcc='mp4v'):
+        self.max_queue = max_queue
+        self.fourcc = fourcc
+        self.frames = None
+        self.free_buffers = None
+        self.writer = None
+        self.thread = None
+        self.path = None
+        self.frame_size = None
+        self.is_recording = False
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.frames_received = 0
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.frames_skipped = 0
+        self.buffers_allocated = 0
+
+    def start(self, path, fps, frame_size):
+        if self.is_recording:
+            self.stop()
+
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*self.fourcc), fps, frame_size)
+        if not writer.isOpened():
+            raise IOError(f"Could not open video writer for {path}")
+
+        self.writer = writer
+        self.path = path
+        self.frame_size = frame_size
+        self.frames = queue.Queue(maxsize=self.max_queue)
+        self.free_buffers = queue.Queue()
+        self.reset_stats()
+        self.is_recording = True
+
+        self.thread = threading.Thread(target=self._write_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _get_buffer(self, shape):
+        try:
+            buf = self.free_buffers.get_nowait()
+            if buf.shape == shape:
+                return buf
+        except queue.Empty:
+            pass
+        self.buffers_allocated += 1
+        return np.empty(shape, dtype=np.uint8)
+
+    def write(self, frame):
+        # Never blocks, returns False when the frame was not queued
+        if not self.is_recording:
+            return False
+
+        self.frames_received += 1
+        backlog = self.frames.qsize()
+
+        # Degrade to half frame rate while the writer is falling behind
+        if backlog >= self.max_queue // 2 and self.frames_received % 2 == 0:
+            self.frames_skipped += 1
+            return False
+
+        if backlog >= self.max_queue:
+            self.frames_dropped += 1
+            return False
+
+        # The video writer needs every frame at the size it was opened with
+        w, h = self.frame_size
+        buf = self._get_buffer((h, w, 3))
+        if frame.shape[:2] == (h, w):
+            np.copyto(buf, frame)
+        else:
+            cv2.resize(frame, (w, h), dst=buf)
+
+        try:
+            self.frames.put_nowait(buf)
+        except queue.Full:
+            self.frames_dropped += 1
+            self.free_buffers.put(buf)
+            return False
+        return True
+
+    def _write_loop(self):
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                break
+            self.writer.write(frame)
+            self.frames_written += 1
+            self.free_buffers.put(frame)
+
+    def stop(self):
+        if not self.is_recording:
+            return self.stats()
+
+        # Let the writer drain the queue before closing the file
+        self.is_recording = False
+        self.frames.put(None)
+        self.thread.join()
+        self.writer.release()
+        self.writer = None
+        self.thread = None
+        return self.stats()
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'received': self.frames_received,
+            'written': self.frames_written,
+            'dropped': self.frames_dropped,
+            'skipped': self.frames_skipped,
+            'queued': self.frames.qsize() if self.frames is not None else 0,
+            'buffers': self.buffers_allocated,
+        }
@@ -0,0 +1,408 @@
+import glob
+import multiprocessing
+import os
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+# URL schemes decoded by a StreamSource worker process
+STREAM_SCHEMES = ('rtsp://', 'rtsps://', 'rtmp://', 'http://', 'https://', 'udp://', 'tcp://', 'file://')
+
+# Image files served by a ReplaySource reading a directory or glob pattern
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# Layout of the shared state array
+_SEQ, _HEIGHT, _WIDTH, _CHANNELS, _CONNECTED, _RECONNECTS, _LAST_RECONNECT_MS, _FAILED_ATTEMPTS, _FPS = range(9)
+_STATE_SIZE = 9
+
+
+def is_stream_url(source):
+    source = str(source)
+    return source.lower().startswith(STREAM_SCHEMES) or ' ! ' in source
+
+
+def _stream_worker(url, api, shm_name, state, lock, new_frame, stop, backoff_initial, backoff_max):
+    # Runs in its own process so a hanging or crashing decoder never takes down detection
+    shm = shared_memory.SharedMemory(name=shm_name)
+    delay = backoff_initial
+    disconnected_at = time.monotonic()
+
+    try:
+        while not stop.is_set():
+            cap = cv2.VideoCapture(url, api)
+            if not cap.isOpened():
+                cap.release()
+                with lock:
+                    state[_FAILED_ATTEMPTS] += 1
+                stop.wait(delay)
+                delay = min(delay * 2, backoff_max)
+                continue
+
+            with lock:
+                state[_FPS] = cap.get(cv2.CAP_PROP_FPS) or 0.0
+
+            connected = False
+            while not stop.is_set():
+                ret, frame = cap.read()
+                if not ret:
+                    break
+
+                if frame.nbytes > shm.size:
+                    # Larger than the shared buffer, keep the aspect ratio and shrink it
+                    scale = (shm.size / float(frame.nbytes)) ** 0.5
+                    frame = cv2.resize(frame, (int(frame.shape[1] * scale), int(frame.shape[0] * scale)))
+
+                with lock:
+                    if not connected:
+                        connected = True
+                        delay = backoff_initial
+                        state[_CONNECTED] = 1
+                        if state[_SEQ] > 0:
+                            state[_RECONNECTS] += 1
+                            state[_LAST_RECONNECT_MS] = (time.monotonic() - disconnected_at) * 1000.0
+                    view = np.ndarray(frame.shape, dtype=np.uint8, buffer=shm.buf)
+                    np.copyto(view, frame)
+                    del view
+                    state[_HEIGHT], state[_WIDTH] = frame.shape[:2]
+                    state[_CHANNELS] = frame.shape[2] if frame.ndim == 3 else 1
+                    state[_SEQ] += 1
+                new_frame.set()
+
+            cap.release()
+            if connected:
+                disconnected_at = time.monotonic()
+                with lock:
+                    state[_CONNECTED] = 0
+            if not stop.is_set():
+                stop.wait(delay)
+                delay = min(delay * 2, backoff_max)
+    finally:
+        shm.close()
+
+
+class StreamSource:
+    # cv2.VideoCapture-like reader for network streams (RTSP/HTTP/...) and GStreamer pipelines.
+    # Frames are decoded in a separate process and handed over through shared memory. The
+    # worker reconnects with exponential backoff and is restarted if it dies, so read() only
+    # ever waits for the next frame and never fails while the source is open. release() from
+    # another thread wakes a read() that is waiting, which then returns (False, None).
+    def __init__(self, url, max_frame_size=(3840, 2160), backoff_initial=0.5, backoff_max=10.0,
+                 read_timeout=None):
+        self.url = url
+        if url.lower().startswith('file://'):
+            # Local file replay: reopening at EOF exercises the reconnect path
+            self.worker_url, self.api = url[len('file://'):], cv2.CAP_ANY
+        elif ' ! ' in url:
+            self.worker_url, self.api = url, cv2.CAP_GSTREAMER
+        else:
+            self.worker_url, self.api = url, cv2.CAP_FFMPEG
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.read_timeout = read_timeout
+
+        # spawn works the same everywhere and avoids forking a process that runs Tk threads
+        self.ctx = multiprocessing.get_context('spawn')
+        self.shm = shared_memory.SharedMemory(create=True, size=max_frame_size[0] * max_frame_size[1] * 3)
+        self.state = self.ctx.RawArray('d', _STATE_SIZE)
+        self.lock = self.ctx.Lock()
+        self.new_frame = self.ctx.Event()
+        self.stop_event = self.ctx.Event()
+        self.process = None
+        self.last_seq = 0
+        self.worker_restarts = 0
+        self.opened = True
+        self._start_worker()
+
+    def _start_worker(self):
+        self.process = self.ctx.Process(
+            target=_stream_worker,
+            args=(self.worker_url, self.api, self.shm.name, self.state, self.lock, self.new_frame,
+                  self.stop_event, self.backoff_initial, self.backoff_max),
+            daemon=True)
+        self.process.start()
+
+    def isOpened(self):
+        return self.opened
+
+    def read(self, image=None):
+        start = time.monotonic()
+        while self.opened:
+            self.new_frame.clear()
+            with self.lock:
+                if self.opened and self.state[_SEQ] > self.last_seq:
+                    self.last_seq = self.state[_SEQ]
+                    h, w = int(self.state[_HEIGHT]), int(self.state[_WIDTH])
+                    c = int(self.state[_CHANNELS])
+                    shape = (h, w, c) if c > 1 else (h, w)
+                    if image is None or image.shape != shape or image.dtype != np.uint8:
+                        image = np.empty(shape, dtype=np.uint8)
+                    np.copyto(image, np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf))
+                    return True, image
+
+            # Restart a worker that crashed inside the decoder
+            if not self.process.is_alive() and not self.stop_event.is_set():
+                self.worker_restarts += 1
+                self._start_worker()
+
+            if self.read_timeout is not None and time.monotonic() - start >= self.read_timeout:
+                return False, None
+            self.new_frame.wait(0.1)
+        return False, None
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.state[_WIDTH]
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.state[_HEIGHT]
+        if prop == cv2.CAP_PROP_FPS:
+            return self.state[_FPS]
+        return 0.0
+
+    def set(self, prop, value):
+        return False
+
+    def stats(self):
+        return {
+            'url': self.url,
+            'connected': bool(self.state[_CONNECTED]),
+            'frames': int(self.state[_SEQ]),
+            'reconnects': int(self.state[_RECONNECTS]),
+            'last_reconnect_ms': self.state[_LAST_RECONNECT_MS],
+            'failed_attempts': int(self.state[_FAILED_ATTEMPTS]),
+            'worker_restarts': self.worker_restarts,
+        }
+
+    def release(self):
+        if not self.opened:
+            return
+        self.opened = False
+        self.stop_event.set()
+        self.new_frame.set()
+        self.process.join(timeout=2.0)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        # Wait for a read() in another thread to finish copying; a terminated worker may
+        # have died holding the lock
+        locked = self.lock.acquire(timeout=1.0)
+        self.shm.close()
+        self.shm.unlink()
+        if locked:
+            self.lock.release()
+
+
+def load_timestamps(path):
+    # One timestamp in seconds per line; CSV files use the first column and header lines are skipped
+    timestamps = []
+    with open(path) as f:
+        for line in f:
+            field = line.split(',')[0].strip()
+            if not field or field.startswith('#'):
+                continue
+            try:
+                timestamps.append(float(field))
+            except ValueError:
+                continue
+    return timestamps
+
+
+class ReplaySource:
+    # cv2.VideoCapture-like camera emulation from a video file, a directory of images or a glob
+    # pattern. Frames are served in order at the recorded timestamps or a fixed frame rate
+    # (realtime=True), or as fast as the caller reads them (realtime=False). Every frame is served
+    # unless drop_late is set, in which case a slow reader skips frames like it would on a camera.
+    def __init__(self, path, fps=None, realtime=True, loop=False, timestamps=None, drop_late=False):
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        self.drop_late = drop_late
+
+        self.files = None
+        self.cap = None
+        if os.path.isdir(path):
+            self.files = sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if name.lower().endswith(IMAGE_EXTENSIONS))
+        elif any(c in path for c in '*?['):
+            self.files = sorted(glob.glob(path))
+        else:
+            self.cap = cv2.VideoCapture(path)
+
+        if self.files is not None:
+            self.frame_count = len(self.files)
+            source_fps = 0.0
+        else:
+            self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT)) if self.cap.isOpened() else 0
+            source_fps = self.cap.get(cv2.CAP_PROP_FPS) if self.cap.isOpened() else 0.0
+        self.fps = fps or source_fps or 30.0
+
+        self.timestamps = load_timestamps(timestamps) if timestamps else None
+        if self.timestamps:
+            self.timestamps = [t - self.timestamps[0] for t in self.timestamps]
+
+        self.width = 0
+        self.height = 0
+        if self.files:
+            first = cv2.imread(self.files[0])
+            if first is not None:
+                self.height, self.width = first.shape[:2]
+        elif self.cap is not None and self.cap.isOpened():
+            self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+        self.opened = bool(self.files) or (self.cap is not None and self.cap.isOpened())
+        self.position = 0
+        self.loops = 0
+        self.start_time = None
+        self.current_time = 0.0
+
+        # Metrics
+        self.frames_served = 0
+        self.frames_dropped = 0
+        self.late_frames = 0
+        self.total_lateness = 0.0
+
+    def _frame_time(self, index):
+        # Seconds from the start of the replay at which frame index is due
+        if self.timestamps and index < len(self.timestamps):
+            return self.timestamps[index]
+        if self.timestamps:
+            # Past the end of the recorded timestamps, continue at the nominal rate
+            return self.timestamps[-1] + (index - len(self.timestamps) + 1) / self.fps
+        return index / self.fps
+
+    def _loop_duration(self):
+        return self._frame_time(self.frame_count - 1) + 1.0 / self.fps if self.frame_count else 0.0
+
+    def _read_frame(self, image):
+        if self.files is not None:
+            if self.position >= len(self.files):
+                return False, None
+            frame = cv2.imread(self.files[self.position])
+            if frame is None:
+                return False, None
+            if image is not None and image.shape == frame.shape and image.dtype == frame.dtype:
+                np.copyto(image, frame)
+                return True, image
+            return True, frame
+        return self.cap.read(image) if image is not None else self.cap.read()
+
+    def _skip_frame(self):
+        if self.files is None:
+            self.cap.grab()
+
+    def _rewind(self):
+        self.loops += 1
+        self.position = 0
+        if self.cap is not None:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def isOpened(self):
+        return self.opened
+
+    def read(self, image=None):
+        if not self.opened:
+            return False, None
+
+        if self.position >= self.frame_count > 0:
+            if not self.loop:
+                return False, None
+            self._rewind()
+
+        due = self.loops * self._loop_duration() + self._frame_time(self.position)
+        if self.realtime:
+            now = time.perf_counter()
+            if self.start_time is None:
+                self.start_time = now
+            wait = self.start_time + due - now
+            if wait > 0:
+                time.sleep(wait)
+            elif self.drop_late:
+                # Skip frames that a camera would already have replaced
+                loop_start = self.start_time + self.loops * self._loop_duration()
+                while (self.position + 1 < self.frame_count
+                       and loop_start + self._frame_time(self.position + 1) <= now):
+                    self._skip_frame()
+                    self.position += 1
+                    self.frames_dropped += 1
+                due = self.loops * self._loop_duration() + self._frame_time(self.position)
+            if wait < 0:
+                self.late_frames += 1
+                self.total_lateness -= wait
+
+        ret, frame = self._read_frame(image)
+        if not ret:
+            if self.loop and self.position > 0:
+                # Frame count was wrong for this file, restart from the first frame
+                self.frame_count = self.position
+                self._rewind()
+                return self.read(image)
+            return False, None
+
+        self.current_time = due
+        self.position += 1
+        self.frames_served += 1
+        return True, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return self.frame_count
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.position
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return self.current_time * 1000.0
+        return 0.0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self.position = max(0, min(int(value), self.frame_count))
+            if self.cap is not None:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.position)
+            # Restart the clock so the new position is served now
+            self.loops = 0
+            self.start_time = time.perf_counter() - self._frame_time(self.position)
+            return True
+        return False
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'frames': self.frames_served,
+            'dropped': self.frames_dropped,
+            'late': self.late_frames,
+            'mean_lateness_ms': self.total_lateness / self.late_frames * 1000.0 if self.late_frames else 0.0,
+            'loops': self.loops,
+        }
+
+    def release(self):
+        self.opened = False
+        if self.cap is not None:
+            self.cap.release()
+
+
+def open_video_source(source=None):
+    # Opens a camera index, video file, image sequence, stream URL or GStreamer pipeline.
+    # Defaults to FACE_DETECT_SOURCE, or camera 0. Files and image sequences are replayed
+    # like a camera, see the FACE_DETECT_REPLAY_* variables.
+    if source is None:
+        source = os.environ.get("FACE_DETECT_SOURCE", "0")
+    if isinstance(source, int) or str(source).isdigit():
+        return cv2.VideoCapture(int(source))
+    if is_stream_url(source):
+        return StreamSource(source)
+    if os.path.exists(source) or any(c in source for c in '*?['):
+        return ReplaySource(
+            source,
+            fps=float(os.environ.get("FACE_DETECT_REPLAY_FPS", 0)) or None,
+            realtime=os.environ.get("FACE_DETECT_REPLAY_MODE", "realtime") != "fast",
+            loop=os.environ.get("FACE_DETECT_REPLAY_LOOP", "0") == "1",
+            timestamps=os.environ.get("FACE_DETECT_REPLAY_TIMESTAMPS") or None,
+            drop_late=os.environ.get("FACE_DETECT_REPLAY_DROP_LATE", "0") == "1")
+    return cv2.VideoCapture(source)